@@ -0,0 +1,260 @@
+#!/bin/python
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+from data import Data
+from data_node import DataNode
+from data_controller import DataNodeController
+from data_serializer import DataEncoder, DataDecoder, DataBinaryEncoder, DataBinaryDecoder
+
+# shapes of the generated trees
+WIDE = "wide"
+DEEP = "deep"
+BALANCED = "balanced"
+RANDOM = "random"
+SHAPES = (WIDE, DEEP, BALANCED, RANDOM)
+# count of the children of each node in balanced tree
+BALANCED_BRANCHING = 4
+DEFAULT_SIZES = (1000, 10000, 100000)
+# part of the nodes changed by change set
+DEFAULT_DENSITIES = (0.01, 0.1, 1.0)
+DEFAULT_REPEAT = 3
+# result is reported as regression when it is slower than baseline by that ratio
+DEFAULT_THRESHOLD = 1.25
+# format of the results file
+_FORMAT = 1
+
+
+def generate_tree(shape: str, size: int, seed=0) -> List[Data]:
+    """
+    Generates Data of the tree, parents are placed before children.
+    Ids are 1..size, so trees of the same shape and size are equal between runs.
+    :param shape: WIDE (all nodes are children of the root), DEEP (chain),
+                  BALANCED (BALANCED_BRANCHING children of each node) or RANDOM (parent is any previous node)
+    :param size: count of the nodes
+    :param seed: seed of the random shape
+    :return: list of Data, the first one is the root
+    """
+    generator = random.Random(seed)
+    if shape == WIDE:
+        parent_of = lambda id_: 1
+    elif shape == DEEP:
+        parent_of = lambda id_: id_ - 1
+    elif shape == BALANCED:
+        parent_of = lambda id_: (id_ - 2) // BALANCED_BRANCHING + 1
+    elif shape == RANDOM:
+        parent_of = lambda id_: generator.randint(1, id_ - 1)
+    else:
+        raise ValueError("unknown tree shape {}".format(shape))
+
+    data_list = [Data("Node1", id_=1)]
+    data_list.extend(Data("Node{}".format(id_), parent_of(id_), id_) for id_ in range(2, size + 1))
+    return data_list
+
+
+def generate_changes(data_list: List[Data], density: float, seed=0) -> List[Data]:
+    """
+    Generates change set of the tree: part of the nodes receive new value,
+    tenth part of the changes are new nodes appended to random parents.
+    :param data_list: Data of the tree
+    :param density: part of the changed nodes, from 0 to 1
+    :param seed: seed of the changed nodes selection
+    :return: list of Data
+    """
+    generator = random.Random(seed)
+    count = int(len(data_list) * density)
+    changes = [Data("Changed", data.get_parent_id(), data.get_id())
+               for data in generator.sample(data_list, count)]
+    first_id = len(data_list) + 1
+    changes.extend(Data("New", generator.choice(data_list).get_id(), id_)
+                   for id_ in range(first_id, first_id + count // 10))
+    return changes
+
+
+def _copy(data_list: List[Data]) -> List[Data]:
+    """
+    Copies Data, so each measured run receives not changed Data.
+    :param data_list: list of Data
+    :return: list of Data copies
+    """
+    return [Data(data.get_value(), data.get_parent_id(), data.get_id()) for data in data_list]
+
+
+def _build(data_list: List[Data]):
+    """
+    Builds tree managed by new controller.
+    :param data_list: Data of the tree
+    :return: controller and list of the root nodes
+    """
+    controller = DataNodeController()
+    nodes = controller.create_node_hierarchy(_copy(data_list))
+    return controller, [node for node in nodes if node.is_orphan_node()]
+
+
+def _measure(prepare: Callable, run: Callable, repeat: int) -> float:
+    """
+    Measures the best time of the run.
+    :param prepare: callable creating arguments of the run, not measured
+    :param run: measured callable receiving arguments created by prepare
+    :param repeat: count of the runs
+    :return: the best time in seconds
+    """
+    best = None
+    for _ in range(repeat):
+        arguments = prepare()
+        start = time.perf_counter()
+        run(*arguments)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_benchmarks(shapes=SHAPES, sizes=DEFAULT_SIZES, densities=DEFAULT_DENSITIES,
+                   repeat=DEFAULT_REPEAT, log: Callable[[str], None] = None) -> Dict[str, float]:
+    """
+    Measures controller operations on the generated trees.
+    :param shapes: shapes of the trees
+    :param sizes: counts of the nodes of the trees
+    :param densities: densities of the change sets
+    :param repeat: count of the runs of each measure, the best time is taken
+    :param log: callable receiving name and time of each finished measure
+    :return: dict with name of the measure -> time in seconds,
+             name is operation/shape/size or operation/shape/size/density
+    """
+    results = {}
+
+    def record(name: str, seconds: float) -> None:
+        results[name] = seconds
+        if log is not None:
+            log("{:<60} {:10.6f}s".format(name, seconds))
+
+    encoder = DataEncoder()
+    decoder = DataDecoder()
+    binary_encoder = DataBinaryEncoder()
+    binary_decoder = DataBinaryDecoder()
+    for shape in shapes:
+        for size in sizes:
+            data_list = generate_tree(shape, size)
+            key = "{}/{}".format(shape, size)
+
+            record("create_node_hierarchy/" + key,
+                   _measure(lambda: (DataNodeController(), _copy(data_list)),
+                            lambda controller, copies: controller.create_node_hierarchy(copies), repeat))
+            record("update_node_hierarchy/" + key,
+                   _measure(lambda: (DataNodeController(), [DataNode(instance=data) for data in _copy(data_list)]),
+                            lambda controller, nodes: controller.update_node_hierarchy(nodes, remove_from_list=True),
+                            repeat))
+            for density in densities:
+                changes = generate_changes(data_list, density)
+                record("update_node_list_with_data_list/{}/{}".format(key, density),
+                       _measure(lambda: _build(data_list) + (_copy(changes),),
+                                lambda controller, nodes, copies:
+                                    controller.update_node_list_with_data_list(nodes, copies), repeat))
+
+            controller, nodes = _build(data_list)
+            record("node_list_to_json/" + key,
+                   _measure(lambda: (), lambda: controller.node_list_to_json(encoder, nodes), repeat))
+            encoded = controller.node_list_to_json(encoder, nodes)
+            record("json_decode/" + key, _measure(lambda: (), lambda: decoder.decode(encoded), repeat))
+            copies = _copy(data_list)
+            record("binary_encode/" + key,
+                   _measure(lambda: (), lambda: binary_encoder.encode(copies), repeat))
+            binary = binary_encoder.encode(copies)
+            record("binary_decode/" + key, _measure(lambda: (), lambda: binary_decoder.decode(binary), repeat))
+            record("disable_subtree/" + key,
+                   _measure(lambda: _build(data_list), lambda controller, nodes: controller.disable_node(nodes[0]),
+                            repeat))
+    return results
+
+
+def save_results(path: str, results: Dict[str, float]) -> None:
+    """
+    Writes results to the JSON file, which can be used as baseline of the next runs.
+    :param path: path to the file
+    :param results: dict with name of the measure -> time in seconds
+    :return: None
+    """
+    with open(path, "w") as file:
+        json.dump({"format": _FORMAT,
+                   "python": platform.python_version(),
+                   "machine": platform.machine(),
+                   "results": results}, file, indent=2, sort_keys=True)
+
+
+def load_results(path: str) -> Dict[str, float]:
+    """
+    Reads results written by save_results.
+    :exception ValueError: raised when file has unknown format
+    :param path: path to the file
+    :return: dict with name of the measure -> time in seconds
+    """
+    with open(path) as file:
+        content = json.load(file)
+    if content.get("format") != _FORMAT:
+        raise ValueError("unknown format of the results file {}".format(path))
+    return content["results"]
+
+
+def compare_results(results: Dict[str, float], baseline: Dict[str, float],
+                    threshold=DEFAULT_THRESHOLD) -> Dict[str, Optional[float]]:
+    """
+    Compares results with baseline.
+    :param results: dict with name of the measure -> time in seconds
+    :param baseline: results of the baseline run
+    :param threshold: ratio of the times over which measure is regression
+    :return: dict with name of the measure -> ratio of the time to baseline time
+             (None if baseline has no such measure), only regressions when threshold is not None
+    """
+    ratios = {}
+    for name, seconds in results.items():
+        base = baseline.get(name)
+        ratio = seconds / base if base else None
+        if threshold is None or (ratio is not None and ratio > threshold):
+            ratios[name] = ratio
+    return ratios
+
+
+def main(arguments: List[str]) -> int:
+    """
+    Runs benchmarks from command line.
+    :param arguments: command line arguments
+    :return: exit code, 1 if there are regressions against baseline
+    """
+    parser = argparse.ArgumentParser(description="Benchmarks of the controller operations on generated trees")
+    parser.add_argument("--shapes", nargs="+", choices=SHAPES, default=SHAPES)
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES,
+                        help="counts of the nodes, e.g. 1000 10000 100000 1000000")
+    parser.add_argument("--densities", nargs="+", type=float, default=DEFAULT_DENSITIES,
+                        help="parts of the nodes changed by change sets")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--output", default="benchmark.json", help="file for the results")
+    parser.add_argument("--baseline", help="results file of the previous run for comparison")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="slowdown ratio reported as regression")
+    options = parser.parse_args(arguments)
+
+    results = run_benchmarks(options.shapes, options.sizes, options.densities, options.repeat, log=print)
+    save_results(options.output, results)
+    if options.baseline is None:
+        return 0
+
+    baseline = load_results(options.baseline)
+    print()
+    for name, ratio in compare_results(results, baseline, None).items():
+        print("{:<60} {}".format(name, "new" if ratio is None else "{:.2f}x".format(ratio)))
+    regressions = compare_results(results, baseline, options.threshold)
+    if regressions:
+        print("\n{} regressions slower than {:.2f}x of baseline".format(len(regressions), options.threshold))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
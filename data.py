@@ -1,29 +1,92 @@
 #!/bin/python
 # -*- coding: utf-8 -*-
 
-import uuid
+import itertools
+
+from id_generator import IdGenerator, SnowflakeIdGenerator
+
+# generator of the ids for new Data
+_id_generator = SnowflakeIdGenerator(0)
+
+
+def set_id_generator(generator: IdGenerator) -> None:
+    """
+    Replaces generator of the ids for new Data.
+    :param generator: new generator
+    :return: None
+    """
+    global _id_generator
+    _id_generator = generator
+
+
+def get_id_generator() -> IdGenerator:
+    """
+    Getter for generator of the ids for new Data.
+    :return: current generator
+    """
+    return _id_generator
+
+# number of the last change of the enabled flags or the nodes hierarchy,
+# inherited enabled state cached by nodes is valid only while number is the same
+_enabled_epochs = itertools.count(1)
+_enabled_epoch = 0
+
+
+def get_enabled_epoch() -> int:
+    """
+    Getter for number of the last change of the enabled flags or the nodes hierarchy.
+    :return: epoch number
+    """
+    return _enabled_epoch
+
+
+def next_enabled_epoch() -> None:
+    """
+    Starts new epoch, so cached inherited enabled states are recalculated.
+    Must be called after any change of the enabled flag or of the nodes parent.
+    :return: None
+    """
+    global _enabled_epoch
+    _enabled_epoch = next(_enabled_epochs)
+
+# flags of the Data changes, combined into bit mask
+VALUE_CHANGED = 1
+ENABLED_CHANGED = 2
+CREATED = 4
 
 
 class Data(object):
     """
     Class for store data.
+    Attributes are stored in slots, so Data has no per-instance dict.
     """
-    def __init__(self, value, parent_id=None, id_=None, enabled=True):
+    __slots__ = ("_parent_id", "_enabled", "_value", "_version", "_id", "_changes")
+
+    def __init__(self, value, parent_id=None, id_=None, enabled=True, version=0):
         """
         Data constructor.
         In minimum case can be set only with value.
         In additional user can set:
             * parent_id. None if root, otherwise id of the parent Data;
+            * id_. When not set, new id taken from id generator and Data marked as created;
+            * enabled. False for deleted Data;
+            * version. Database commit number of the last Data change.
         :param value: stored value;
         :param parent_id: parent id as int.
+        :param id_: id of the existed Data.
+        :param enabled: enabled flag.
+        :param version: commit number.
         """
         self._parent_id = parent_id
         self._enabled = enabled
         self._value = value
+        self._version = version
         if id_ is None:
-            self._id = uuid.uuid4().int
+            self._id = _id_generator.next_id()
+            self._changes = CREATED
         else:
             self._id = id_
+            self._changes = 0
 
     def __eq__(self, other) -> bool:
         if isinstance(other, Data):
@@ -55,6 +118,8 @@ class Data(object):
         :param value: new value
         :return: None
         """
+        if self._value != value:
+            self._changes |= VALUE_CHANGED
         self._value = value
 
     def get_value(self) -> str:
@@ -73,8 +138,8 @@ class Data(object):
 
     def get_id(self) -> int:
         """
-        Getter for Data uuid as int
-        :return: int uuid of the node
+        Getter for Data id as int
+        :return: int id of the node
         """
         return self._id
 
@@ -84,7 +149,10 @@ class Data(object):
         :param value: flag value
         :return: None
         """
-        self._enabled = value
+        if self._enabled != value:
+            self._changes |= ENABLED_CHANGED
+            self._enabled = value
+            next_enabled_epoch()
 
     def is_enabled(self) -> bool:
         """
@@ -100,3 +168,39 @@ class Data(object):
         :return: None
         """
         self._parent_id = parent_id
+
+    def get_version(self) -> int:
+        """
+        Getter for commit number of the last Data change.
+        :return: version, 0 if Data was never committed
+        """
+        return self._version
+
+    def set_version(self, version) -> None:
+        """
+        Setter for commit number of the last Data change.
+        :param version: commit number
+        :return: None
+        """
+        self._version = version
+
+    def get_changes(self) -> int:
+        """
+        Getter for changes made since Data was received or created.
+        :return: bit mask of VALUE_CHANGED, ENABLED_CHANGED, CREATED flags
+        """
+        return self._changes
+
+    def is_changed(self) -> bool:
+        """
+        Checks if Data has changes which are not applied yet.
+        :return: True if any change recorded
+        """
+        return self._changes != 0
+
+    def clear_changes(self) -> None:
+        """
+        Drops recorded changes. Called when changes were applied.
+        :return: None
+        """
+        self._changes = 0
@@ -0,0 +1,291 @@
+#!/bin/python
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+from data import Data, CREATED
+from data_node import DataNode, POST_ORDER
+from data_controller import DataNodeController, NODE_INSERTED
+
+
+class DataCacheController(DataNodeController):
+    """
+    Controller of the cache nodes with limited capacity.
+    Nodes are kept in least-recently-used order, touching node touches all it ancestors,
+    so ancestor is never older than it descendants and the oldest nodes form whole subtrees.
+    When size exceeds capacity after hierarchy update, the oldest subtrees are removed.
+    Subtrees with changed or pinned nodes are never removed.
+    Lookups of the nodes are counted as hits and misses.
+    Cache knows count of the children of each node in database, so children which are not
+    cached yet are loaded with loader on first access, one request for several parents.
+    """
+    def __init__(self, capacity=None, weigher: Callable[[DataNode], int] = None):
+        """
+        DataCacheController constructor.
+        :param capacity: maximal size of the cache, None for unlimited
+        :param weigher: callable returning size of the node, each node has size 1 by default
+        """
+        self._lru = OrderedDict()
+        self._capacity = capacity
+        self._weigher = weigher
+        self._size = 0
+        self._pinned = set()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        # count of the children in database: id -> count
+        self._counts = {}
+        # ids of the nodes which children were loaded from database
+        self._loaded = set()
+        self._loader = None
+        super(DataCacheController, self).__init__()
+        self.add_listener(self._on_node_changed)
+
+    def get_size(self) -> int:
+        """
+        Getter for current size of the cache.
+        :return: size
+        """
+        return self._size
+
+    def get_hits(self) -> int:
+        """
+        Getter for count of the lookups which found node.
+        :return: hits count
+        """
+        return self._hits
+
+    def get_misses(self) -> int:
+        """
+        Getter for count of the lookups which didn't find node.
+        :return: misses count
+        """
+        return self._misses
+
+    def get_evictions(self) -> int:
+        """
+        Getter for count of the nodes removed because of capacity.
+        :return: evictions count
+        """
+        return self._evictions
+
+    def pin(self, node: DataNode) -> None:
+        """
+        Protects node with it ancestors from removal, e.g. while node is in transaction.
+        :param node: pinned node
+        :return: None
+        """
+        self._pinned.add(node.get_id())
+
+    def unpin(self, node: DataNode) -> None:
+        """
+        Drops protection of the node.
+        :param node: pinned node
+        :return: None
+        """
+        self._pinned.discard(node.get_id())
+
+    def set_loader(self, loader: Callable[[List[int]], None]) -> None:
+        """
+        Setter for loader of the children which are not cached yet.
+        Loader receives list of the parent ids, appends their children to the cache
+        and passes database children counts of the appended nodes to set_children_counts.
+        :param loader: callable receiving list of the parent ids, None for disabling
+        :return: None
+        """
+        self._loader = loader
+
+    def set_children_counts(self, data_list: List[Data], counts: List[int]) -> None:
+        """
+        Setter for count of the children of the Data in database.
+        :param data_list: list of Data
+        :param counts: children counts, parallel to data_list
+        :return: None
+        """
+        for data, count in zip(data_list, counts):
+            self._counts[data.get_id()] = count
+
+    def get_children_count(self, node: DataNode) -> int:
+        """
+        Getter for count of the node children, including children which are not cached yet.
+        :param node: cache node
+        :return: children count
+        """
+        if self.is_loaded(node):
+            return len(node.get_children())
+        return len(node.get_children()) - self._database_children_count(node) + self._counts[node.get_id()]
+
+    def is_loaded(self, node: DataNode) -> bool:
+        """
+        Checks if all children of the node in database are cached.
+        Children created in cache are not counted, they are not in database yet.
+        :param node: cache node
+        :return: True if node has no children to load
+        """
+        count = self._counts.get(node.get_id(), 0)
+        if count == 0 or node.get_id() in self._loaded:
+            return True
+        return self._database_children_count(node) >= count
+
+    @staticmethod
+    def _database_children_count(node: DataNode) -> int:
+        """
+        Counts cached children received from database.
+        :param node: cache node
+        :return: count of the children which were not created in cache
+        """
+        return sum(1 for child in node.get_children() if not child.get_changes() & CREATED)
+
+    def load_children(self, nodes: List[DataNode]) -> None:
+        """
+        Loads children of the nodes which are not cached yet with single loader call.
+        Nodes are marked as loaded even if database returned less children,
+        so they are not loaded again until their child is removed.
+        :param nodes: cache nodes
+        :return: None
+        """
+        nodes = [node for node in nodes if not self.is_loaded(node)]
+        if not nodes or self._loader is None:
+            return
+
+        self._loader([node.get_id() for node in nodes])
+        self._loaded.update(node.get_id() for node in nodes)
+
+    def touch(self, node: DataNode) -> None:
+        """
+        Marks node with it ancestors as recently used.
+        :param node: used node
+        :return: None
+        """
+        lru = self._lru
+        while node is not None:
+            if node.get_id() in lru:
+                lru.move_to_end(node.get_id())
+            node = node.get_parent_node()
+
+    def _on_node_changed(self, kind: int, node: DataNode) -> None:
+        """
+        Handler of the own notifications, adopted node is touched with new ancestors.
+        :param kind: kind of the change
+        :param node: changed node
+        :return: None
+        """
+        if kind == NODE_INSERTED:
+            self.touch(node)
+
+    def _weight(self, node: DataNode) -> int:
+        return self._weigher(node) if self._weigher is not None else 1
+
+    def get_node(self, id_: int) -> Optional[DataNode]:
+        node = super(DataCacheController, self).get_node(id_)
+        if node is None:
+            self._misses += 1
+        else:
+            self._hits += 1
+            self.touch(node)
+        return node
+
+    def node_list_has_data(self, node_list: List[DataNode], data: Data) -> bool:
+        return self.get_node(data.get_id()) is not None
+
+    def append_data_list(self, nodes_list: List[DataNode], data_list) -> int:
+        data_list = list(data_list)
+        for data in data_list:
+            self.get_node(data.get_id())
+        return super(DataCacheController, self).append_data_list(nodes_list, data_list)
+
+    def set_node_value(self, node: DataNode, value) -> None:
+        self.touch(node)
+        super(DataCacheController, self).set_node_value(node, value)
+
+    def disable_node(self, node: DataNode) -> None:
+        self.touch(node)
+        super(DataCacheController, self).disable_node(node)
+
+    def index_node(self, node: DataNode) -> None:
+        """
+        Appends node with all it children to the index, children are older than parents.
+        :param node: indexed node
+        :return: None
+        """
+        super(DataCacheController, self).index_node(node)
+        for current in node.walk(POST_ORDER):
+            if current.get_id() not in self._lru:
+                self._size += self._weight(current)
+            self._lru[current.get_id()] = current
+            self._lru.move_to_end(current.get_id())
+        self.touch(node)
+
+    def create_node_hierarchy(self, data_list: List[Data]) -> DataNode:
+        nodes = super(DataCacheController, self).create_node_hierarchy(data_list)
+        for node in nodes:
+            if node.is_orphan_node():
+                self.index_node(node)
+        return nodes
+
+    def rebuild_index(self, nodes_list: List[DataNode]) -> None:
+        self._lru = OrderedDict()
+        self._size = 0
+        super(DataCacheController, self).rebuild_index(nodes_list)
+
+    def update_node_hierarchy(self, nodes_list: List[DataNode], remove_from_list=False) -> None:
+        """
+        Updates hierarchy, then removes the oldest subtrees if size exceeds capacity.
+        :param nodes_list: nodes for update
+        :param remove_from_list: flag for removing from list ex-orphans
+        :return: None
+        """
+        super(DataCacheController, self).update_node_hierarchy(nodes_list, remove_from_list)
+        if remove_from_list:
+            self.evict(nodes_list)
+
+    def remove_node(self, nodes_list: List[DataNode], node: DataNode) -> None:
+        super(DataCacheController, self).remove_node(nodes_list, node)
+        # removed node keeps reference to the parent
+        if node.get_parent_node() is not None:
+            self._loaded.discard(node.get_parent_node().get_id())
+        for current in node.walk():
+            self._counts.pop(current.get_id(), None)
+            self._loaded.discard(current.get_id())
+            if self._lru.pop(current.get_id(), None) is not None:
+                self._size -= self._weight(current)
+
+    def evict(self, nodes_list: List[DataNode]) -> int:
+        """
+        Removes the oldest subtrees until size fits capacity.
+        Nodes are taken from the oldest, changed or pinned node blocks it ancestors,
+        so only subtrees without blocked nodes are removed.
+        :param nodes_list: list of the cache root nodes
+        :return: count of the removed nodes
+        """
+        if self._capacity is None or self._size <= self._capacity:
+            return 0
+
+        excess = self._size - self._capacity
+        blocked = set()
+        evicted = set()
+        for id_, node in self._lru.items():
+            if excess <= 0:
+                break
+            if id_ in blocked or id_ in self._pinned or node.is_changed():
+                parent = node.get_parent_node()
+                if parent is not None:
+                    blocked.add(parent.get_id())
+                continue
+            evicted.add(id_)
+            excess -= self._weight(node)
+
+        count = 0
+        for id_ in evicted:
+            node = self._lru.get(id_)
+            if node is None:
+                continue
+            parent = node.get_parent_node()
+            if parent is not None and parent.get_id() in evicted:
+                continue
+            size = len(self._lru)
+            self.remove_node(nodes_list, node)
+            count += size - len(self._lru)
+        self._evictions += count
+        return count
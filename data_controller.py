@@ -1,74 +1,282 @@
 #!/bin/python
 # -*- coding: utf-8 -*-
 
+from bisect import bisect_right
+from itertools import islice
 from data import Data
-from data_node import DataNode
-from data_serializer import DataEncoder, DataDecoder
-from typing import List
+from data_node import DataNode, BREADTH_FIRST
+from data_serializer import DataEncoder, DataDecoder, DataBinaryEncoder
+from typing import Callable, Iterator, List, Optional, Tuple
+
+# kinds of the nodes changes notifications
+NODE_VALUE_CHANGED = 1
+NODE_ENABLED_CHANGED = 2
+# node appended to the children of it parent node or to the roots if it has no parent
+NODE_INSERTED = 3
+# node with it subtree is going to be removed from it parent or from the roots, and was removed
+NODE_ABOUT_TO_BE_REMOVED = 4
+NODE_REMOVED = 5
 
 
 class DataNodeController(object):
     """
-    Controlling class for DataNodes
+    Controlling class for DataNodes.
+    Controller owns index of the managed nodes (id -> DataNode),
+    so searching node by id doesn't require walking through the trees.
+    Each managed tree (database, cache) must have own controller.
+    Controller also keeps log of the committed changes,
+    so other trees can be synchronized with changes since known version.
+    Changes of the nodes made through controller are notified to the listeners.
     """
+    def __init__(self):
+        """
+        DataNodeController constructor.
+        Creates empty nodes index and change log.
+        """
+        self._index = {}
+        self._version = 0
+        # parallel lists: commit number and ids of the Data changed by that commit
+        self._log_versions = []
+        self._log_ids = []
+        # the first version which commits are in the change log
+        self._log_start = 0
+        self._listeners = []
+        self._intervals = None
+
+    def add_listener(self, listener: Callable[[int, DataNode], None]) -> None:
+        """
+        Subscribes listener to the nodes changes.
+        Listener receives kind of the change (NODE_VALUE_CHANGED, NODE_ENABLED_CHANGED, NODE_INSERTED,
+        NODE_ABOUT_TO_BE_REMOVED, NODE_REMOVED) and changed node.
+        :param listener: callable receiving kind and node
+        :return: None
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[int, DataNode], None]) -> None:
+        """
+        Unsubscribes listener from the nodes changes.
+        :param listener: subscribed callable
+        :return: None
+        """
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _notify(self, kind: int, node: DataNode) -> None:
+        """
+        Sends notification about node change to the listeners.
+        :param kind: kind of the change
+        :param node: changed node
+        :return: None
+        """
+        for listener in self._listeners:
+            listener(kind, node)
+
+    def set_node_value(self, node: DataNode, value) -> None:
+        """
+        Sets value of the managed node with notification.
+        :param node: changed node
+        :param value: new value
+        :return: None
+        """
+        node.set_value(value)
+        self._notify(NODE_VALUE_CHANGED, node)
+
+    def disable_node(self, node: DataNode) -> None:
+        """
+        Disables managed node with all it children with notification.
+        Only node is marked, children inherit disabled state.
+        :param node: disabled node
+        :return: None
+        """
+        node.set_enabled(False, lazy=True)
+        self._notify(NODE_ENABLED_CHANGED, node)
+
+    def remove_node(self, nodes_list: List[DataNode], node: DataNode) -> None:
+        """
+        Removes managed node with all it children from the tree and from the index.
+        Removed node keeps reference to the parent.
+        :param nodes_list: list of the root nodes
+        :param node: removed node
+        :return: None
+        """
+        self._notify(NODE_ABOUT_TO_BE_REMOVED, node)
+        parent = node.get_parent_node()
+        if parent is None:
+            for row, current in enumerate(nodes_list):
+                if current is node:
+                    del nodes_list[row]
+                    break
+        else:
+            parent.remove_child(node)
+        for current in node.walk():
+            self._index.pop(current.get_id(), None)
+        self._notify(NODE_REMOVED, node)
+
+    def get_children_count(self, node: DataNode) -> int:
+        """
+        Getter for count of the node children, including children which are not loaded yet.
+        :param node: managed node
+        :return: children count
+        """
+        return len(node.get_children())
+
+    def load_children(self, nodes: List[DataNode]) -> None:
+        """
+        Loads children of the nodes which are not loaded yet.
+        All nodes of that controller are loaded, so nothing is done.
+        :param nodes: managed nodes
+        :return: None
+        """
+
+    def get_node(self, id_: int) -> Optional[DataNode]:
+        """
+        Searches managed node by id.
+        :param id_: id of the searched node
+        :return: DataNode if it is managed by controller, otherwise None
+        """
+        return self._index.get(id_)
+
+    def set_intervals(self, intervals) -> None:
+        """
+        Setter for interval labeling of the managed nodes, used for constant-time ancestry checks.
+        Labeling is rebuilt with the index.
+        :param intervals: DataIntervalIndex, None for disabling
+        :return: None
+        """
+        self._intervals = intervals
+
+    def get_intervals(self):
+        """
+        Getter for interval labeling of the managed nodes.
+        :return: DataIntervalIndex, None if not set
+        """
+        return self._intervals
+
+    def get_index(self) -> dict:
+        """
+        Getter for nodes index.
+        :return: dict with id -> DataNode pairs
+        """
+        return self._index
+
+    def index_node(self, node: DataNode) -> None:
+        """
+        Appends node with all it children to the index.
+        :param node: indexed node
+        :return: None
+        """
+        for current in node.walk():
+            self._index[current.get_id()] = current
+
+    def rebuild_index(self, nodes_list: List[DataNode]) -> None:
+        """
+        Drops current index with change log and indexes all nodes from the list.
+        Must be called when managed nodes were created outside of the controller.
+        :param nodes_list: list of managed nodes
+        :return: None
+        """
+        self._index = {}
+        self._version = 0
+        self._log_versions = []
+        self._log_ids = []
+        self._log_start = 0
+        for node in nodes_list:
+            self.index_node(node)
+        if self._intervals is not None:
+            self._intervals.rebuild(nodes_list)
+
     def create_node_hierarchy(self, data_list: List[Data]) -> DataNode:
         """
         Creates node based on list of Data.
-        First
+        First all nodes are created and indexed by id in one pass,
+        then each node is linked to it parent with index lookup,
+        so building takes linear time of the list size.
         :param data_list: list of Data
         :return: list of DataNode
         """
         nodes = []
         for data in data_list:
-            nodes.append(DataNode(instance=data))
+            node = DataNode(instance=data)
+            self._index[node.get_id()] = node
+            nodes.append(node)
 
         self.update_node_hierarchy(nodes)
+        if self._intervals is not None:
+            # nodes were indexed without notifications, so trees left without parent are labeled here
+            self._intervals.append([node for node in nodes if node.get_parent_node() is None])
         return nodes
 
     def update_node_hierarchy(self,
                               nodes_list: List[DataNode],
                               remove_from_list=False) -> None:
         """
-        Updates nodes in list with references parent-child type
+        Updates nodes in list with references parent-child type.
+        Each orphan node is linked with it parent found in the index,
+        if parent disabled, adopted node will be disabled too.
+        Linked nodes and new nodes left without parent are notified as inserted.
         :param nodes_list: nodes for update
         :param remove_from_list: flag for removing from list ex-orphans
         :return: None
         """
         try:
-            i = 0
-            while i < len(nodes_list):
-                node = nodes_list[i]
+            new_nodes = []
+            for node in nodes_list:
+                if node.get_id() not in self._index:
+                    self.index_node(node)
+                    new_nodes.append(node)
+
+            disabled = set()
+            remaining = []
+            for node in nodes_list:
+                if node.is_orphan_node() and self._search_parent(node, disabled) and remove_from_list:
+                    continue
+                remaining.append(node)
+
+            if remove_from_list:
+                nodes_list[:] = remaining
+
+            for node in new_nodes:
                 if node.is_orphan_node():
-                    for checked_node in nodes_list:
-                        if self._search_parent(checked_node, node):
-                            if remove_from_list:
-                                nodes_list.remove(node)
-                                i -= 1
-                            break
-                i += 1
+                    self._notify(NODE_INSERTED, node)
         except Exception as e:
             print("exception {} raised".format(e))
 
-    def _search_parent(self, checked_node: DataNode, orphan_node: DataNode) -> bool:
+    def _search_parent(self, orphan_node: DataNode, disabled: set) -> bool:
         """
-        Searches parent for orphan node in node and it children
-        :param checked_node: node for searching parent
+        Searches parent for orphan node in the index and appends node to it
         :param orphan_node: parentless node
+        :param disabled: ids of the nodes already disabled during current hierarchy update
         :return: True if parent found
         """
         if orphan_node.get_parent_node() is not None:
             return True
 
-        if checked_node.get_id() == orphan_node.get_parent_id():
-            checked_node.append_child(orphan_node)
-            if not checked_node.is_enabled():
-                orphan_node.set_enabled(False)
-            return True
+        parent = self._index.get(orphan_node.get_parent_id())
+        if parent is None or parent is orphan_node:
+            return False
+        # parent inside of the orphan subtree would make a cycle
+        if self._intervals is not None and self._intervals.is_ancestor(orphan_node, parent):
+            return False
 
-        for child in checked_node.get_children():
-            if self._search_parent(child, orphan_node):
-                return True
-        return False
+        parent.append_child(orphan_node)
+        if not parent.get_instance().is_enabled():
+            self._disable_subtree(orphan_node, disabled)
+        self._notify(NODE_INSERTED, orphan_node)
+        return True
+
+    def _disable_subtree(self, node: DataNode, disabled: set) -> None:
+        """
+        Disables node with all it children.
+        Subtrees of the nodes which ids are in disabled set are skipped,
+        so each node is visited once during hierarchy update.
+        :param node: root of the disabled subtree
+        :param disabled: ids of the already disabled nodes, updated with visited nodes
+        :return: None
+        """
+        for current in node.walk(filter_=lambda n: n.get_id() not in disabled):
+            disabled.add(current.get_id())
+            current.get_instance().set_enabled(False)
 
     def node_to_data_list(self, node: DataNode) -> List[Data]:
         """
@@ -76,7 +284,7 @@ class DataNodeController(object):
         :param node: DataNode for extracting
         :return: list of Data
         """
-        return self._to_data_list(node, [])
+        return list(self.iter_data([node]))
 
     def node_list_to_data_list(self, nodes: List[DataNode]) -> List[Data]:
         """
@@ -84,90 +292,245 @@ class DataNodeController(object):
         :param nodes: DataNode list for extracting
         :return: list of Data
         """
-        result = []
+        return list(self.iter_data(nodes))
+
+    def iter_data(self, nodes: List[DataNode]) -> Iterator[Data]:
+        """
+        Streams Data from DataNodes list, each tree in pre-order.
+        :param nodes: DataNode list for extracting
+        :return: iterator of Data
+        """
         for node in nodes:
-            result.extend(self.node_to_data_list(node))
-        return result
+            for current in node.walk():
+                yield current.get_instance()
+
+    def iter_subtree_data(self, node: DataNode, max_depth=None, max_count=None) -> Iterator[Data]:
+        """
+        Streams Data of the subtree level by level, so parents are placed before children
+        and subtree can be cut by budget without orphans.
+        :param node: root of the subtree
+        :param max_depth: deepest level, root has level 0. None for whole subtree
+        :param max_count: maximal count of the Data. None for whole subtree
+        :return: iterator of Data
+        """
+        nodes = node.walk(BREADTH_FIRST, max_depth=max_depth)
+        if max_count is not None:
+            nodes = islice(nodes, max_count)
+        for current in nodes:
+            yield current.get_instance()
 
-    def _to_data_list(self, node: DataNode, list_: List[Data]) -> List[Data]:
+    def append_data_list(self, nodes_list: List[DataNode], data_list) -> int:
         """
-        Recursive method for extracting Data from DataNode
-        :param node: node for extracting
-        :param list_: container for extracted Data
-        :return: updated list with extracted Data
+        Appends Data which is not managed yet to the nodes in single pass.
+        Managed nodes are not changed, so their not applied changes are kept.
+        :param nodes_list: list of nodes for appending
+        :param data_list: appended data, any iterable of Data
+        :return: count of the appended Data
         """
-        list_.append(node.get_instance())
-        child_items = []
-        for child in node.get_children():
-            self._to_data_list(child, list_)
-        list_.extend(child_items)
-        return list_
+        new_nodes = [DataNode(instance=data) for data in data_list if data.get_id() not in self._index]
+        if new_nodes:
+            nodes_list.extend(new_nodes)
+            self.update_node_hierarchy(nodes_list, remove_from_list=True)
+        return len(new_nodes)
 
     def node_list_has_data(self, node_list: List[DataNode], data: Data) -> bool:
         """
-        Checks if any node in list has selected data
+        Checks if any node in list has selected data.
+        Lookup is done with the index, so list must be managed by that controller.
         :param node_list: list of DataNodes for checking
         :param data: searched data
         :return: True if Node with selected data present in list
         """
-        for node in node_list:
-            if node.has(data):
-                return True
-        return False
+        return data.get_id() in self._index
+
+    def collect_changes(self, nodes: List[DataNode]) -> List[Data]:
+        """
+        Collects changed Data from DataNodes list.
+        :param nodes: DataNode list for collecting
+        :return: list of Data with recorded changes
+        """
+        return [data for data in self.iter_data(nodes) if data.is_changed()]
 
-    def update_node_list_with_data_list(self, nodes_list, data_list, append_new=True) -> None:
+    def clear_changes(self, data_list: List[Data]) -> None:
+        """
+        Drops recorded changes of Data. Used after changes were applied.
+        :param data_list: list of applied Data
+        :return: None
+        """
+        for data in data_list:
+            data.clear_changes()
+
+    def update_node_list_with_data_list(self, nodes_list, data_list, append_new=True,
+                                        restore_enabled=False) -> None:
         """
         Method for applying update for used nodes.
         Applies value changing, delete effect. Also new elements will be appended to the tree.
+        Update is joined with nodes by id through the index in single pass over data_list,
+        so cost depends on update size, not on the tree size.
         :param nodes_list: list of nodes for updating
-        :param data_list: update data
+        :param data_list: update data, any iterable of Data
         :param append_new: enabled by default, appends new nodes from data_list.
                            Disable when just update required.
+        :param restore_enabled: disabled by default, enables disabled nodes which Data is enabled.
+                                Used by caches synchronized with database state, e.g. after rejected delete
         :return: None
         """
-        # reserving list for removing from it updated elements
-        process_list = data_list[:]
-        for node in nodes_list:
-            self._update_node_with_data_list(node, process_list)
+        # data without node in the index, later element with same id replaces previous
+        new_data = {}
+        for data in data_list:
+            if not self._update_node_with_data(data, restore_enabled) and append_new:
+                new_data[data.get_id()] = data
 
-        if append_new:
-            nodes_list.extend([DataNode(instance=a) for a in process_list])
+        if new_data:
+            nodes_list.extend([DataNode(instance=a) for a in new_data.values()])
             self.update_node_hierarchy(nodes_list, remove_from_list=True)
 
-    def _update_node_with_data_list(self, node: DataNode, data_list: List[Data]) -> None:
-        """
-        Private method providing existed nodes update with passed list of data
-        :param node: node for update
-        :param data_list: list of update data
-        :return: None
-        """
-        i = 0
-        while i < len(data_list):
-            data = data_list[i]
-            if self._update_node_with_data(node, data):
-                data_list.remove(data)
-            else:
-                i += 1
-
-    def _update_node_with_data(self, node: DataNode, data: Data) -> bool:
+    def _update_node_with_data(self, data: Data, restore_enabled=False) -> bool:
         """
         Private method for attempting update node with data.
+        Node is searched in the index by data id.
+        Updated node is considered synchronized, so it changes are dropped.
         Returns True if attempt was successfull.
-        :param node: node for update
         :param data: update data
+        :param restore_enabled: enable disabled node when data is enabled
         :return: True if node successfully update
         """
-        if node == data:
+        node = self._index.get(data.get_id())
+        if node is None:
+            return False
+
+        if node.get_value() != data.get_value():
             node.set_value(data.get_value())
-            if not data.is_enabled():
-                node.set_enabled(False)
-            return True
+            self._notify(NODE_VALUE_CHANGED, node)
+        enabled = data.is_enabled()
+        if enabled != node.get_instance().is_enabled() and (restore_enabled or not enabled):
+            node.set_enabled(enabled, lazy=True)
+            self._notify(NODE_ENABLED_CHANGED, node)
+        node.get_instance().set_version(data.get_version())
+        node.get_instance().clear_changes()
+        return True
+
+    def get_version(self) -> int:
+        """
+        Getter for number of the last commit.
+        :return: version, 0 if nothing was committed
+        """
+        return self._version
+
+    def set_version(self, version: int) -> None:
+        """
+        Setter for number of the last commit, e.g. restored with the nodes from snapshot.
+        Change log is dropped, changes made before that version are found by versions of the nodes.
+        :param version: version of the managed nodes
+        :return: None
+        """
+        self._version = version
+        self._log_versions = []
+        self._log_ids = []
+        self._log_start = version
+
+    def commit_data_list(self, nodes_list: List[DataNode], data_list: List[Data]) -> int:
+        """
+        Applies update to the nodes as single commit.
+        Touched nodes get new version and are written to the change log.
+        Children of the disabled nodes are not visited, they inherit disabled state.
+        :param nodes_list: list of nodes for updating
+        :param data_list: update data, any iterable of Data
+        :return: version of the commit
+        """
+        # only ids are kept, so data_list can be streamed
+        received_ids = []
+
+        def receive(data_iter):
+            for data in data_iter:
+                received_ids.append(data.get_id())
+                yield data
+
+        self.update_node_list_with_data_list(nodes_list, receive(data_list))
+        return self.record_commit(received_ids)
+
+    def record_commit(self, received_ids: List[int]) -> int:
+        """
+        Registers commit of the already applied update.
+        Touched nodes get new version and are written to the change log.
+        :param received_ids: ids of the Data of the update
+        :return: version of the commit
+        """
+        self._version += 1
+        ids = []
+        for id_ in received_ids:
+            node = self._index.get(id_)
+            if node is None:
+                continue
+            node.get_instance().set_version(self._version)
+            ids.append(id_)
+
+        self._log_versions.append(self._version)
+        self._log_ids.append(ids)
+        return self._version
+
+    def check_versions(self, data_list: List[Data]) -> Tuple[List[Data], List[Data]]:
+        """
+        Validates update made on the copy of the nodes (optimistic concurrency).
+        Version of the received Data is version of the node when copy was taken,
+        so Data conflicts when it node was changed by later commit.
+        New Data never conflicts.
+        :param data_list: update data, any iterable of Data
+        :return: lists of accepted and conflicting Data
+        """
+        accepted = []
+        conflicts = []
+        for data in data_list:
+            node = self._index.get(data.get_id())
+            if node is not None and node.get_version() > data.get_version():
+                conflicts.append(data)
+            else:
+                accepted.append(data)
+        return accepted, conflicts
+
+    def get_changes_since(self, version: int) -> List[Data]:
+        """
+        Collects Data changed by commits after selected version.
+        Each Data returned once in it current state.
+        Disabled nodes are returned with all children, which disabled state
+        is materialized, so requester without these ancestors receives it too.
+        :param version: last version known by requester
+        :return: list of changed Data
+        """
+        if version < self._log_start:
+            # these commits are not in the log, changed Data is found by it version
+            ids_list = [[id_ for id_, node in self._index.items() if node.get_version() > version]]
         else:
-            for child in node.get_children():
-                if self._update_node_with_data(child, data):
-                    return True
-        return False
+            ids_list = self._log_ids[bisect_right(self._log_versions, version):]
+        seen = set()
+        result = []
+        for ids in ids_list:
+            for id_ in ids:
+                if id_ in seen:
+                    continue
+                node = self._index[id_]
+                if node.is_enabled():
+                    seen.add(id_)
+                    result.append(node.get_instance())
+                    continue
+
+                node.materialize_enabled()
+                for current in node.walk(filter_=lambda n: n.get_id() not in seen):
+                    seen.add(current.get_id())
+                    result.append(current.get_instance())
+        return result
 
     def node_list_to_json(self, encoder: DataEncoder, data_nodes: List[DataNode]):
         data_list = self.node_list_to_data_list(data_nodes)
         return encoder.encode(data_list)
+
+    def node_list_to_stream(self, encoder: DataBinaryEncoder, data_nodes: List[DataNode], stream) -> None:
+        """
+        Writes Data of the nodes to the stream in chunks,
+        Data list is not built, so memory use doesn't depend on the trees size.
+        :param encoder: binary encoder for Data
+        :param data_nodes: DataNode list for encoding
+        :param stream: binary file-like object
+        :return: None
+        """
+        encoder.encode_to(self.iter_data(data_nodes), stream)
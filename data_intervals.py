@@ -0,0 +1,208 @@
+#!/bin/python
+# -*- coding: utf-8 -*-
+
+from typing import List, Optional, Tuple
+
+from data_node import DataNode
+from data_controller import DataNodeController, NODE_INSERTED, NODE_REMOVED
+
+# distance between neighbour labels of the labeled tree, free labels are used by inserted nodes.
+# Labels are not limited in size, so big gap leaves free labels for dozens of nested inserts
+DEFAULT_GAP = 1 << 64
+
+
+class DataIntervalIndex(object):
+    """
+    Nested-interval labeling of the nodes managed by controller.
+    Each node has enter and exit labels on one number line, labels of the subtree
+    lie strictly between labels of it root, so ancestry and subtree containment
+    are checked by comparing two pairs of numbers.
+    Labels are placed with gaps: inserted subtree takes free labels of it parent.
+    When parent has no free labels, the nearest ancestor with enough free labels
+    is relabeled, so relabeling touches only that ancestor subtree.
+    Labels are maintained with controller notifications.
+    """
+    def __init__(self, nodes: List[DataNode], controller: DataNodeController, gap=DEFAULT_GAP):
+        """
+        DataIntervalIndex constructor.
+        Labels the nodes and attaches index to the controller.
+        :param nodes: list of the root nodes
+        :param controller: controller of the nodes
+        :param gap: distance between neighbour labels of the labeled tree
+        """
+        self._gap = gap
+        # the smallest distance between neighbour labels of the relabeled subtree
+        self._min_step = max(3, gap >> 32)
+        # labels of the nodes: id -> enter label, id -> exit label
+        self._enter = {}
+        self._exit = {}
+        # the last used label
+        self._end = 0
+        self._relabels = 0
+        self.rebuild(nodes)
+        controller.add_listener(self._on_node_changed)
+        controller.set_intervals(self)
+
+    def rebuild(self, nodes: List[DataNode]) -> None:
+        """
+        Drops current labels and labels all nodes from the list.
+        :param nodes: list of the root nodes
+        :return: None
+        """
+        self._enter = {}
+        self._exit = {}
+        self._end = 0
+        self.append(nodes)
+
+    def append(self, nodes: List[DataNode]) -> None:
+        """
+        Labels trees which were built without notifications, after all used labels.
+        Labeled trees are skipped.
+        :param nodes: list of the root nodes
+        :return: None
+        """
+        for root in nodes:
+            if root.get_id() not in self._enter:
+                self._append_root(root)
+
+    def get_relabels(self) -> int:
+        """
+        Getter for count of the relabeling caused by exhausted gaps.
+        :return: relabels count
+        """
+        return self._relabels
+
+    def get_range(self, node) -> Optional[Tuple[int, int]]:
+        """
+        Getter for labels of the node. Labels of the node subtree form contiguous range between them.
+        :param node: Data or DataNode element
+        :return: enter and exit labels, None if node is not labeled
+        """
+        enter = self._enter.get(node.get_id())
+        if enter is None:
+            return None
+        return enter, self._exit[node.get_id()]
+
+    def contains(self, node, data) -> bool:
+        """
+        Checks if subtree of the node contains data.
+        :param node: Data or DataNode element, root of the subtree
+        :param data: Data or DataNode element
+        :return: True if data is the node or it descendant
+        """
+        enter = self._enter.get(data.get_id())
+        root_enter = self._enter.get(node.get_id())
+        if enter is None or root_enter is None:
+            return False
+        return root_enter <= enter and self._exit[data.get_id()] <= self._exit[node.get_id()]
+
+    def is_ancestor(self, ancestor, node) -> bool:
+        """
+        Checks if ancestor is parent of the node or parent of it ancestor.
+        :param ancestor: Data or DataNode element
+        :param node: Data or DataNode element
+        :return: True if ancestor is proper ancestor of the node
+        """
+        return ancestor.get_id() != node.get_id() and self.contains(ancestor, node)
+
+    def _on_node_changed(self, kind: int, node: DataNode) -> None:
+        """
+        Handler of the controller notifications, labels inserted and drops removed subtrees.
+        :param kind: kind of the change
+        :param node: changed node
+        :return: None
+        """
+        if kind == NODE_INSERTED:
+            self._insert(node)
+        elif kind == NODE_REMOVED:
+            for current in node.walk():
+                self._enter.pop(current.get_id(), None)
+                self._exit.pop(current.get_id(), None)
+
+    def _append_root(self, root: DataNode) -> None:
+        """
+        Labels tree after all used labels.
+        :param root: root of the tree
+        :return: None
+        """
+        self._end = self._label(root, self._end + self._gap, self._gap, True)
+
+    def _insert(self, node: DataNode) -> None:
+        """
+        Labels inserted subtree with free labels of it parent.
+        Subtree of the parent not labeled yet is labeled with the parent later.
+        :param node: root of the inserted subtree
+        :return: None
+        """
+        parent = node.get_parent_node()
+        if parent is None:
+            self._append_root(node)
+            return
+        if parent.get_id() not in self._enter:
+            return
+
+        size = sum(1 for _ in node.walk())
+        siblings = parent.get_children()
+        # free labels are searched after the last labeled child only
+        low = None
+        if siblings[-1] is node:
+            low = self._exit.get(siblings[-2].get_id()) if len(siblings) > 1 else self._enter[parent.get_id()]
+        high = self._exit[parent.get_id()]
+        if low is not None:
+            # free labels after the subtree are left for next siblings
+            step = (high - low) // (2 * size + 1)
+            if step > 0:
+                self._label(node, low + step, step, True)
+                return
+        self._relabel(parent)
+
+    def _relabel(self, node: DataNode) -> None:
+        """
+        Relabels subtree of the nearest ancestor which labels have enough free labels between them,
+        so at most half of them is used and distance between labels is big enough for next inserts.
+        Tree without such ancestor is moved after all used labels.
+        :param node: node which subtree has no free labels
+        :return: None
+        """
+        self._relabels += 1
+        size = sum(1 for _ in node.walk())
+        while True:
+            enter, exit_ = self._enter[node.get_id()], self._exit[node.get_id()]
+            if exit_ - enter >= 4 * size * self._min_step:
+                # children take the first half of the labels, the second half is left for appended children
+                self._label(node, enter, (exit_ - enter) // (4 * size), False)
+                return
+            parent = node.get_parent_node()
+            if parent is None:
+                self._append_root(node)
+                return
+            # subtree of the node was counted, so only other children of the parent are walked
+            size += 1 + sum(1 for child in parent.get_children() if child is not node for _ in child.walk())
+            node = parent
+
+    def _label(self, root: DataNode, first: int, step: int, include_root: bool) -> int:
+        """
+        Assigns labels to the subtree in depth-first order.
+        :param root: root of the subtree
+        :param first: label of the root enter
+        :param step: distance between neighbour labels
+        :param include_root: False for keeping labels of the root, it children are labeled
+                             between it labels
+        :return: the last assigned label
+        """
+        if include_root:
+            label = first - step
+            stack = [(root, False)]
+        else:
+            label = first
+            stack = [(child, False) for child in reversed(root.get_children())]
+        while stack:
+            node, expanded = stack.pop()
+            label += step
+            if expanded:
+                self._exit[node.get_id()] = label
+                continue
+            self._enter[node.get_id()] = label
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(node.get_children()))
+        return label
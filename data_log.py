@@ -0,0 +1,223 @@
+#!/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import struct
+import threading
+import zlib
+from typing import Iterable, Iterator, List, Tuple
+
+from data import Data
+from data_node import DataNode
+from data_serializer import DataBinaryEncoder, DataBinaryDecoder
+from data_snapshot import DataSnapshot
+
+# log record header: sequence number, payload size, crc32 of the sequence and payload
+_RECORD = struct.Struct("<QII")
+# sequence number packed for the checksum
+_SEQUENCE = struct.Struct("<Q")
+
+
+class DataCommitLog(object):
+    """
+    Append-only write-ahead log of the commits applied to the database tree.
+    Each record holds Data list of one commit encoded with binary codec.
+    Commits made concurrently share one fsync (group commit): the first waiting
+    commit flushes the log for all commits appended before the flush.
+    Log is paired with snapshot file, after snapshot written, log is truncated,
+    so recovery reads snapshot and replays only records after it.
+    Snapshot is written in DataSnapshot format, it header holds sequence of the last included record
+    and commit version of the database, so versions continue after recovery.
+    """
+    def __init__(self, path: str):
+        """
+        DataCommitLog constructor.
+        Opens log, torn record at the end of the log (partially written on crash) is dropped.
+        :param path: path to the log file, snapshot is stored near with ".snapshot" suffix
+        """
+        self._path = path
+        self._snapshot_path = path + ".snapshot"
+        self._encoder = DataBinaryEncoder()
+        self._decoder = DataBinaryDecoder()
+
+        self._snapshot_sequence = self._read_snapshot_sequence()
+        self._sequence = self._snapshot_sequence
+        if not os.path.exists(path):
+            open(path, "wb").close()
+        self._file = open(path, "r+b")
+        end = 0
+        for sequence, _, end in self._scan():
+            self._sequence = sequence
+        self._file.truncate(end)
+        self._file.seek(end)
+
+        self._lock = threading.Lock()
+        self._synced_condition = threading.Condition(self._lock)
+        self._synced = self._sequence
+        self._syncing = False
+
+    def close(self) -> None:
+        """
+        Closes log file.
+        :return: None
+        """
+        with self._lock:
+            self._file.close()
+
+    def get_sequence(self) -> int:
+        """
+        Getter for sequence number of the last record.
+        :return: sequence number, 0 if nothing was logged
+        """
+        return self._sequence
+
+    def commit(self, data_list: Iterable[Data]) -> int:
+        """
+        Appends commit record and waits until it is written to the disk.
+        :param data_list: Data of the commit
+        :return: sequence number of the record
+        """
+        sequence = self.append(data_list)
+        self.wait_synced(sequence)
+        return sequence
+
+    def append(self, data_list: Iterable[Data]) -> int:
+        """
+        Appends commit record without waiting for the disk, so caller can release own locks
+        before wait_synced and concurrent commits share one fsync.
+        :param data_list: Data of the commit
+        :return: sequence number of the record
+        """
+        payload = self._encoder.encode(list(data_list))
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+            checksum = zlib.crc32(payload, zlib.crc32(_SEQUENCE.pack(sequence)))
+            self._file.write(_RECORD.pack(sequence, len(payload), checksum))
+            self._file.write(payload)
+        return sequence
+
+    def wait_synced(self, sequence: int) -> None:
+        """
+        Waits until record appended with append is written to the disk.
+        :param sequence: sequence number of the record
+        :return: None
+        """
+        with self._lock:
+            while self._synced < sequence:
+                if self._syncing:
+                    self._synced_condition.wait()
+                    continue
+                self._sync()
+
+    def _sync(self) -> None:
+        """
+        Writes all appended records to the disk.
+        Must be called with acquired lock, lock is released during fsync,
+        so other commits are appended meanwhile and synced by the next call.
+        :return: None
+        """
+        self._syncing = True
+        target = self._sequence
+        try:
+            self._file.flush()
+            self._lock.release()
+            try:
+                os.fsync(self._file.fileno())
+            finally:
+                self._lock.acquire()
+            self._synced = max(self._synced, target)
+        finally:
+            self._syncing = False
+            self._synced_condition.notify_all()
+
+    def records(self) -> Iterator[Tuple[int, List[Data]]]:
+        """
+        Reads records of the log, logged after the snapshot.
+        :return: iterator of sequence number and Data list pairs
+        """
+        with open(self._path, "rb") as file:
+            for sequence, payload, _ in self._scan(file):
+                yield sequence, self._decoder.decode(payload)
+
+    def _scan(self, file=None) -> Iterator[Tuple[int, bytes, int]]:
+        """
+        Reads valid records from the start of the log.
+        Reading is stopped on truncated record or wrong checksum.
+        :param file: opened log file, log of that object by default
+        :return: iterator of sequence number, payload and offset after the record
+        """
+        file = file or self._file
+        file.seek(0)
+        offset = 0
+        while True:
+            header = file.read(_RECORD.size)
+            if len(header) < _RECORD.size:
+                return
+            sequence, size, checksum = _RECORD.unpack(header)
+            payload = file.read(size)
+            if len(payload) < size or zlib.crc32(payload, zlib.crc32(_SEQUENCE.pack(sequence))) != checksum:
+                return
+            offset += _RECORD.size + size
+            if sequence > self._snapshot_sequence:
+                yield sequence, payload, offset
+
+    def write_snapshot(self, data_list: Iterable[Data], version: int) -> None:
+        """
+        Writes snapshot of the whole tree and truncates the log.
+        Snapshot must contain all logged commits, so commits must not be made
+        until snapshot is written.
+        :param data_list: Data of the whole tree, any iterable
+        :param version: commit version of the tree, DataNodeController.get_version
+        :return: None
+        """
+        DataSnapshot.write(self._snapshot_path, data_list, self._sequence, version)
+
+        with self._lock:
+            self._snapshot_sequence = self._sequence
+            self._file.seek(0)
+            self._file.truncate()
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def _read_snapshot_sequence(self) -> int:
+        """
+        Reads sequence number stored in the snapshot.
+        :return: sequence number, 0 if there is no snapshot
+        """
+        if not os.path.exists(self._snapshot_path):
+            return 0
+        snapshot = DataSnapshot(self._snapshot_path)
+        try:
+            return snapshot.get_sequence()
+        finally:
+            snapshot.close()
+
+    def has_data(self) -> bool:
+        """
+        Checks if there is snapshot or logged commits to recover.
+        :return: True if recovery will restore any Data
+        """
+        return os.path.exists(self._snapshot_path) or self._sequence > self._snapshot_sequence
+
+    def recover(self, controller) -> List[DataNode]:
+        """
+        Rebuilds tree from the snapshot and replays logged commits on it.
+        Snapshot nodes are built directly from the records, without hierarchy search.
+        Controller version is restored from the snapshot, each replayed commit increments it.
+        :param controller: DataNodeController for the restored tree
+        :return: list of the root nodes
+        """
+        nodes = []
+        controller.rebuild_index(nodes)
+        if os.path.exists(self._snapshot_path):
+            snapshot = DataSnapshot(self._snapshot_path, controller)
+            try:
+                nodes = snapshot.load()
+                controller.set_version(snapshot.get_version())
+            finally:
+                snapshot.close()
+
+        for _, data_list in self.records():
+            controller.commit_data_list(nodes, data_list)
+        return nodes
@@ -1,7 +1,8 @@
 #!/bin/python
 # -*- coding: utf-8 -*-
 
-from data import Data
+from collections import deque
+from data import Data, get_enabled_epoch, next_enabled_epoch
 
 
 class DataNodeException(Exception):
@@ -20,6 +21,15 @@ class DataNodeInstanceException(DataNodeException):
         DataNodeException.__init__(self, *args, **kwargs)
 
 
+# orders of the nodes tree traversal
+PRE_ORDER = 1
+POST_ORDER = 2
+BREADTH_FIRST = 3
+
+# shared children container of the leaf nodes, replaced with list on first append
+_NO_CHILDREN = ()
+
+
 class DataNode(object):
     """
     Class for store Tree-type hierarchy of Data.
@@ -27,7 +37,12 @@ class DataNode(object):
         * Each child element will have appropriate parent field value.
         * Root-level Node will have None in parent field
     Class provides proxy interface for access Data
+    Attributes are stored in slots, so DataNode has no per-instance dict.
+    Inherited enabled state is cached with number of the enabled epoch,
+    so it is recalculated only after enabled flags or hierarchy changed.
     """
+    __slots__ = ("_parent", "_data", "_children", "_enabled_epoch", "_enabled_cache")
+
     def __init__(self, value=None, parent=None, instance=None):
         """
         DataNode constructor.
@@ -43,6 +58,8 @@ class DataNode(object):
         :param instance: Data for that DataNode.
         """
         self._parent = parent
+        self._enabled_epoch = -1
+        self._enabled_cache = True
 
         if instance is not None:
             self._data = instance
@@ -52,7 +69,7 @@ class DataNode(object):
         if parent is not None:
             parent.append_child(self)
 
-        self._children = []
+        self._children = _NO_CHILDREN
 
     def __eq__(self, other):
         if isinstance(other, DataNode):
@@ -72,37 +89,103 @@ class DataNode(object):
         Debug-format data representation
         :return: String debug data representation
         """
-        return "{{\n"\
-               "\tid:        {0},\n"\
-               "\tparent_id: {1},\n"\
-               "\tvalue:     {2},\n"\
-               "\tchildren: [\n"\
-               "{3}\n"\
-               "]\n" \
-               "}}".format(self.get_id(),
-                           self.get_parent_id(),
-                           self.get_value(),
-                           ",\n".join([repr(i) for i in self._children]))
-
-    def has(self, data) -> bool:
-        """
-        Checks if node contains entered data
+        # children are represented before parent, so their representations are ready
+        reprs = {}
+        for node in self.walk(POST_ORDER):
+            reprs[id(node)] = "{{\n"\
+                              "\tid:        {0},\n"\
+                              "\tparent_id: {1},\n"\
+                              "\tvalue:     {2},\n"\
+                              "\tchildren: [\n"\
+                              "{3}\n"\
+                              "]\n" \
+                              "}}".format(node.get_id(),
+                                          node.get_parent_id(),
+                                          node.get_value(),
+                                          ",\n".join([reprs.pop(id(i)) for i in node.get_children()]))
+        return reprs[id(self)]
+
+    def walk(self, order=PRE_ORDER, max_depth=None, filter_=None, expand=None):
+        """
+        Generator of the nodes of that tree, node itself included.
+        Traversal uses explicit stack, so tree depth is not limited by recursion.
+        Children are visited in the order of the children list.
+        :param order: PRE_ORDER, POST_ORDER or BREADTH_FIRST
+        :param max_depth: deepest visited level, node itself has level 0. None for whole tree
+        :param filter_: callable receiving DataNode. Node for which it returns False
+                        is skipped with all it children
+        :param expand: callable receiving DataNode, called before children of the node are visited,
+                       e.g. for loading of the children
+        :return: iterator of DataNode
+        """
+        if filter_ is not None and not filter_(self):
+            return
+
+        if order == BREADTH_FIRST:
+            queue = deque([(self, 0)])
+            while queue:
+                node, depth = queue.popleft()
+                yield node
+                if max_depth is None or depth < max_depth:
+                    if expand is not None:
+                        expand(node)
+                    queue.extend((child, depth + 1) for child in node.get_children()
+                                 if filter_ is None or filter_(child))
+            return
+
+        if order != PRE_ORDER and order != POST_ORDER:
+            raise ValueError("unknown traversal order {}".format(order))
+
+        # stack items: node, it depth and flag if it children already pushed
+        stack = [(self, 0, False)]
+        while stack:
+            node, depth, expanded = stack.pop()
+            if expanded:
+                yield node
+                continue
+
+            if order == PRE_ORDER:
+                yield node
+            else:
+                stack.append((node, depth, True))
+
+            if max_depth is None or depth < max_depth:
+                if expand is not None:
+                    expand(node)
+                stack.extend((child, depth + 1, False) for child in reversed(node.get_children())
+                             if filter_ is None or filter_(child))
+
+    def has(self, data, index=None, intervals=None) -> bool:
+        """
+        Checks if node contains entered data.
+        When index passed, searched node is taken from it and checked
+        through it parents, so children are not walked.
+        When intervals passed, labels of the nodes are compared in constant time.
         :param data: Data or DataNode element
+        :param index: dict with id -> DataNode pairs, containing that node tree
+        :param intervals: DataIntervalIndex labeling that node tree
         :return: True if node or it children has that data
         """
         if self == data:
             return True
 
-        for child in self._children:
-            has_in_child = child.has(data)
-            if has_in_child:
-                return True
+        if intervals is not None:
+            return intervals.contains(self, data)
 
-        return False
+        if index is not None:
+            node = index.get(data.get_id())
+            while node is not None:
+                if node is self:
+                    return True
+                node = node.get_parent_node()
+            return False
+
+        return any(node == data for node in self.walk())
 
     def get_children(self):
         """
-        Getter for element's children list
+        Getter for element's children list.
+        Leaf node returns empty tuple, so result must not be modified.
         :return: List of the children elements
         """
         return self._children
@@ -152,23 +235,88 @@ class DataNode(object):
 
     def get_id(self) -> int:
         """
-        Getter for Data uuid as int
-        :return: int uuid of the node
+        Getter for Data id as int
+        :return: int id of the node
         """
         return self._data.get_id()
 
-    def set_enabled(self, value) -> None:
+    def set_enabled(self, value, lazy=False) -> None:
         """
-        Enables/Disables DataNode. Also applies to children
+        Enables/Disables DataNode. Also applies to children.
+        In lazy mode only Data of that node is marked, children
+        inherit disabled state through is_enabled check of ancestors.
         :param value: enable flag
+        :param lazy: mark only that node
         :return: None
         """
-        self._data.set_enabled(value)
-        for child in self.get_children():
-            child.set_enabled(value)
+        if lazy:
+            self._data.set_enabled(value)
+            return
+
+        for node in self.walk():
+            node.get_instance().set_enabled(value)
 
     def is_enabled(self) -> bool:
-        return self._data.is_enabled()
+        """
+        Checks if node is available. Node is disabled when it Data
+        or Data of any ancestor is disabled.
+        Ancestors are visited up to the one with state cached in current epoch,
+        states of the visited nodes are cached, so next checks of the branch take constant time.
+        :return: False if node or any ancestor deleted
+        """
+        epoch = get_enabled_epoch()
+        if self._enabled_epoch == epoch:
+            return self._enabled_cache
+
+        path = []
+        node = self
+        enabled = True
+        while node is not None:
+            if node._enabled_epoch == epoch:
+                enabled = node._enabled_cache
+                break
+            path.append(node)
+            node = node._parent
+        for node in reversed(path):
+            enabled = enabled and node._data.is_enabled()
+            node._enabled_cache = enabled
+            node._enabled_epoch = epoch
+        return enabled
+
+    def materialize_enabled(self) -> None:
+        """
+        Writes inherited disabled state into Data of the node and all it children,
+        so Data can be serialized without ancestors.
+        :return: None
+        """
+        for node in self.walk():
+            if node is self:
+                disabled = not self.is_enabled()
+            else:
+                disabled = not node.get_parent_node().get_instance().is_enabled()
+            if disabled:
+                node.get_instance().set_enabled(False)
+
+    def get_version(self) -> int:
+        """
+        Getter for commit number of the last Data change.
+        :return: version of the Data
+        """
+        return self._data.get_version()
+
+    def get_changes(self) -> int:
+        """
+        Getter for changes of the Data since it was received or created.
+        :return: bit mask of the Data changes
+        """
+        return self._data.get_changes()
+
+    def is_changed(self) -> bool:
+        """
+        Checks if Data of the node has not applied changes.
+        :return: True if any change recorded
+        """
+        return self._data.is_changed()
 
     def append_child(self, child) -> None:
         """
@@ -179,11 +327,27 @@ class DataNode(object):
         :return: None
         """
         if isinstance(child, DataNode):
+            if self._children is _NO_CHILDREN:
+                self._children = []
             self._children.append(child)
             child.set_parent(self)
         else:
             raise DataNodeInstanceException
 
+    def remove_child(self, child) -> None:
+        """
+        Function for removing child element from the node.
+        Removed child keeps reference to the parent, so it can be located after removal.
+        :exception ValueError: raised when child is not in children list.
+        :param child: removed child element
+        :return: None
+        """
+        for row, current in enumerate(self._children):
+            if current is child:
+                del self._children[row]
+                return
+        raise ValueError("node is not a child")
+
     def set_parent(self, parent) -> None:
         """
         Setter for parent element field.
@@ -191,3 +355,4 @@ class DataNode(object):
         :return: None
         """
         self._parent = parent
+        next_enabled_epoch()
@@ -0,0 +1,307 @@
+#!/bin/python3
+# -*- coding: utf-8 -*-
+
+from typing import List, Optional
+
+from PyQt5.QtCore import QAbstractItemModel, QModelIndex, Qt
+
+from data_node import DataNode
+from data_controller import DataNodeController, NODE_VALUE_CHANGED, NODE_ENABLED_CHANGED, NODE_INSERTED
+from data_controller import NODE_ABOUT_TO_BE_REMOVED, NODE_REMOVED
+
+
+class DataNodeModel(QAbstractItemModel):
+    """
+    Item model for view of the DataNode trees.
+    Model doesn't copy the nodes: each index points to the DataNode,
+    rows are fetched by batches when parent is expanded,
+    values and states are read from the nodes on demand.
+    When controller passed, model listens it notifications and updates
+    only changed rows, so view keeps expansion and scroll state.
+    """
+    # count of the rows added to the parent by one fetch
+    FETCH_BATCH_SIZE = 256
+
+    def __init__(self, nodes: List[DataNode], controller: DataNodeController = None, parent=None):
+        """
+        DataNodeModel constructor.
+        :param nodes: list of the root nodes. List is copied, later roots are
+                      taken from controller notifications
+        :param controller: controller of the nodes
+        :param parent: parent QObject
+        """
+        super(DataNodeModel, self).__init__(parent)
+        self._nodes = list(nodes)
+        self._controller = controller
+        if controller is not None:
+            controller.add_listener(self.on_node_changed)
+        # count of the fetched rows: id of the parent DataNode (None for roots) -> count
+        self._fetched = {}
+        # row of the node in it parent: id of the DataNode -> row
+        self._rows = {}
+        # parent and row of the child which removal is notified, None if not shown
+        self._removing = None
+
+    def node_from_index(self, index: QModelIndex) -> Optional[DataNode]:
+        """
+        Getter for node of the index.
+        :param index: model index
+        :return: DataNode, None for invalid index
+        """
+        if not index.isValid():
+            return None
+        return index.internalPointer()
+
+    def detach(self) -> None:
+        """
+        Unsubscribes model from controller notifications.
+        Must be called when model is not used anymore.
+        :return: None
+        """
+        if self._controller is not None:
+            self._controller.remove_listener(self.on_node_changed)
+            self._controller = None
+
+    def on_node_changed(self, kind: int, node: DataNode) -> None:
+        """
+        Handler of the controller notifications.
+        :param kind: kind of the change
+        :param node: changed node
+        :return: None
+        """
+        if kind == NODE_VALUE_CHANGED:
+            index = self._index_of(node)
+            if index.isValid():
+                self.dataChanged.emit(index, index)
+        elif kind == NODE_ENABLED_CHANGED:
+            # children inherit state, so shown children are updated too
+            for current in node.walk(filter_=lambda n: id(n) in self._rows):
+                index = self._index_of(current)
+                self.dataChanged.emit(index, index)
+        elif kind == NODE_INSERTED:
+            self._insert_node(node)
+        elif kind == NODE_ABOUT_TO_BE_REMOVED:
+            self._begin_remove_node(node)
+        elif kind == NODE_REMOVED:
+            self._end_remove_node(node)
+
+    def _index_of(self, node: DataNode) -> QModelIndex:
+        """
+        Creates index of the node shown in the model.
+        :param node: searched node
+        :return: index of the node, invalid if node row was not shown yet
+        """
+        row = self._rows.get(id(node))
+        if row is None:
+            return QModelIndex()
+        return self.createIndex(row, 0, node)
+
+    def _insert_node(self, node: DataNode) -> None:
+        """
+        Shows inserted node. Node is shown only if it position is next to the fetched rows,
+        otherwise it will be fetched later.
+        Root node which received parent is removed from the roots.
+        :param node: inserted node
+        :return: None
+        """
+        parent = node.get_parent_node()
+        if parent is None:
+            row = len(self._nodes)
+            shown = self._fetched.get(None, 0) == row
+            if shown:
+                self.beginInsertRows(QModelIndex(), row, row)
+            self._nodes.append(node)
+            if shown:
+                self._fetched[None] = row + 1
+                self.endInsertRows()
+            return
+
+        self._remove_root(node)
+        parent_index = self._index_of(parent)
+        row = len(parent.get_children()) - 1
+        if parent_index.isValid() and self._fetched.get(id(parent), 0) == row:
+            self.beginInsertRows(parent_index, row, row)
+            self._fetched[id(parent)] = row + 1
+            self.endInsertRows()
+
+    def _begin_remove_node(self, node: DataNode) -> None:
+        """
+        Starts removal of the child node row, if it is shown.
+        :param node: removed node
+        :return: None
+        """
+        self._removing = None
+        parent = node.get_parent_node()
+        if parent is None:
+            return
+        parent_index = self._index_of(parent)
+        if not parent_index.isValid():
+            return
+        row = next(row for row, child in enumerate(parent.get_children()) if child is node)
+        if row < self._fetched.get(id(parent), 0):
+            self.beginRemoveRows(parent_index, row, row)
+            self._removing = (parent, row)
+
+    def _end_remove_node(self, node: DataNode) -> None:
+        """
+        Finishes removal of the node row. Removed root is removed from the roots.
+        :param node: removed node
+        :return: None
+        """
+        for current in node.walk():
+            self._fetched.pop(id(current), None)
+            if current is not node:
+                self._rows.pop(id(current), None)
+        if node.get_parent_node() is None:
+            self._remove_root(node)
+            return
+
+        removing, self._removing = self._removing, None
+        self._rows.pop(id(node), None)
+        if removing is None:
+            return
+        parent, row = removing
+        self._fetched[id(parent)] -= 1
+        children = parent.get_children()
+        for current_row in range(row, len(children)):
+            if id(children[current_row]) in self._rows:
+                self._rows[id(children[current_row])] = current_row
+        self.endRemoveRows()
+
+    def _remove_root(self, node: DataNode) -> None:
+        """
+        Removes node from the roots.
+        :param node: removed node
+        :return: None
+        """
+        if node not in self._nodes:
+            return
+        row = self._nodes.index(node)
+        fetched = self._fetched.get(None, 0)
+        if row < fetched:
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self._nodes[row]
+            self._fetched[None] = fetched - 1
+            self._reindex_roots(row)
+            self.endRemoveRows()
+        else:
+            del self._nodes[row]
+            self._reindex_roots(row)
+        self._rows.pop(id(node), None)
+
+    def _reindex_roots(self, start: int) -> None:
+        """
+        Updates cached rows of the roots after row removal.
+        :param start: first changed row
+        :return: None
+        """
+        for row in range(start, len(self._nodes)):
+            if id(self._nodes[row]) in self._rows:
+                self._rows[id(self._nodes[row])] = row
+
+    def _children(self, parent: QModelIndex) -> List[DataNode]:
+        """
+        Getter for children nodes of the index.
+        :param parent: parent index, invalid for roots
+        :return: list of the children nodes
+        """
+        if not parent.isValid():
+            return self._nodes
+        return parent.internalPointer().get_children()
+
+    def _key(self, parent: QModelIndex):
+        """
+        Key of the parent in fetched rows dict.
+        :param parent: parent index, invalid for roots
+        :return: id of the parent node, None for roots
+        """
+        if not parent.isValid():
+            return None
+        return id(parent.internalPointer())
+
+    def index(self, row: int, column: int, parent=QModelIndex()) -> QModelIndex:
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+
+        node = self._children(parent)[row]
+        self._rows[id(node)] = row
+        return self.createIndex(row, column, node)
+
+    def parent(self, index: QModelIndex) -> QModelIndex:
+        if not index.isValid():
+            return QModelIndex()
+
+        parent = index.internalPointer().get_parent_node()
+        if parent is None:
+            return QModelIndex()
+
+        row = self._rows.get(id(parent))
+        if row is None:
+            grandparent = parent.get_parent_node()
+            siblings = self._nodes if grandparent is None else grandparent.get_children()
+            row = siblings.index(parent)
+            self._rows[id(parent)] = row
+        return self.createIndex(row, 0, parent)
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        if parent.column() > 0:
+            return 0
+        return self._fetched.get(self._key(parent), 0)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 1
+
+    def _children_count(self, parent: QModelIndex) -> int:
+        """
+        Getter for count of the children, including children not loaded by controller yet.
+        :param parent: parent index
+        :return: children count
+        """
+        node = self.node_from_index(parent)
+        if node is None or self._controller is None:
+            return len(self._children(parent))
+        return self._controller.get_children_count(node)
+
+    def hasChildren(self, parent=QModelIndex()) -> bool:
+        if parent.column() > 0:
+            return False
+        return self._children_count(parent) > 0
+
+    def canFetchMore(self, parent: QModelIndex) -> bool:
+        if parent.column() > 0:
+            return False
+        return self._fetched.get(self._key(parent), 0) < self._children_count(parent)
+
+    def fetchMore(self, parent: QModelIndex) -> None:
+        node = self.node_from_index(parent)
+        if node is not None and self._controller is not None:
+            # loaded children are shown by insert notifications
+            self._controller.load_children([node])
+        key = self._key(parent)
+        fetched = self._fetched.get(key, 0)
+        count = min(self.FETCH_BATCH_SIZE, len(self._children(parent)) - fetched)
+        if count <= 0:
+            return
+
+        self.beginInsertRows(parent, fetched, fetched + count - 1)
+        self._fetched[key] = fetched + count
+        self.endInsertRows()
+
+    def data(self, index: QModelIndex, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        node = index.internalPointer()
+        if role == Qt.DisplayRole:
+            return node.get_value()
+        if role == Qt.UserRole:
+            return node
+        return None
+
+    def flags(self, index: QModelIndex):
+        if not index.isValid():
+            return Qt.NoItemFlags
+
+        if index.internalPointer().is_enabled():
+            return Qt.ItemIsSelectable | Qt.ItemIsEnabled
+        return Qt.ItemIsSelectable
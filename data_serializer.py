@@ -2,8 +2,34 @@
 # -*- coding: utf-8 -*-
 
 import json
+import struct
+from itertools import islice
+from typing import Iterator, List, Tuple
 from data import Data
 
+# binary format header: kind of the encoded object, format flags, records count, size of the values in bytes.
+# Fixed-size records are followed by concatenated utf-8 values, so records are unpacked in one pass
+# and values are decoded in one sweep
+_HEADER = struct.Struct("<BBII")
+# binary format records: flags, id, parent id, version, value length.
+# 64-bit ids are written in narrow records, when any id is bigger (uuid) all records are wide
+_RECORD = struct.Struct("<BQQQI")
+_WIDE_RECORD = struct.Struct("<B16s16sQI")
+_MAX_NARROW_ID = (1 << 64) - 1
+# binary stream chunk header: format flags, records count, size of the values in bytes
+_CHUNK = struct.Struct("<BII")
+# header of the children counts: count of the counts, followed by 32-bit counts
+_COUNTS = struct.Struct("<I")
+DEFAULT_CHUNK_SIZE = 4096
+_KIND_SINGLE = 0
+_KIND_LIST = 1
+# flags of the binary record
+_ENABLED = 1
+_HAS_PARENT = 2
+_HAS_VALUE = 4
+# format flags of the header
+_WIDE_IDS = 1
+
 
 class DataEncoder(json.JSONEncoder):
     """
@@ -16,7 +42,8 @@ class DataEncoder(json.JSONEncoder):
                 "id": value.get_id(),
                 "value": value.get_value(),
                 "enabled": value.is_enabled(),
-                "parent_id": value.get_parent_id()
+                "parent_id": value.get_parent_id(),
+                "version": value.get_version()
             }
         else:
             return super().default(self, value)
@@ -35,6 +62,185 @@ class DataDecoder(json.JSONDecoder):
             value = obj["value"]
             enabled = bool(obj["enabled"])
             parent_id = int(obj["parent_id"]) if obj["parent_id"] is not None else None
-            return Data(value=value, parent_id=parent_id, id_=id_, enabled=enabled)
+            version = int(obj.get("version", 0))
+            return Data(value=value, parent_id=parent_id, id_=id_, enabled=enabled, version=version)
 
         return obj
+
+
+class DataBinaryEncoder(object):
+    """
+    Class for encoding Data to compact binary format.
+    Can be used instead of DataEncoder: encodes single Data or list of Data.
+    Records have flags byte and fixed-width ids (64-bit or 128-bit when any id doesn't fit),
+    utf-8 values are placed after all records.
+    """
+    def encode(self, value) -> bytes:
+        if isinstance(value, Data):
+            kind, data_list = _KIND_SINGLE, [value]
+        else:
+            kind, data_list = _KIND_LIST, value
+
+        format_flags, count, records, values = self._encode_records(data_list)
+        return _HEADER.pack(kind, format_flags, count, len(values)) + records + values
+
+    def encode_with_counts(self, data_list: List[Data], counts: List[int]) -> bytes:
+        """
+        Encodes Data list with count of the children of each Data in source tree,
+        so receiver knows which nodes have children not sent yet.
+        :param data_list: list of Data
+        :param counts: children counts, parallel to data_list
+        :return: encoded list with counts
+        """
+        return _COUNTS.pack(len(counts)) + struct.pack("<{}I".format(len(counts)), *counts) + self.encode(data_list)
+
+    def iter_encode(self, data_list, chunk_size=DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+        """
+        Encodes Data stream into chunks with at most chunk_size records each,
+        so memory use doesn't depend on the stream size.
+        :param data_list: any iterable of Data
+        :param chunk_size: records count in chunk
+        :return: iterator of encoded chunks
+        """
+        data_iter = iter(data_list)
+        while True:
+            format_flags, count, records, values = self._encode_records(list(islice(data_iter, chunk_size)))
+            if count == 0:
+                return
+            yield _CHUNK.pack(format_flags, count, len(values)) + records + values
+
+    def encode_to(self, data_list, stream, chunk_size=DEFAULT_CHUNK_SIZE) -> None:
+        """
+        Writes Data stream to the file-like object in chunks.
+        :param data_list: any iterable of Data
+        :param stream: binary file-like object with write method
+        :param chunk_size: records count in chunk
+        :return: None
+        """
+        for chunk in self.iter_encode(data_list, chunk_size):
+            stream.write(chunk)
+
+    def _encode_records(self, data_list) -> Tuple[int, int, bytes, bytes]:
+        """
+        Encodes records and values of the Data.
+        :param data_list: any iterable of Data
+        :return: format flags, count of the records, encoded records and concatenated values
+        """
+        rows = []
+        values = []
+        wide = False
+        for data in data_list:
+            flags = _ENABLED if data.is_enabled() else 0
+            id_ = data.get_id()
+            parent_id = data.get_parent_id()
+            if parent_id is None:
+                parent_id = 0
+            else:
+                flags |= _HAS_PARENT
+            value_bytes = b""
+            if data.get_value() is not None:
+                flags |= _HAS_VALUE
+                value_bytes = data.get_value().encode("utf-8")
+                values.append(value_bytes)
+            if id_ > _MAX_NARROW_ID or parent_id > _MAX_NARROW_ID:
+                wide = True
+            rows.append((flags, id_, parent_id, data.get_version(), len(value_bytes)))
+
+        if wide:
+            pack = _WIDE_RECORD.pack
+            records = b"".join(pack(flags, id_.to_bytes(16, "little"), parent_id.to_bytes(16, "little"),
+                                    version, length)
+                               for flags, id_, parent_id, version, length in rows)
+        else:
+            pack = _RECORD.pack
+            records = b"".join(pack(*row) for row in rows)
+        return _WIDE_IDS if wide else 0, len(rows), records, b"".join(values)
+
+
+class DataBinaryDecoder(object):
+    """
+    Class for decoding Data from compact binary format.
+    Can be used instead of DataDecoder.
+    """
+    def decode(self, binary: bytes):
+        view = memoryview(binary)
+        kind, format_flags, count, values_size = _HEADER.unpack_from(view, 0)
+        result = self._decode_records(view, _HEADER.size, format_flags, count, values_size)
+        if kind == _KIND_SINGLE:
+            return result[0]
+        return result
+
+    def decode_with_counts(self, binary: bytes) -> Tuple[List[Data], List[int]]:
+        """
+        Decodes Data list encoded by DataBinaryEncoder.encode_with_counts.
+        :param binary: encoded list with counts
+        :return: list of Data and parallel list of children counts
+        """
+        view = memoryview(binary)
+        size = _COUNTS.unpack_from(view, 0)[0]
+        counts = list(struct.unpack_from("<{}I".format(size), view, _COUNTS.size))
+        return self.decode(view[_COUNTS.size + 4 * size:]), counts
+
+    def iter_decode(self, stream) -> Iterator[Data]:
+        """
+        Decodes chunks written by DataBinaryEncoder.encode_to.
+        Only one chunk is held in memory, so result can be passed
+        directly to the controller update.
+        :param stream: binary file-like object with read method
+        :return: iterator of Data
+        """
+        while True:
+            header = stream.read(_CHUNK.size)
+            if not header:
+                return
+            if len(header) < _CHUNK.size:
+                raise ValueError("truncated chunk header")
+            format_flags, count, values_size = _CHUNK.unpack(header)
+            record_size = _WIDE_RECORD.size if format_flags & _WIDE_IDS else _RECORD.size
+            size = count * record_size + values_size
+            body = stream.read(size)
+            if len(body) < size:
+                raise ValueError("truncated chunk")
+            yield from self._decode_records(memoryview(body), 0, format_flags, count, values_size)
+
+    def _decode_records(self, view: memoryview, offset: int, format_flags: int, count: int,
+                        values_size: int) -> List[Data]:
+        """
+        Decodes records and values from the buffer.
+        :param view: buffer with records
+        :param offset: offset of the first record
+        :param format_flags: format flags of the header
+        :param count: records count
+        :param values_size: size of the values placed after the records
+        :return: list of Data
+        """
+        wide = format_flags & _WIDE_IDS
+        records_end = offset + count * (_WIDE_RECORD.size if wide else _RECORD.size)
+        rows = (_WIDE_RECORD if wide else _RECORD).iter_unpack(view[offset:records_end])
+        if wide:
+            from_bytes = int.from_bytes
+            rows = [(flags, from_bytes(id_, "little"), from_bytes(parent_id, "little"), version, length)
+                    for flags, id_, parent_id, version, length in rows]
+
+        values = bytes(view[records_end:records_end + values_size])
+        if len(values) < values_size:
+            raise ValueError("truncated values")
+        text = values.decode("utf-8")
+        # values of ascii text have the same offsets in bytes and in decoded text
+        if len(text) != values_size:
+            text = values
+
+        result = []
+        append = result.append
+        position = 0
+        for flags, id_, parent_id, version, length in rows:
+            if flags & _HAS_VALUE:
+                value = text[position:position + length]
+                position += length
+                if text is values:
+                    value = value.decode("utf-8")
+            else:
+                value = None
+            append(Data(value, parent_id if flags & _HAS_PARENT else None, id_, flags & _ENABLED == _ENABLED,
+                        version))
+        return result
@@ -0,0 +1,452 @@
+#!/bin/python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import itertools
+import struct
+import sys
+import threading
+from typing import List, Optional, Tuple
+
+from data import get_id_generator, set_id_generator
+from data_session import DataSessionManager
+from id_generator import IdGenerator, RangeIdGenerator
+
+# frame header: kind of the request or response, request number, payload size
+_FRAME = struct.Struct("<BII")
+# version in the payload, also count and first id of the reserved ids range
+_VERSION = struct.Struct("<Q")
+# subtree request payload: id, deepest level (-1 for whole subtree), maximal count (0 for whole subtree)
+# children request payload is sequence of 16-byte parent ids
+_SUBTREE = struct.Struct("<16sqQ")
+# kinds of the requests
+CHECKOUT = 1
+COMMIT = 2
+CHANGES = 3
+VERSION = 4
+SUBTREE = 5
+CHILDREN = 6
+RESERVE = 7
+# kinds of the responses
+_OK = 0
+_ERROR = 255
+# count of the commits applied together
+DEFAULT_BATCH_SIZE = 64
+
+
+class DataServiceException(Exception):
+    """
+    Common exception for database service, raised on client when request failed
+    """
+    def __init__(self, *args, **kwargs):
+        Exception.__init__(self, *args, **kwargs)
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> Optional[Tuple[int, int, bytes]]:
+    """
+    Reads one frame from the stream.
+    :param reader: stream reader
+    :return: kind, request number and payload, None when stream is closed
+    """
+    try:
+        header = await reader.readexactly(_FRAME.size)
+        kind, number, size = _FRAME.unpack(header)
+        payload = await reader.readexactly(size)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    return kind, number, payload
+
+
+class DataService(object):
+    """
+    Database service for caches of other processes, available through unix domain socket.
+    Requests of the connection are pipelined: client can send next request
+    before response received, responses are sent when ready with number of the request.
+    Requests are executed in threads: reads are served from snapshots in parallel,
+    commits received while previous batch is applied are applied together as single commit.
+    Data is transferred in binary format of DataBinaryEncoder.
+    """
+    def __init__(self, manager: DataSessionManager, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        DataService constructor.
+        :param manager: manager of the database, DataSessionManager or DataStorageSessionManager
+        :param batch_size: maximal count of the commits applied together
+        """
+        self._manager = manager
+        self._batch_size = batch_size
+        self._server = None
+        self._commits = None
+        self._committer = None
+
+    async def start(self, path: str) -> None:
+        """
+        Starts listening the socket.
+        :param path: path to the unix domain socket
+        :return: None
+        """
+        self._commits = asyncio.Queue()
+        self._committer = asyncio.ensure_future(self._apply_commits())
+        self._server = await asyncio.start_unix_server(self._serve_connection, path=path)
+
+    async def serve_forever(self, path: str) -> None:
+        """
+        Starts listening the socket and serves requests until cancelled.
+        :param path: path to the unix domain socket
+        :return: None
+        """
+        await self.start(path)
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self) -> None:
+        """
+        Stops listening the socket. Received commits are applied before return.
+        :return: None
+        """
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._committer is not None:
+            await self._commits.join()
+            self._committer.cancel()
+            self._committer = None
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Reads requests of the connection and starts their handling.
+        :param reader: stream reader of the connection
+        :param writer: stream writer of the connection
+        :return: None
+        """
+        write_lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                frame = await _read_frame(reader)
+                if frame is None:
+                    break
+                task = asyncio.ensure_future(self._handle_request(*frame, writer, write_lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(tasks)
+        finally:
+            writer.close()
+
+    async def _handle_request(self, kind: int, number: int, payload: bytes,
+                              writer: asyncio.StreamWriter, write_lock: asyncio.Lock) -> None:
+        """
+        Executes request and sends response.
+        :param kind: kind of the request
+        :param number: request number
+        :param payload: request payload
+        :param writer: stream writer of the connection
+        :param write_lock: lock of the connection writes
+        :return: None
+        """
+        loop = asyncio.get_event_loop()
+        try:
+            if kind == CHECKOUT:
+                encoded_data = await loop.run_in_executor(None, self._manager.checkout,
+                                                          int.from_bytes(payload, "little"))
+                response = encoded_data or b""
+            elif kind == COMMIT:
+                future = loop.create_future()
+                self._commits.put_nowait((payload, future))
+                version, encoded_conflicts = await future
+                response = _VERSION.pack(version) + encoded_conflicts
+            elif kind == CHANGES:
+                encoded_data, version = await loop.run_in_executor(None, self._manager.get_changes_since,
+                                                                   _VERSION.unpack(payload)[0])
+                response = _VERSION.pack(version) + encoded_data
+            elif kind == SUBTREE:
+                id_, max_depth, max_count = _SUBTREE.unpack(payload)
+                encoded_data = await loop.run_in_executor(None, self._manager.checkout_subtree,
+                                                          int.from_bytes(id_, "little"),
+                                                          max_depth if max_depth >= 0 else None,
+                                                          max_count or None)
+                response = encoded_data or b""
+            elif kind == CHILDREN:
+                parent_ids = [int.from_bytes(payload[i:i + 16], "little") for i in range(0, len(payload), 16)]
+                response = await loop.run_in_executor(None, self._manager.checkout_children, parent_ids)
+            elif kind == VERSION:
+                response = _VERSION.pack(self._manager.get_version())
+            elif kind == RESERVE:
+                response = _VERSION.pack(self._manager.reserve_ids(_VERSION.unpack(payload)[0]))
+            else:
+                raise DataServiceException("unknown request kind {}".format(kind))
+            kind = _OK
+        except Exception as e:
+            kind, response = _ERROR, str(e).encode("utf-8")
+
+        async with write_lock:
+            writer.write(_FRAME.pack(kind, number, len(response)) + response)
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+    async def _apply_commits(self) -> None:
+        """
+        Applies received commits by batches, each batch as single database commit.
+        :return: None
+        """
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = [await self._commits.get()]
+            while len(batch) < self._batch_size and not self._commits.empty():
+                batch.append(self._commits.get_nowait())
+            try:
+                results = await loop.run_in_executor(None, self._manager.commit_batch,
+                                                     [payload for payload, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            finally:
+                for _ in batch:
+                    self._commits.task_done()
+
+
+class DataServiceClient(object):
+    """
+    Asynchronous client of the DataService.
+    Requests can be sent concurrently over one connection, each call waits only for own response.
+    Methods have the same results as methods of DataSessionManager.
+    """
+    def __init__(self):
+        """
+        DataServiceClient constructor. Client must be connected before requests.
+        """
+        self._reader = None
+        self._writer = None
+        self._receiver = None
+        self._numbers = itertools.count()
+        # waiting requests: request number -> future
+        self._waiting = {}
+
+    async def connect(self, path: str) -> None:
+        """
+        Connects to the service.
+        :param path: path to the unix domain socket
+        :return: None
+        """
+        self._reader, self._writer = await asyncio.open_unix_connection(path)
+        self._receiver = asyncio.ensure_future(self._receive())
+
+    async def close(self) -> None:
+        """
+        Closes connection. Waiting requests are failed.
+        :return: None
+        """
+        if self._writer is None:
+            return
+        self._writer.close()
+        await self._receiver
+        self._writer = None
+
+    async def _receive(self) -> None:
+        """
+        Reads responses and passes them to the waiting requests.
+        :return: None
+        """
+        while True:
+            frame = await _read_frame(self._reader)
+            if frame is None:
+                break
+            kind, number, payload = frame
+            future = self._waiting.pop(number, None)
+            if future is None or future.done():
+                continue
+            if kind == _ERROR:
+                future.set_exception(DataServiceException(str(payload, "utf-8")))
+            else:
+                future.set_result(payload)
+
+        for future in self._waiting.values():
+            if not future.done():
+                future.set_exception(DataServiceException("connection closed"))
+        self._waiting.clear()
+
+    async def _request(self, kind: int, payload: bytes) -> bytes:
+        """
+        Sends request and waits for response.
+        :exception DataServiceException: raised when request failed or connection closed.
+        :param kind: kind of the request
+        :param payload: request payload
+        :return: response payload
+        """
+        if self._writer is None or self._receiver.done():
+            raise DataServiceException("client is not connected")
+        number = next(self._numbers) & 0xFFFFFFFF
+        future = asyncio.get_event_loop().create_future()
+        self._waiting[number] = future
+        self._writer.write(_FRAME.pack(kind, number, len(payload)) + payload)
+        await self._writer.drain()
+        return await future
+
+    async def checkout(self, id_: int) -> Optional[bytes]:
+        """
+        Requests encoded Data of the database node.
+        :param id_: id of the node
+        :return: encoded list of single Data with children count, None if node not found
+        """
+        response = await self._request(CHECKOUT, id_.to_bytes(16, "little"))
+        return response or None
+
+    async def checkout_subtree(self, id_: int, max_depth=None, max_count=None) -> Optional[bytes]:
+        """
+        Requests encoded Data of the database subtree.
+        :param id_: id of the subtree root
+        :param max_depth: deepest level, root has level 0. None for whole subtree
+        :param max_count: maximal count of the Data. None for whole subtree
+        :return: encoded list of Data, None if node not found
+        """
+        payload = _SUBTREE.pack(id_.to_bytes(16, "little"), -1 if max_depth is None else max_depth, max_count or 0)
+        response = await self._request(SUBTREE, payload)
+        return response or None
+
+    async def checkout_children(self, parent_ids: List[int]) -> bytes:
+        """
+        Requests encoded Data of the children of several database nodes.
+        :param parent_ids: ids of the parent nodes
+        :return: encoded list of Data with children counts
+        """
+        return await self._request(CHILDREN, b"".join(id_.to_bytes(16, "little") for id_ in parent_ids))
+
+    async def commit(self, encoded_data: bytes) -> Tuple[int, bytes]:
+        """
+        Sends changes of the cache.
+        :param encoded_data: encoded list of changed Data
+        :return: version of the commit and encoded list of conflicting Data
+        """
+        response = await self._request(COMMIT, encoded_data)
+        return _VERSION.unpack_from(response)[0], response[_VERSION.size:]
+
+    async def get_changes_since(self, version: int) -> Tuple[bytes, int]:
+        """
+        Requests Data changed after selected version.
+        :param version: last version known by cache
+        :return: encoded list of changed Data and current version
+        """
+        response = await self._request(CHANGES, _VERSION.pack(version))
+        return response[_VERSION.size:], _VERSION.unpack_from(response)[0]
+
+    async def get_version(self) -> int:
+        """
+        Requests number of the last database commit.
+        :return: version
+        """
+        return _VERSION.unpack(await self._request(VERSION, b""))[0]
+
+    async def reserve_ids(self, count: int) -> int:
+        """
+        Reserves range of the ids for new Data.
+        :param count: count of the reserved ids
+        :return: first id of the reserved range
+        """
+        return _VERSION.unpack(await self._request(RESERVE, _VERSION.pack(count)))[0]
+
+
+class DataServiceConnection(object):
+    """
+    Blocking connection to the DataService for code without event loop, e.g. Qt window.
+    Client runs in the event loop of the background thread.
+    Connection can be passed to DataCacheSession instead of DataSessionManager.
+    While connection is opened, new Data of the process takes ids reserved in the database.
+    """
+    def __init__(self, path: str):
+        """
+        DataServiceConnection constructor. Connects to the service.
+        :param path: path to the unix domain socket
+        """
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        self._client = DataServiceClient()
+        self._call(self._client.connect(path))
+        self._id_generator = RangeIdGenerator(self.reserve_ids)
+        self._previous_id_generator = get_id_generator()
+        set_id_generator(self._id_generator)
+
+    def _call(self, coroutine):
+        """
+        Runs coroutine in the loop of the client and waits for result.
+        :param coroutine: coroutine of the client
+        :return: result of the coroutine
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def close(self) -> None:
+        """
+        Closes connection and stops the client thread.
+        :return: None
+        """
+        if get_id_generator() is self._id_generator:
+            set_id_generator(self._previous_id_generator)
+        self._call(self._client.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def checkout(self, id_: int) -> Optional[bytes]:
+        return self._call(self._client.checkout(id_))
+
+    def checkout_subtree(self, id_: int, max_depth=None, max_count=None) -> Optional[bytes]:
+        return self._call(self._client.checkout_subtree(id_, max_depth, max_count))
+
+    def checkout_children(self, parent_ids: List[int]) -> bytes:
+        return self._call(self._client.checkout_children(parent_ids))
+
+    def commit(self, encoded_data: bytes) -> Tuple[int, bytes]:
+        return self._call(self._client.commit(encoded_data))
+
+    def get_changes_since(self, version: int) -> Tuple[bytes, int]:
+        return self._call(self._client.get_changes_since(version))
+
+    def get_version(self) -> int:
+        return self._call(self._client.get_version())
+
+    def reserve_ids(self, count: int) -> int:
+        return self._call(self._client.reserve_ids(count))
+
+    def get_id_generator(self) -> IdGenerator:
+        """
+        Getter for generator of the ids reserved through that connection.
+        :return: RangeIdGenerator
+        """
+        return self._id_generator
+
+
+if __name__ == "__main__":
+    # arguments: path to the socket, path to the database commit log
+    # or --storage and path to the sqlite database file
+    if sys.argv[2] == "--storage":
+        from data_session import DataStorageSessionManager
+        from data_storage import DataStorage
+
+        storage = DataStorage(sys.argv[3])
+        manager = DataStorageSessionManager(storage)
+        close = storage.close
+    else:
+        from data_controller import DataNodeController
+        from data_log import DataCommitLog
+
+        controller = DataNodeController()
+        commit_log = DataCommitLog(sys.argv[2])
+        nodes = commit_log.recover(controller)
+        manager = DataSessionManager(nodes, controller, commit_log)
+        close = commit_log.close
+    service = DataService(manager)
+    try:
+        asyncio.run(service.serve_forever(sys.argv[1]))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close()
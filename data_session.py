@@ -0,0 +1,467 @@
+#!/bin/python
+# -*- coding: utf-8 -*-
+
+import threading
+from typing import List, Optional, Tuple
+
+from data import Data, set_id_generator
+from id_generator import IdGenerator, RangeIdGenerator, SequenceIdGenerator
+from data_node import DataNode
+from data_controller import DataNodeController
+from data_cache import DataCacheController
+from data_serializer import DataBinaryEncoder, DataBinaryDecoder
+from data_versions import DataVersionStore
+from data_storage import DataStorage
+
+
+def _validate_batch(data_lists: List[List[Data]], check_versions) -> Tuple[List[Data], List[List[Data]]]:
+    """
+    Validates changes received from several caches in order, so Data accepted
+    from previous changes conflicts with the same Data in next ones.
+    :param data_lists: list of lists of changed Data
+    :param check_versions: callable validating versions of one list, returns accepted and conflicting Data
+    :return: list of accepted Data of all changes and list of conflicting Data for each changes
+    """
+    batch_ids = set()
+    accepted = []
+    conflicts_list = []
+    for data_list in data_lists:
+        request_accepted, conflicts = check_versions(data_list)
+        request_ids = set()
+        for data in request_accepted:
+            if data.get_id() in batch_ids:
+                conflicts.append(data)
+            else:
+                accepted.append(data)
+                request_ids.add(data.get_id())
+        batch_ids |= request_ids
+        conflicts_list.append(conflicts)
+    return accepted, conflicts_list
+
+
+class DataSessionManager(object):
+    """
+    Database side of the cache sessions.
+    Any count of the caches can work with one database tree: caches don't lock
+    the nodes while editing, instead each commit is validated with versions
+    of the Data (optimistic concurrency). Conflicting Data is rejected and reported,
+    other Data of the same commit is applied.
+    Data is transferred in binary format, as it would be sent to other process.
+    Lock is held only for validation and apply of the commit. Reads are made from
+    snapshot of the last published version, so they don't wait for commits.
+    """
+    def __init__(self, nodes: List[DataNode], controller: DataNodeController, commit_log=None):
+        """
+        DataSessionManager constructor.
+        :param nodes: list of the database root nodes
+        :param controller: controller of the database nodes
+        :param commit_log: write-ahead log of the database commits
+        """
+        self._nodes = nodes
+        self._controller = controller
+        self._commit_log = commit_log
+        self._encoder = DataBinaryEncoder()
+        self._decoder = DataBinaryDecoder()
+        self._lock = threading.Lock()
+        self._versions = DataVersionStore(nodes, controller)
+        # ids for new Data of all caches are reserved in one sequence, started after existing ids
+        self._ids = SequenceIdGenerator(max(controller.get_index(), default=0) + 1)
+        self._id_generator = RangeIdGenerator(self.reserve_ids)
+
+    def get_nodes(self) -> List[DataNode]:
+        """
+        Getter for database root nodes.
+        :return: list of the root nodes
+        """
+        return self._nodes
+
+    def get_version(self) -> int:
+        """
+        Getter for number of the last published database commit.
+        :return: version
+        """
+        return self._versions.get_version()
+
+    def reserve_ids(self, count: int) -> int:
+        """
+        Reserves range of the ids for new Data of the cache.
+        :param count: count of the reserved ids
+        :return: first id of the reserved range
+        """
+        return self._ids.reserve(count)
+
+    def get_id_generator(self) -> IdGenerator:
+        """
+        Getter for generator of the ids for new Data of the caches in that process.
+        :return: generator taking ids from the ranges reserved with reserve_ids
+        """
+        return self._id_generator
+
+    def open_session(self):
+        """
+        Creates new cache session synchronized with current database version.
+        :return: DataCacheSession
+        """
+        return DataCacheSession(self)
+
+    def checkout(self, id_: int) -> Optional[bytes]:
+        """
+        Encodes Data of the database node for the cache.
+        Inherited disabled state is written to the Data.
+        :param id_: id of the node
+        :return: encoded list of single Data with children count, None if node not found
+        """
+        with self._versions.open_snapshot() as snapshot:
+            data = snapshot.get_data(id_)
+            if data is None:
+                return None
+            counts = snapshot.get_children_counts([data])
+        return self._encoder.encode_with_counts([data], counts)
+
+    def checkout_subtree(self, id_: int, max_depth=None, max_count=None) -> Optional[bytes]:
+        """
+        Encodes Data of the database subtree for the cache as single batch.
+        Parents are placed before children, inherited disabled state is written to the Data.
+        :param id_: id of the subtree root
+        :param max_depth: deepest level, root has level 0. None for whole subtree
+        :param max_count: maximal count of the Data. None for whole subtree
+        :return: encoded list of Data with children counts, None if node not found
+        """
+        with self._versions.open_snapshot() as snapshot:
+            data_list = snapshot.get_subtree(id_, max_depth, max_count)
+            counts = snapshot.get_children_counts(data_list)
+        if not data_list:
+            return None
+        return self._encoder.encode_with_counts(data_list, counts)
+
+    def checkout_children(self, parent_ids: List[int]) -> bytes:
+        """
+        Encodes Data of the children of several database nodes for the cache as single batch.
+        Children are placed in order of the parents.
+        :param parent_ids: ids of the parent nodes
+        :return: encoded list of Data with children counts
+        """
+        with self._versions.open_snapshot() as snapshot:
+            data_list = []
+            for parent_id in parent_ids:
+                data_list.extend(snapshot.get_children(parent_id))
+            counts = snapshot.get_children_counts(data_list)
+        return self._encoder.encode_with_counts(data_list, counts)
+
+    def commit(self, encoded_data: bytes) -> Tuple[int, bytes]:
+        """
+        Validates and applies changes received from the cache.
+        Accepted Data is written to the commit log and applied as single commit.
+        :param encoded_data: encoded list of changed Data
+        :return: version of the commit and encoded list of conflicting Data
+        """
+        return self.commit_batch([encoded_data])[0]
+
+    def commit_batch(self, encoded_list: List[bytes]) -> List[Tuple[int, bytes]]:
+        """
+        Validates changes received from several caches and applies them as single commit.
+        Changes are validated in order, so Data accepted from previous changes
+        conflicts with the same Data in next ones.
+        Result is returned when commit record is written to the disk, lock is released before waiting,
+        so commits of concurrent sessions share one fsync of the commit log.
+        :param encoded_list: list of encoded lists of changed Data
+        :return: version of the commit and encoded list of conflicting Data for each changes
+        """
+        data_lists = [self._decoder.decode(encoded_data) for encoded_data in encoded_list]
+        with self._lock:
+            accepted, conflicts_list = _validate_batch(data_lists, self._controller.check_versions)
+            version = self._controller.get_version()
+            sequence = None
+            if accepted:
+                if self._commit_log is not None:
+                    sequence = self._commit_log.append(accepted)
+                version = self._controller.commit_data_list(self._nodes, accepted)
+                self._versions.publish(version, accepted)
+        if sequence is not None:
+            # commits of other threads are appended meanwhile and synced by the same fsync
+            self._commit_log.wait_synced(sequence)
+        return [(version, self._encoder.encode(conflicts)) for conflicts in conflicts_list]
+
+    def get_changes_since(self, version: int) -> Tuple[bytes, int]:
+        """
+        Encodes Data changed after selected version.
+        :param version: last version known by cache
+        :return: encoded list of changed Data and current version
+        """
+        with self._versions.open_snapshot() as snapshot:
+            changes = snapshot.get_changes_since(version)
+        return self._encoder.encode(changes), snapshot.get_version()
+
+
+class DataStorageSessionManager(object):
+    """
+    Database side of the cache sessions with Data stored in DataStorage,
+    so database lives on disk and is not limited by memory.
+    Interface and commit validation are the same as of DataSessionManager,
+    reads are made with set-based queries of the storage.
+    Storage connection is shared, so reads wait for commits being applied,
+    version of the last commit is cached and is read without waiting.
+    """
+    def __init__(self, storage: DataStorage):
+        """
+        DataStorageSessionManager constructor.
+        :param storage: storage of the database Data
+        """
+        self._storage = storage
+        # version of the last commit, read without lock, so version requests don't wait for commits
+        self._version = storage.get_version()
+        self._encoder = DataBinaryEncoder()
+        self._decoder = DataBinaryDecoder()
+        self._lock = threading.Lock()
+        # ids for new Data of all caches are reserved in one sequence, started after stored ids
+        self._ids = SequenceIdGenerator(storage.get_max_id() + 1)
+        self._id_generator = RangeIdGenerator(self.reserve_ids)
+
+    def get_storage(self) -> DataStorage:
+        """
+        Getter for storage of the database Data.
+        :return: DataStorage
+        """
+        return self._storage
+
+    def get_version(self) -> int:
+        """
+        Getter for number of the last database commit.
+        :return: version
+        """
+        return self._version
+
+    def reserve_ids(self, count: int) -> int:
+        """
+        Reserves range of the ids for new Data of the cache.
+        :param count: count of the reserved ids
+        :return: first id of the reserved range
+        """
+        return self._ids.reserve(count)
+
+    def get_id_generator(self) -> IdGenerator:
+        """
+        Getter for generator of the ids for new Data of the caches in that process.
+        :return: generator taking ids from the ranges reserved with reserve_ids
+        """
+        return self._id_generator
+
+    def open_session(self):
+        """
+        Creates new cache session synchronized with current database version.
+        :return: DataCacheSession
+        """
+        return DataCacheSession(self)
+
+    def checkout(self, id_: int) -> Optional[bytes]:
+        """
+        Encodes stored Data for the cache.
+        :param id_: id of the Data
+        :return: encoded list of single Data with children count, None if Data not found
+        """
+        with self._lock:
+            data = self._storage.get_data(id_)
+            if data is None:
+                return None
+            counts = self._storage.get_children_counts([id_])
+        return self._encoder.encode_with_counts([data], counts)
+
+    def checkout_subtree(self, id_: int, max_depth=None, max_count=None) -> Optional[bytes]:
+        """
+        Encodes stored subtree for the cache as single batch.
+        Parents are placed before children.
+        :param id_: id of the subtree root
+        :param max_depth: deepest level, root has level 0. None for whole subtree
+        :param max_count: maximal count of the Data. None for whole subtree
+        :return: encoded list of Data with children counts, None if Data not found
+        """
+        with self._lock:
+            data_list = self._storage.get_subtree(id_, max_depth, max_count)
+            counts = self._storage.get_children_counts([data.get_id() for data in data_list])
+        if not data_list:
+            return None
+        return self._encoder.encode_with_counts(data_list, counts)
+
+    def checkout_children(self, parent_ids: List[int]) -> bytes:
+        """
+        Encodes stored children of several Data for the cache as single batch.
+        Children are placed in order of the parents.
+        :param parent_ids: ids of the parent Data
+        :return: encoded list of Data with children counts
+        """
+        with self._lock:
+            data_list = self._storage.get_children(parent_ids)
+            counts = self._storage.get_children_counts([data.get_id() for data in data_list])
+        return self._encoder.encode_with_counts(data_list, counts)
+
+    def commit(self, encoded_data: bytes) -> Tuple[int, bytes]:
+        """
+        Validates and applies changes received from the cache as single transaction.
+        :param encoded_data: encoded list of changed Data
+        :return: version of the commit and encoded list of conflicting Data
+        """
+        return self.commit_batch([encoded_data])[0]
+
+    def commit_batch(self, encoded_list: List[bytes]) -> List[Tuple[int, bytes]]:
+        """
+        Validates changes received from several caches and applies them as single transaction,
+        with semantics of DataSessionManager.commit_batch.
+        :param encoded_list: list of encoded lists of changed Data
+        :return: version of the commit and encoded list of conflicting Data for each changes
+        """
+        data_lists = [self._decoder.decode(encoded_data) for encoded_data in encoded_list]
+        with self._lock:
+            accepted, conflicts_list = _validate_batch(data_lists, self._storage.check_versions)
+            version = self._version
+            if accepted:
+                version = self._storage.commit_data_list(accepted)
+                self._version = version
+        return [(version, self._encoder.encode(conflicts)) for conflicts in conflicts_list]
+
+    def get_changes_since(self, version: int) -> Tuple[bytes, int]:
+        """
+        Encodes stored Data changed after selected version.
+        :param version: last version known by cache
+        :return: encoded list of changed Data and current version
+        """
+        with self._lock:
+            changes = self._storage.get_changes_since(version)
+            current = self._storage.get_version()
+        return self._encoder.encode(changes), current
+
+
+class DataCacheSession(object):
+    """
+    Cache of the database nodes used by one editor.
+    Session keeps own nodes and controller, checked out Data keeps database version,
+    so session changes are validated against it on commit.
+    With DataCacheController children of the checked out nodes are loaded on first access.
+    New Data takes ids reserved in the database, so caches of different processes
+    never create Data with the same id.
+    """
+    def __init__(self, manager, controller: DataNodeController = None):
+        """
+        DataCacheSession constructor.
+        :param manager: manager of the database or DataServiceConnection to it
+        :param controller: controller of the cache nodes, e.g. DataCacheController with capacity.
+                           New DataNodeController by default
+        """
+        self._manager = manager
+        self._controller = controller or DataNodeController()
+        self._nodes = []
+        # database version which cache was synchronized with
+        self._version = manager.get_version()
+        self._encoder = DataBinaryEncoder()
+        self._decoder = DataBinaryDecoder()
+        set_id_generator(manager.get_id_generator())
+        if isinstance(self._controller, DataCacheController):
+            self._controller.set_loader(self._load_children)
+
+    def get_nodes(self) -> List[DataNode]:
+        """
+        Getter for cache root nodes.
+        :return: list of the root nodes
+        """
+        return self._nodes
+
+    def get_controller(self) -> DataNodeController:
+        """
+        Getter for controller of the cache nodes.
+        :return: DataNodeController
+        """
+        return self._controller
+
+    def get_version(self) -> int:
+        """
+        Getter for database version which cache was synchronized with.
+        :return: version
+        """
+        return self._version
+
+    def checkout(self, id_: int) -> bool:
+        """
+        Appends database node to the cache.
+        If cache already has that node, nothing will be appended.
+        :param id_: id of the node
+        :return: True if node found in database
+        """
+        encoded_data = self._manager.checkout(id_)
+        if encoded_data is None:
+            return False
+
+        data_list, counts = self._decoder.decode_with_counts(encoded_data)
+        data = data_list[0]
+        if isinstance(self._controller, DataCacheController):
+            self._controller.set_children_counts(data_list, counts)
+        if not self._controller.node_list_has_data(self._nodes, data):
+            self._nodes.append(DataNode(instance=data))
+            self._controller.update_node_hierarchy(self._nodes, remove_from_list=True)
+        return True
+
+    def checkout_subtree(self, id_: int, max_depth=None, max_count=None) -> int:
+        """
+        Appends database subtree to the cache in one request and one pass.
+        Nodes which cache already has are not changed.
+        :param id_: id of the subtree root
+        :param max_depth: deepest level, root has level 0. None for whole subtree
+        :param max_count: maximal count of the nodes. None for whole subtree
+        :return: count of the appended nodes
+        """
+        encoded_data = self._manager.checkout_subtree(id_, max_depth, max_count)
+        if encoded_data is None:
+            return 0
+        return self._append_with_counts(encoded_data)
+
+    def _load_children(self, parent_ids: List[int]) -> None:
+        """
+        Loader of the DataCacheController, appends children of the cache nodes in one request.
+        :param parent_ids: ids of the parent nodes
+        :return: None
+        """
+        self._append_with_counts(self._manager.checkout_children(parent_ids))
+
+    def _append_with_counts(self, encoded_data: bytes) -> int:
+        """
+        Appends Data received with children counts to the cache.
+        :param encoded_data: encoded list of Data with children counts
+        :return: count of the appended nodes
+        """
+        data_list, counts = self._decoder.decode_with_counts(encoded_data)
+        if isinstance(self._controller, DataCacheController):
+            self._controller.set_children_counts(data_list, counts)
+        return self._controller.append_data_list(self._nodes, data_list)
+
+    def commit(self) -> List[Data]:
+        """
+        Sends changes of the cache to the database, then synchronizes cache.
+        Conflicting Data is replaced in cache with database state by synchronization,
+        so returned list is the only copy of the rejected changes.
+        :return: list of conflicting Data
+        """
+        changes = self._controller.collect_changes(self._nodes)
+        if not changes:
+            return []
+
+        version, encoded_conflicts = self._manager.commit(self._encoder.encode(changes))
+        conflicts = self._decoder.decode(encoded_conflicts)
+        rejected = {data.get_id() for data in conflicts}
+        for data in changes:
+            if data.get_id() not in rejected:
+                data.set_version(version)
+                data.clear_changes()
+
+        self.refresh()
+        return conflicts
+
+    def refresh(self) -> None:
+        """
+        Updates cache nodes with database changes made since last synchronization.
+        Not committed changes of the updated nodes are replaced with database state,
+        so node disabled by rejected delete is enabled again.
+        :return: None
+        """
+        encoded_data, version = self._manager.get_changes_since(self._version)
+        self._controller.update_node_list_with_data_list(nodes_list=self._nodes,
+                                                         data_list=self._decoder.decode(encoded_data),
+                                                         append_new=False, restore_enabled=True)
+        self._version = version
@@ -0,0 +1,356 @@
+#!/bin/python
+# -*- coding: utf-8 -*-
+
+import mmap
+import os
+import struct
+from bisect import bisect_left
+from collections import deque
+from typing import Iterable, List, Optional
+
+from data import Data
+from data_node import DataNode
+
+
+class DataSnapshotException(Exception):
+    """
+    Common exception for DataSnapshot
+    """
+    def __init__(self, *args, **kwargs):
+        Exception.__init__(self, *args, **kwargs)
+
+
+# file header: magic, format version, records count, roots count, user sequence number, commit version
+_HEADER = struct.Struct("<4sIQQQQ")
+_MAGIC = b"DSNP"
+_FORMAT = 2
+# node record: id, parent id, parent index, first child index, version,
+# value offset in the heap, children count, value length, flags
+_RECORD = struct.Struct("<16s16sqqQQIIB7x")
+# id table entry: id, record index. Table is sorted by id
+_ID_ENTRY = struct.Struct("<16sQ")
+# flags of the node record
+_ENABLED = 1
+_HAS_PARENT = 2
+_HAS_VALUE = 4
+
+
+def _id_bytes(id_: int) -> bytes:
+    # big-endian, so byte comparison of ids is the same as int comparison
+    return id_.to_bytes(16, "big")
+
+
+class _IdTable(object):
+    """
+    Sequence view of the ids in id table, used for binary search.
+    """
+    def __init__(self, buffer, offset: int, count: int):
+        self._buffer = buffer
+        self._offset = offset
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, position: int) -> bytes:
+        start = self._offset + position * _ID_ENTRY.size
+        return self._buffer[start:start + 16]
+
+
+class DataSnapshot(object):
+    """
+    Read-only snapshot of the Data trees in file opened with mmap.
+    File holds fixed-width node records in breadth-first order of all trees,
+    so children of each node are contiguous, sorted id table and heap of the values.
+    Records are read from the file only when requested, nothing is deserialized on open.
+    DataNodes are built lazily: node is built with all it siblings when it is requested,
+    so each built node has either all or none of it children built.
+    """
+    def __init__(self, path: str, controller=None):
+        """
+        DataSnapshot constructor.
+        Opens snapshot file written by DataSnapshot.write.
+        :exception DataSnapshotException: raised when file is not a snapshot.
+        :param path: path to the snapshot file
+        :param controller: DataNodeController, built nodes are appended to it index
+        """
+        self._file = open(path, "rb")
+        try:
+            self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as e:
+            self._file.close()
+            raise DataSnapshotException("empty snapshot file") from e
+        if len(self._buffer) < _HEADER.size:
+            self.close()
+            raise DataSnapshotException("{} is not a snapshot file".format(path))
+        magic, format_, self._count, self._roots_count, self._sequence, self._version = \
+            _HEADER.unpack_from(self._buffer, 0)
+        if magic != _MAGIC or format_ != _FORMAT:
+            self.close()
+            raise DataSnapshotException("{} is not a snapshot file".format(path))
+        self._id_table_offset = _HEADER.size + self._count * _RECORD.size
+        self._heap_offset = self._id_table_offset + self._count * _ID_ENTRY.size
+        self._ids = _IdTable(self._buffer, self._id_table_offset, self._count)
+
+        self._controller = controller
+        # built nodes: record index -> DataNode, and id of the Data -> record index
+        self._nodes = {}
+        self._indices = {}
+        # indices of the records which children are built
+        self._expanded = set()
+
+    @staticmethod
+    def write(path: str, data_list: Iterable[Data], sequence=0, version=0) -> None:
+        """
+        Writes Data trees to the snapshot file.
+        Children order is kept from data_list, Data which parent is not in the list is root.
+        File is written near and replaces previous snapshot when complete.
+        :param path: path to the snapshot file
+        :param data_list: Data of the trees, any iterable
+        :param sequence: number stored in the header, e.g. last commit included into snapshot
+        :param version: commit version of the trees, stored in the header
+        :return: None
+        """
+        data_list = list(data_list)
+        known = {data.get_id() for data in data_list}
+        children = {}
+        roots = []
+        for data in data_list:
+            parent_id = data.get_parent_id()
+            if parent_id is not None and parent_id in known and parent_id != data.get_id():
+                children.setdefault(parent_id, []).append(data)
+            else:
+                roots.append(data)
+
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.write(_HEADER.pack(_MAGIC, _FORMAT, 0, len(roots), sequence, version))
+            pack = _RECORD.pack
+            values = []
+            ids = []
+            heap_size = 0
+            queue = deque((data, -1) for data in roots)
+            # index of the next record appended to the queue
+            next_index = len(roots)
+            index = 0
+            while queue:
+                data, parent_index = queue.popleft()
+                flags = _ENABLED if data.is_enabled() else 0
+                parent_id = data.get_parent_id()
+                if parent_id is None:
+                    parent_id = 0
+                else:
+                    flags |= _HAS_PARENT
+                value_bytes = b""
+                if data.get_value() is not None:
+                    flags |= _HAS_VALUE
+                    value_bytes = data.get_value().encode("utf-8")
+                node_children = children.get(data.get_id(), ())
+                file.write(pack(_id_bytes(data.get_id()), _id_bytes(parent_id), parent_index, next_index,
+                                data.get_version(), heap_size, len(node_children), len(value_bytes), flags))
+                queue.extend((child, index) for child in node_children)
+                next_index += len(node_children)
+                values.append(value_bytes)
+                heap_size += len(value_bytes)
+                ids.append((_id_bytes(data.get_id()), index))
+                index += 1
+
+            ids.sort()
+            pack_entry = _ID_ENTRY.pack
+            file.writelines(pack_entry(id_, index) for id_, index in ids)
+            file.writelines(values)
+
+            file.seek(0)
+            file.write(_HEADER.pack(_MAGIC, _FORMAT, index, len(roots), sequence, version))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+
+    def close(self) -> None:
+        """
+        Closes snapshot file. Built nodes stay valid.
+        :return: None
+        """
+        self._buffer.close()
+        self._file.close()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def get_sequence(self) -> int:
+        """
+        Getter for number stored in the header.
+        :return: sequence number passed to write
+        """
+        return self._sequence
+
+    def get_version(self) -> int:
+        """
+        Getter for commit version stored in the header.
+        :return: version passed to write
+        """
+        return self._version
+
+    def find(self, id_: int) -> Optional[int]:
+        """
+        Searches record of the Data by id with binary search in id table.
+        :param id_: id of the searched Data
+        :return: record index, None if Data is not in snapshot
+        """
+        key = _id_bytes(id_)
+        position = bisect_left(self._ids, key)
+        if position == self._count or self._ids[position] != key:
+            return None
+        return _ID_ENTRY.unpack_from(self._buffer, self._id_table_offset + position * _ID_ENTRY.size)[1]
+
+    def _record(self, index: int) -> tuple:
+        """
+        Reads node record.
+        :param index: record index
+        :return: tuple of the record fields
+        """
+        if not 0 <= index < self._count:
+            raise IndexError("record index {} is out of range".format(index))
+        return _RECORD.unpack_from(self._buffer, _HEADER.size + index * _RECORD.size)
+
+    def get_data(self, index: int) -> Data:
+        """
+        Reads Data of the record. Each call creates new Data.
+        :param index: record index
+        :return: Data
+        """
+        id_, parent_id, _, _, version, offset, _, length, flags = self._record(index)
+        value = None
+        if flags & _HAS_VALUE:
+            start = self._heap_offset + offset
+            value = str(self._buffer[start:start + length], "utf-8")
+        return Data(value=value, parent_id=int.from_bytes(parent_id, "big") if flags & _HAS_PARENT else None,
+                    id_=int.from_bytes(id_, "big"), enabled=bool(flags & _ENABLED), version=version)
+
+    def get_parent_index(self, index: int) -> int:
+        """
+        Getter for record index of the parent.
+        :param index: record index
+        :return: parent record index, -1 for root
+        """
+        return self._record(index)[2]
+
+    def get_children_range(self, index: int) -> range:
+        """
+        Getter for record indices of the children.
+        :param index: record index
+        :return: range of the children record indices
+        """
+        record = self._record(index)
+        return range(record[3], record[3] + record[6])
+
+    def get_roots(self) -> List[DataNode]:
+        """
+        Builds root nodes, children are not built.
+        :return: list of the root nodes
+        """
+        return [self._build(index, None) for index in range(self._roots_count)]
+
+    def get_node(self, id_: int) -> Optional[DataNode]:
+        """
+        Builds node of the Data with all it ancestors and their siblings.
+        :param id_: id of the Data
+        :return: DataNode, None if Data is not in snapshot
+        """
+        index = self._indices.get(id_)
+        if index is None:
+            index = self.find(id_)
+            if index is None:
+                return None
+
+        path = []
+        while index >= 0 and index not in self._nodes:
+            path.append(index)
+            index = self.get_parent_index(index)
+        if index < 0:
+            self.get_roots()
+        for current in reversed(path):
+            parent_index = self.get_parent_index(current)
+            if parent_index >= 0:
+                self.load_children(self._nodes[parent_index])
+        return self._nodes[path[0] if path else index]
+
+    def is_loaded(self, node: DataNode) -> bool:
+        """
+        Checks if children of the built node are built.
+        :param node: built node
+        :return: True if node children are built
+        """
+        return self._indices[node.get_id()] in self._expanded
+
+    def load_children(self, node: DataNode) -> List[DataNode]:
+        """
+        Builds children of the built node.
+        :param node: built node
+        :return: list of the children nodes
+        """
+        index = self._indices[node.get_id()]
+        if index not in self._expanded:
+            self._expanded.add(index)
+            for child in self.get_children_range(index):
+                self._build(child, node)
+        return node.get_children()
+
+    def load(self) -> List[DataNode]:
+        """
+        Builds all nodes in single pass over records.
+        Records are in breadth-first order, so parent is built before it children.
+        Built trees are labeled by the interval index of the controller, if it is set.
+        :return: list of the root nodes
+        """
+        nodes = self._nodes
+        indices = self._indices
+        index_dict = self._controller.get_index() if self._controller is not None else {}
+        heap_offset = self._heap_offset
+        buffer = self._buffer
+        from_bytes = int.from_bytes
+        records = memoryview(buffer)[_HEADER.size:self._id_table_offset]
+        try:
+            for index, record in enumerate(_RECORD.iter_unpack(records)):
+                if index in nodes:
+                    continue
+                id_, parent_id, parent_index, _, version, offset, _, length, flags = record
+                value = None
+                if flags & _HAS_VALUE:
+                    start = heap_offset + offset
+                    value = str(buffer[start:start + length], "utf-8")
+                data = Data(value=value, parent_id=from_bytes(parent_id, "big") if flags & _HAS_PARENT else None,
+                            id_=from_bytes(id_, "big"), enabled=bool(flags & _ENABLED), version=version)
+                node = DataNode(instance=data)
+                if parent_index >= 0:
+                    nodes[parent_index].append_child(node)
+                nodes[index] = node
+                indices[data.get_id()] = index
+                index_dict[data.get_id()] = node
+        finally:
+            records.release()
+        self._expanded.update(range(self._count))
+        roots = [nodes[index] for index in range(self._roots_count)]
+        intervals = self._controller.get_intervals() if self._controller is not None else None
+        if intervals is not None:
+            intervals.append(roots)
+        return roots
+
+    def _build(self, index: int, parent: Optional[DataNode]) -> DataNode:
+        """
+        Builds node of the record and appends it to the parent.
+        :param index: record index
+        :param parent: built parent node, None for root
+        :return: DataNode
+        """
+        node = self._nodes.get(index)
+        if node is not None:
+            return node
+        node = DataNode(instance=self.get_data(index))
+        if parent is not None:
+            parent.append_child(node)
+        self._nodes[index] = node
+        self._indices[node.get_id()] = index
+        if self._controller is not None:
+            self._controller.get_index()[node.get_id()] = node
+        return node
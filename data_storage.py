@@ -0,0 +1,348 @@
+#!/bin/python
+# -*- coding: utf-8 -*-
+
+import sqlite3
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from data import Data
+
+
+class DataStorageException(Exception):
+    """
+    Common exception for DataStorage
+    """
+    def __init__(self, *args, **kwargs):
+        Exception.__init__(self, *args, **kwargs)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS data (
+    id INTEGER PRIMARY KEY,
+    parent_id INTEGER,
+    value TEXT,
+    enabled INTEGER NOT NULL,
+    version INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS data_parent ON data (parent_id);
+CREATE INDEX IF NOT EXISTS data_version ON data (version);
+CREATE TABLE IF NOT EXISTS closure (
+    ancestor INTEGER NOT NULL,
+    descendant INTEGER NOT NULL,
+    depth INTEGER NOT NULL,
+    PRIMARY KEY (ancestor, descendant)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS closure_descendant ON closure (descendant, depth);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+CREATE TEMP TABLE IF NOT EXISTS incoming (
+    id INTEGER PRIMARY KEY,
+    parent_id INTEGER,
+    value TEXT,
+    enabled INTEGER NOT NULL,
+    level INTEGER
+);
+CREATE INDEX IF NOT EXISTS temp.incoming_level ON incoming (level);
+"""
+
+_DATA_COLUMNS = "d.id, d.parent_id, d.value, d.enabled, d.version"
+# count of the ids bound to one IN list, below sqlite limit of the query parameters
+_IN_CHUNK = 500
+
+
+class DataStorage(object):
+    """
+    Database tier of the Data trees stored in sqlite.
+    Hierarchy is kept in closure table (ancestor, descendant, depth),
+    so subtree reads and subtree updates are single set-based statements.
+    Disabled state is stored materialized: all descendants of the disabled Data are disabled too,
+    so state of the parent is enough to disable appended Data.
+    Ids of the stored Data must fit signed 64-bit integer.
+    Temporary table of the received Data has no statistics, so joins are started from it with CROSS JOIN.
+    """
+    def __init__(self, path=":memory:"):
+        """
+        DataStorage constructor.
+        Opens database file and creates schema if required.
+        Connection can be used from any thread, but calls must be serialized by the caller.
+        :param path: path to the database file, in-memory database by default
+        """
+        # transactions are controlled explicitly
+        self._connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._connection.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        """
+        Closes database connection.
+        :return: None
+        """
+        self._connection.close()
+
+    def get_version(self) -> int:
+        """
+        Getter for number of the last commit.
+        :return: version, 0 if nothing was committed
+        """
+        return self._connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def get_data(self, id_: int) -> Optional[Data]:
+        """
+        Searches stored Data by id.
+        :param id_: id of the searched Data
+        :return: Data if stored, otherwise None
+        """
+        row = self._connection.execute("SELECT {} FROM data d WHERE d.id = ?".format(_DATA_COLUMNS),
+                                       (id_,)).fetchone()
+        return self._to_data(row) if row is not None else None
+
+    def get_roots(self) -> List[Data]:
+        """
+        Reads Data without stored parent.
+        :return: list of the root Data
+        """
+        return self._query("SELECT {} FROM data d WHERE NOT EXISTS "
+                           "(SELECT 1 FROM closure c WHERE c.descendant = d.id AND c.depth = 1)"
+                           .format(_DATA_COLUMNS))
+
+    def get_max_id(self) -> int:
+        """
+        Getter for the biggest id of the stored Data.
+        :return: id, 0 if nothing is stored
+        """
+        return self._connection.execute("SELECT COALESCE(MAX(id), 0) FROM data").fetchone()[0]
+
+    def get_subtree(self, id_: int, max_depth=None, max_count=None) -> List[Data]:
+        """
+        Reads Data with all it descendants.
+        Result is ordered by depth, so parents are placed before children.
+        :param id_: id of the subtree root
+        :param max_depth: deepest read level, root has level 0. None for whole subtree
+        :param max_count: maximal count of the Data, upper levels are read first. None for whole subtree
+        :return: list of Data, empty if root is not stored
+        """
+        sql = "SELECT {} FROM closure c JOIN data d ON d.id = c.descendant WHERE c.ancestor = ?"
+        parameters = [id_]
+        if max_depth is not None:
+            sql += " AND c.depth <= ?"
+            parameters.append(max_depth)
+        sql += " ORDER BY c.depth, d.id"
+        if max_count is not None:
+            sql += " LIMIT ?"
+            parameters.append(max_count)
+        return self._query(sql.format(_DATA_COLUMNS), parameters)
+
+    def get_children(self, parent_ids: List[int]) -> List[Data]:
+        """
+        Reads children of several Data.
+        :param parent_ids: ids of the parent Data
+        :return: list of Data, children are placed in order of the parents
+        """
+        children = defaultdict(list)
+        for chunk in self._chunks(parent_ids):
+            for data in self._query("SELECT {} FROM closure c JOIN data d ON d.id = c.descendant "
+                                    "WHERE c.depth = 1 AND c.ancestor IN ({}) ORDER BY d.id"
+                                    .format(_DATA_COLUMNS, ", ".join("?" * len(chunk))), chunk):
+                children[data.get_parent_id()].append(data)
+        return [data for parent_id in dict.fromkeys(parent_ids) for data in children.get(parent_id, ())]
+
+    def get_children_counts(self, ids: List[int]) -> List[int]:
+        """
+        Counts children of several Data.
+        :param ids: ids of the Data
+        :return: list of the children counts in order of the ids
+        """
+        counts = {}
+        for chunk in self._chunks(ids):
+            counts.update(self._connection.execute(
+                "SELECT ancestor, COUNT(*) FROM closure WHERE depth = 1 AND ancestor IN ({}) GROUP BY ancestor"
+                .format(", ".join("?" * len(chunk))), chunk))
+        return [counts.get(id_, 0) for id_ in ids]
+
+    def check_versions(self, data_list: Iterable[Data]) -> Tuple[List[Data], List[Data]]:
+        """
+        Validates update made on the copy of the stored Data (optimistic concurrency),
+        with semantics of DataNodeController.check_versions.
+        :param data_list: update data, any iterable of Data
+        :return: lists of accepted and conflicting Data
+        """
+        data_list = list(data_list)
+        versions = self._get_versions([data.get_id() for data in data_list])
+        accepted = []
+        conflicts = []
+        for data in data_list:
+            if versions.get(data.get_id(), 0) > data.get_version():
+                conflicts.append(data)
+            else:
+                accepted.append(data)
+        return accepted, conflicts
+
+    def is_ancestor(self, ancestor_id: int, id_: int) -> bool:
+        """
+        Checks if Data is stored in subtree of other Data.
+        :param ancestor_id: id of the subtree root
+        :param id_: id of the checked Data
+        :return: True if Data is in subtree, Data is in own subtree too
+        """
+        return self._connection.execute("SELECT 1 FROM closure WHERE ancestor = ? AND descendant = ?",
+                                        (ancestor_id, id_)).fetchone() is not None
+
+    def get_changes_since(self, version: int) -> List[Data]:
+        """
+        Reads Data changed by commits after selected version.
+        :param version: last version known by requester
+        :return: list of changed Data ordered by version
+        """
+        return self._query("SELECT {} FROM data d WHERE d.version > ? ORDER BY d.version"
+                           .format(_DATA_COLUMNS), (version,))
+
+    def commit_data_list(self, data_list: Iterable[Data], append_new=True) -> int:
+        """
+        Applies update to the stored Data as single transaction,
+        with semantics of DataNodeController.update_node_list_with_data_list:
+        values are updated, disabled Data disables it subtree,
+        new Data is appended and linked with stored parent and children.
+        Later element with same id replaces previous.
+        :exception DataStorageException: raised when Data id doesn't fit 64-bit integer.
+        :param data_list: update data, any iterable of Data
+        :param append_new: enabled by default, appends new Data
+        :return: version of the commit
+        """
+        cursor = self._connection.cursor()
+        try:
+            cursor.execute("BEGIN")
+            version = self.get_version() + 1
+            cursor.execute("UPDATE meta SET value = ? WHERE key = 'version'", (version,))
+
+            cursor.execute("DELETE FROM incoming")
+            cursor.executemany("INSERT OR REPLACE INTO incoming (id, parent_id, value, enabled) VALUES (?, ?, ?, ?)",
+                               ((data.get_id(), data.get_parent_id(), data.get_value(), data.is_enabled())
+                                for data in data_list))
+
+            cursor.execute("UPDATE data SET "
+                           "value = (SELECT i.value FROM incoming i WHERE i.id = data.id), "
+                           "enabled = enabled AND (SELECT i.enabled FROM incoming i WHERE i.id = data.id), "
+                           "version = ? "
+                           "WHERE id IN (SELECT id FROM incoming)", (version,))
+
+            if append_new:
+                self._append_new(cursor, version)
+
+            cursor.execute("UPDATE data SET enabled = 0, version = ? WHERE enabled = 1 AND id IN ("
+                           "SELECT s.descendant FROM incoming i CROSS JOIN closure s ON s.ancestor = i.id "
+                           "WHERE i.enabled = 0)", (version,))
+            cursor.execute("DELETE FROM incoming")
+            cursor.execute("COMMIT")
+        except OverflowError as e:
+            cursor.execute("ROLLBACK")
+            raise DataStorageException("Data id doesn't fit 64-bit integer") from e
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+        return version
+
+    def _append_new(self, cursor: sqlite3.Cursor, version: int) -> None:
+        """
+        Inserts received Data which is not stored yet and links it into hierarchy.
+        New Data is linked by levels, each level with one statement,
+        then stored orphans which parents were received are linked with their subtrees.
+        Linked subtrees are disabled when their parent is disabled.
+        :param cursor: cursor of the current transaction
+        :param version: version of the commit
+        :return: None
+        """
+        new_rows = cursor.execute("SELECT id, parent_id FROM incoming "
+                                  "WHERE id NOT IN (SELECT id FROM data)").fetchall()
+        if not new_rows:
+            return
+
+        cursor.execute("INSERT INTO data (id, parent_id, value, enabled, version) "
+                       "SELECT id, parent_id, value, enabled, ? FROM incoming "
+                       "WHERE id NOT IN (SELECT id FROM data)", (version,))
+
+        # level is distance to the nearest ancestor which is not new
+        new_ids = {id_ for id_, _ in new_rows}
+        children = defaultdict(list)
+        level = []
+        for id_, parent_id in new_rows:
+            if parent_id in new_ids and parent_id != id_:
+                children[parent_id].append(id_)
+            else:
+                level.append(id_)
+        levels = []
+        while level:
+            levels.append(level)
+            level = [child for id_ in level for child in children.get(id_, ())]
+
+        for number, level in enumerate(levels):
+            cursor.executemany("UPDATE incoming SET level = ? WHERE id = ?", ((number, id_) for id_ in level))
+        cursor.execute("INSERT INTO closure (ancestor, descendant, depth) "
+                       "SELECT id, id, 0 FROM incoming WHERE level IS NOT NULL")
+        for number in range(len(levels)):
+            cursor.execute("INSERT INTO closure (ancestor, descendant, depth) "
+                           "SELECT a.ancestor, i.id, a.depth + 1 FROM incoming i "
+                           "CROSS JOIN closure a ON a.descendant = i.parent_id "
+                           "WHERE i.level = ? AND i.parent_id != i.id", (number,))
+
+        # stored orphans: parent is new, but orphan itself was stored before
+        orphans = cursor.execute("SELECT d.id, d.parent_id FROM incoming i CROSS JOIN data d ON d.parent_id = i.id "
+                                 "WHERE i.level IS NOT NULL AND d.id NOT IN "
+                                 "(SELECT id FROM incoming WHERE level IS NOT NULL)").fetchall()
+        for id_, parent_id in orphans:
+            cursor.execute("INSERT INTO closure (ancestor, descendant, depth) "
+                           "SELECT a.ancestor, d.descendant, a.depth + d.depth + 1 "
+                           "FROM closure a, closure d WHERE a.descendant = ? AND d.ancestor = ?",
+                           (parent_id, id_))
+
+        cursor.execute("UPDATE data SET enabled = 0, version = ? WHERE enabled = 1 AND id IN ("
+                       "SELECT s.descendant FROM incoming i CROSS JOIN data p ON p.id = i.parent_id "
+                       "CROSS JOIN closure s ON s.ancestor = i.id WHERE i.level = 0 AND p.enabled = 0)",
+                       (version,))
+        for id_, parent_id in orphans:
+            cursor.execute("UPDATE data SET enabled = 0, version = ? WHERE enabled = 1 AND id IN ("
+                           "SELECT s.descendant FROM data p CROSS JOIN closure s ON s.ancestor = ? "
+                           "WHERE p.id = ? AND p.enabled = 0)", (version, id_, parent_id))
+
+    def _get_versions(self, ids: List[int]) -> Dict[int, int]:
+        """
+        Reads versions of the stored Data.
+        :param ids: ids of the Data
+        :return: dict with id -> version, only for stored Data
+        """
+        versions = {}
+        for chunk in self._chunks(ids):
+            versions.update(self._connection.execute("SELECT id, version FROM data WHERE id IN ({})"
+                                                     .format(", ".join("?" * len(chunk))), chunk))
+        return versions
+
+    @staticmethod
+    def _chunks(ids: List[int]) -> Iterable[List[int]]:
+        """
+        Splits ids for binding to IN lists.
+        Ids which don't fit signed 64-bit integer are never stored, so they are skipped.
+        :param ids: list of the ids
+        :return: iterator of the lists with at most _IN_CHUNK ids
+        """
+        ids = [id_ for id_ in ids if -(1 << 63) <= id_ < (1 << 63)]
+        for start in range(0, len(ids), _IN_CHUNK):
+            yield ids[start:start + _IN_CHUNK]
+
+    def _query(self, sql: str, parameters=()) -> List[Data]:
+        """
+        Executes query and converts rows to Data.
+        :param sql: query selecting data columns
+        :param parameters: query parameters
+        :return: list of Data
+        """
+        return [self._to_data(row) for row in self._connection.execute(sql, parameters)]
+
+    def _to_data(self, row) -> Data:
+        """
+        Converts data row to Data.
+        :param row: tuple of the data columns
+        :return: Data
+        """
+        id_, parent_id, value, enabled, version = row
+        return Data(value=value, parent_id=parent_id, id_=id_, enabled=bool(enabled), version=version)
@@ -0,0 +1,348 @@
+#!/bin/python
+# -*- coding: utf-8 -*-
+
+import itertools
+import threading
+from bisect import bisect_right
+from typing import List, Optional
+
+from data import Data
+from data_node import DataNode
+from data_controller import DataNodeController
+
+# fields of the Data state: commit which published state, Data version, value,
+# enabled flag, parent id, flag if node is linked to it parent
+_PUBLISHED = 0
+_VERSION = 1
+_VALUE = 2
+_ENABLED = 3
+_PARENT_ID = 4
+_LINKED = 5
+
+
+class DataVersionStore(object):
+    """
+    Multi-version copy of the database tree for readers.
+    Each commit publishes new states of the changed Data: states are immutable
+    tuples appended to the chain of the Data, so published version is never changed.
+    Reader takes snapshot of the published version and reads states of that version,
+    so it sees no partial commit and doesn't wait for commit being applied.
+    States which are not visible to any snapshot anymore are dropped on publish.
+    Writers must be serialized and must publish each commit with publish.
+    """
+    def __init__(self, nodes: List[DataNode], controller: DataNodeController):
+        """
+        DataVersionStore constructor.
+        Current state of the nodes is published with current controller version.
+        :param nodes: list of the root nodes
+        :param controller: controller of the nodes
+        """
+        self._controller = controller
+        self._version = controller.get_version()
+        # the first version which commits are in the log
+        self._log_start = self._version
+        # chains of the states: id -> list of states ordered by publish version
+        self._states = {}
+        # ids of the linked children: id -> list of ids, append only
+        self._children = {}
+        # parallel lists: published version and ids of the Data changed by it commit
+        self._log_versions = []
+        self._log_ids = []
+        # nodes changed by current commit: id -> DataNode
+        self._pending = {}
+        # ids of the Data with more than one state
+        self._multi = set()
+        # versions of the opened snapshots: handle number -> version
+        self._readers = {}
+        self._readers_lock = threading.Lock()
+        self._handles = itertools.count()
+
+        for root in nodes:
+            for node in root.walk():
+                self._append_state(node, self._version)
+        controller.add_listener(self._on_node_changed)
+
+    def get_version(self) -> int:
+        """
+        Getter for last published version.
+        :return: version
+        """
+        return self._version
+
+    def _on_node_changed(self, kind: int, node: DataNode) -> None:
+        """
+        Handler of the controller notifications, collects nodes changed by current commit.
+        :param kind: kind of the change
+        :param node: changed node
+        :return: None
+        """
+        self._pending[node.get_id()] = node
+
+    def publish(self, version: int, data_list: List[Data]) -> None:
+        """
+        Publishes state of the nodes after commit.
+        :param version: version of the commit
+        :param data_list: Data of the commit
+        :return: None
+        """
+        index = self._controller.get_index()
+        changed, self._pending = self._pending, {}
+        ids = []
+        for data in data_list:
+            node = index.get(data.get_id())
+            if node is not None:
+                changed[data.get_id()] = node
+                ids.append(data.get_id())
+
+        for node in changed.values():
+            self._append_state(node, version)
+        self._log_ids.append(ids)
+        self._log_versions.append(version)
+        self._version = version
+        self._reclaim()
+
+    def _append_state(self, node: DataNode, version: int) -> None:
+        """
+        Appends current state of the node to it chain.
+        :param node: changed node
+        :param version: version of the commit
+        :return: None
+        """
+        data = node.get_instance()
+        linked = node.get_parent_node() is not None
+        state = (version, data.get_version(), data.get_value(), data.is_enabled(), data.get_parent_id(), linked)
+        chain = self._states.get(data.get_id())
+        if chain is None:
+            self._states[data.get_id()] = [state]
+        else:
+            linked = linked and not chain[-1][_LINKED]
+            chain.append(state)
+            self._multi.add(data.get_id())
+        if linked:
+            self._children.setdefault(data.get_parent_id(), []).append(data.get_id())
+
+    def _reclaim(self) -> None:
+        """
+        Drops states older than the state visible to the oldest snapshot.
+        Chain is replaced, so readers which took old chain still can read it.
+        :return: None
+        """
+        with self._readers_lock:
+            oldest = min(self._readers.values(), default=self._version)
+        for id_ in list(self._multi):
+            chain = self._states[id_]
+            start = 0
+            while start + 1 < len(chain) and chain[start + 1][_PUBLISHED] <= oldest:
+                start += 1
+            if start > 0:
+                chain = chain[start:]
+                self._states[id_] = chain
+            if len(chain) == 1:
+                self._multi.discard(id_)
+
+    def open_snapshot(self):
+        """
+        Opens snapshot of the last published version.
+        Snapshot must be released when it is not used anymore.
+        :return: DataReadSnapshot
+        """
+        handle = next(self._handles)
+        with self._readers_lock:
+            version = self._version
+            self._readers[handle] = version
+        return DataReadSnapshot(self, handle, version)
+
+    def _release(self, handle: int) -> None:
+        """
+        Releases snapshot, it states can be dropped.
+        :param handle: number of the snapshot
+        :return: None
+        """
+        with self._readers_lock:
+            self._readers.pop(handle, None)
+
+    def _state(self, id_: int, version: int) -> Optional[tuple]:
+        """
+        Searches state of the Data visible in version.
+        :param id_: id of the Data
+        :param version: version of the snapshot
+        :return: state, None if Data was not published yet
+        """
+        chain = self._states.get(id_)
+        if chain is None:
+            return None
+        for state in reversed(chain):
+            if state[_PUBLISHED] <= version:
+                return state
+        return None
+
+
+class DataReadSnapshot(object):
+    """
+    Read handle of the published database version.
+    Returned Data are copies, inherited disabled state is written to them.
+    """
+    def __init__(self, store: DataVersionStore, handle: int, version: int):
+        """
+        DataReadSnapshot constructor. Created by DataVersionStore.open_snapshot.
+        :param store: store of the states
+        :param handle: number of the snapshot
+        :param version: version of the snapshot
+        """
+        self._store = store
+        self._handle = handle
+        self._version = version
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.release()
+
+    def release(self) -> None:
+        """
+        Releases snapshot.
+        :return: None
+        """
+        self._store._release(self._handle)
+
+    def get_version(self) -> int:
+        """
+        Getter for version of the snapshot.
+        :return: version
+        """
+        return self._version
+
+    def get_data(self, id_: int) -> Optional[Data]:
+        """
+        Reads Data in version of the snapshot.
+        :param id_: id of the Data
+        :return: Data, None if it was not published in that version
+        """
+        state = self._store._state(id_, self._version)
+        if state is None:
+            return None
+        return self._to_data(id_, state, self._is_enabled(state))
+
+    def get_children_ids(self, id_: int) -> List[int]:
+        """
+        Reads ids of the children linked in version of the snapshot.
+        :param id_: id of the parent Data
+        :return: list of the children ids
+        """
+        result = []
+        for child_id in list(self._store._children.get(id_, ())):
+            state = self._store._state(child_id, self._version)
+            if state is not None and state[_LINKED]:
+                result.append(child_id)
+        return result
+
+    def get_children(self, id_: int) -> List[Data]:
+        """
+        Reads Data of the children linked in version of the snapshot.
+        Children inherit state of the parent, so only own disabled state is written to them.
+        :param id_: id of the parent Data
+        :return: list of the children Data
+        """
+        return [self._to_data(child_id, self._store._state(child_id, self._version), True)
+                for child_id in self.get_children_ids(id_)]
+
+    def get_children_counts(self, data_list: List[Data]) -> List[int]:
+        """
+        Counts children linked in version of the snapshot.
+        :param data_list: list of Data
+        :return: children counts, parallel to data_list
+        """
+        return [len(self.get_children_ids(data.get_id())) for data in data_list]
+
+    def get_subtree(self, id_: int, max_depth=None, max_count=None) -> List[Data]:
+        """
+        Reads Data of the subtree level by level in version of the snapshot,
+        so parents are placed before children.
+        :param id_: id of the subtree root
+        :param max_depth: deepest level, root has level 0. None for whole subtree
+        :param max_count: maximal count of the Data. None for whole subtree
+        :return: list of Data, empty if root was not published in that version
+        """
+        state = self._store._state(id_, self._version)
+        if state is None:
+            return []
+        result = [self._to_data(id_, state, self._is_enabled(state))]
+        level = [id_]
+        depth = 0
+        while level and (max_depth is None or depth < max_depth):
+            next_level = []
+            for parent_id in level:
+                for child_id in self.get_children_ids(parent_id):
+                    if max_count is not None and len(result) >= max_count:
+                        return result[:max_count]
+                    state = self._store._state(child_id, self._version)
+                    # children inherit state of the subtree root
+                    result.append(self._to_data(child_id, state, True))
+                    next_level.append(child_id)
+            level = next_level
+            depth += 1
+        return result[:max_count] if max_count is not None else result
+
+    def get_changes_since(self, version: int) -> List[Data]:
+        """
+        Collects Data changed by commits after selected version, up to version of the snapshot.
+        Semantics is the same as DataNodeController.get_changes_since:
+        disabled Data is returned with all children.
+        :param version: last version known by requester
+        :return: list of changed Data
+        """
+        store = self._store
+        if version < store._log_start:
+            # these commits are not in the log, changed Data is found by it version
+            ids_list = [[id_ for id_ in list(store._states)
+                         if (store._state(id_, self._version) or (0, 0))[_VERSION] > version]]
+        else:
+            count = bisect_right(store._log_versions, self._version)
+            ids_list = store._log_ids[bisect_right(store._log_versions, version):count]
+        seen = set()
+        result = []
+        for ids in ids_list:
+            for id_ in ids:
+                if id_ in seen:
+                    continue
+                state = store._state(id_, self._version)
+                if self._is_enabled(state):
+                    seen.add(id_)
+                    result.append(self._to_data(id_, state, True))
+                    continue
+
+                stack = [id_]
+                while stack:
+                    current = stack.pop()
+                    if current in seen:
+                        continue
+                    seen.add(current)
+                    result.append(self._to_data(current, store._state(current, self._version), False))
+                    stack.extend(reversed(self.get_children_ids(current)))
+        return result
+
+    def _is_enabled(self, state: tuple) -> bool:
+        """
+        Checks if Data is enabled with it ancestors in version of the snapshot.
+        :param state: state of the Data
+        :return: False if Data or any linked ancestor disabled
+        """
+        while state is not None:
+            if not state[_ENABLED]:
+                return False
+            if not state[_LINKED]:
+                return True
+            state = self._store._state(state[_PARENT_ID], self._version)
+        return True
+
+    def _to_data(self, id_: int, state: tuple, enabled: bool) -> Data:
+        """
+        Creates Data of the state.
+        :param id_: id of the Data
+        :param state: state of the Data
+        :param enabled: enabled flag with inherited state
+        :return: Data
+        """
+        return Data(value=state[_VALUE], parent_id=state[_PARENT_ID], id_=id_,
+                    enabled=enabled and state[_ENABLED], version=state[_VERSION])
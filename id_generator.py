@@ -0,0 +1,136 @@
+#!/bin/python
+# -*- coding: utf-8 -*-
+
+import itertools
+import threading
+import time
+import uuid
+
+
+class IdGeneratorException(Exception):
+    """
+    Common exception for id generators
+    """
+    def __init__(self, *args, **kwargs):
+        Exception.__init__(self, *args, **kwargs)
+
+
+class IdGenerator(object):
+    """
+    Base class for Data id generators.
+    Generator must return unique int for each call of next_id.
+    """
+    def next_id(self) -> int:
+        """
+        Generates new id.
+        :return: unique id as int
+        """
+        raise NotImplementedError
+
+
+class UuidIdGenerator(IdGenerator):
+    """
+    Generator of 128-bit random ids, compatible with ids of the old Data.
+    """
+    def next_id(self) -> int:
+        return uuid.uuid4().int
+
+
+class SequenceIdGenerator(IdGenerator):
+    """
+    Generator of monotonic 64-bit ids.
+    Ids are unique only inside that generator, so it must be single for all trees.
+    """
+    def __init__(self, start=1):
+        """
+        SequenceIdGenerator constructor.
+        :param start: first generated id
+        """
+        self._counter = itertools.count(start)
+        self._lock = threading.Lock()
+
+    def next_id(self) -> int:
+        # counter is replaced by reserve, so id must not be taken from the replaced one
+        with self._lock:
+            return next(self._counter)
+
+    def reserve(self, count: int) -> int:
+        """
+        Reserves range of the ids, which will not be returned by generator.
+        :param count: count of reserved ids
+        :return: first id of the reserved range
+        """
+        with self._lock:
+            start = next(self._counter)
+            self._counter = itertools.count(start + count)
+        return start
+
+
+class SnowflakeIdGenerator(IdGenerator):
+    """
+    Generator of 64-bit ids unique between several generators.
+    Id consists of milliseconds since epoch (41 bits), node number (10 bits)
+    and sequence number inside millisecond (12 bits),
+    so each cache must have own node number.
+    """
+    EPOCH = 1577836800000  # 2020-01-01 in milliseconds
+    NODE_BITS = 10
+    SEQUENCE_BITS = 12
+
+    def __init__(self, node: int):
+        """
+        SnowflakeIdGenerator constructor.
+        :exception IdGeneratorException: raised when node doesn't fit in NODE_BITS.
+        :param node: number of the generator node
+        """
+        if not 0 <= node < (1 << self.NODE_BITS):
+            raise IdGeneratorException("node {} is out of range".format(node))
+        self._node = node << self.SEQUENCE_BITS
+        self._last_time = -1
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def next_id(self) -> int:
+        with self._lock:
+            now = int(time.time() * 1000) - self.EPOCH
+            if now < self._last_time:
+                # clock moved back, ids are kept monotonic with last used time
+                now = self._last_time
+            if now == self._last_time:
+                self._sequence = (self._sequence + 1) & ((1 << self.SEQUENCE_BITS) - 1)
+                if self._sequence == 0:
+                    # sequence exhausted in that millisecond, waiting for the next one
+                    while now <= self._last_time:
+                        now = int(time.time() * 1000) - self.EPOCH
+            else:
+                self._sequence = 0
+            self._last_time = now
+            return (now << (self.NODE_BITS + self.SEQUENCE_BITS)) | self._node | self._sequence
+
+
+class RangeIdGenerator(IdGenerator):
+    """
+    Generator taking ids from ranges reserved in other generator,
+    e.g. cache takes ids reserved in database SequenceIdGenerator.
+    """
+    def __init__(self, reserve, batch_size=1024):
+        """
+        RangeIdGenerator constructor.
+        :param reserve: callable receiving ids count and returning first id of the reserved range
+        :param batch_size: count of ids reserved at once
+        """
+        self._reserve = reserve
+        self._batch_size = batch_size
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def next_id(self) -> int:
+        # generator is shared by sessions of the process, which can work in different threads
+        with self._lock:
+            if self._next == self._end:
+                self._next = self._reserve(self._batch_size)
+                self._end = self._next + self._batch_size
+            id_ = self._next
+            self._next += 1
+            return id_
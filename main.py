@@ -9,23 +9,42 @@ from PyQt5.QtGui import *
 
 from data_node import DataNode
 from data import Data
-from data_serializer import DataEncoder
-from data_serializer import DataDecoder
+from data_serializer import DataBinaryEncoder
+from data_serializer import DataBinaryDecoder
 from data_controller import DataNodeController
+from data_cache import DataCacheController
+from data_node_model import DataNodeModel
+from data_log import DataCommitLog
 
 
 class MainWindow(QMainWindow):
-    def __init__(self, *args, **kwargs):
+    # budget of the subtree checked out to the cache: deepest level (None for any) and count of the nodes
+    CHECKOUT_MAX_DEPTH = None
+    CHECKOUT_MAX_COUNT = 1000
+    # maximal count of the nodes in the cache, the least recently used subtrees are evicted
+    CACHE_CAPACITY = 10000
+
+    def __init__(self, *args, commit_log: DataCommitLog = None, **kwargs):
+        """
+        MainWindow constructor.
+        :param commit_log: write-ahead log of the database commits.
+                           When set, database is recovered from it on start.
+        """
         super(MainWindow, self).__init__(*args, **kwargs)
 
         self.tree_db = None
         self.tree_cache = None
         self.data_db = []
         self.data_cache = []
-
-        self._data_controller = DataNodeController()
-        self._data_decoder = DataDecoder()
-        self._data_encoder = DataEncoder()
+        # database version which cache was synchronized with
+        self._cache_version = 0
+
+        self._db_controller = DataNodeController()
+        self._cache_controller = DataCacheController(self.CACHE_CAPACITY)
+        self._cache_controller.set_loader(self.load_cache_children)
+        self._data_decoder = DataBinaryDecoder()
+        self._data_encoder = DataBinaryEncoder()
+        self._commit_log = commit_log
         self.init_ui()
 
     def init_ui(self) -> None:
@@ -72,13 +91,16 @@ class MainWindow(QMainWindow):
         layout_db_actions.addWidget(button_reset)
 
         # configure elements
-        self.data_db = [self.create_data_sample()]
+        if self._commit_log is not None and self._commit_log.has_data():
+            self.data_db = self._commit_log.recover(self._db_controller)
+        else:
+            self.reset_db()
         self.tree_db.header().hide()
         self.sync_tree_db()
 
         self.data_cache = []
         self.tree_cache.header().hide()
-        self.tree_cache.setModel(QStandardItemModel())
+        self.sync_tree_cache()
 
         # slot-sognal connecting
         button_to_cache.clicked.connect(self.add_item_to_cache)
@@ -91,67 +113,100 @@ class MainWindow(QMainWindow):
         widget_central.setMinimumHeight(700)
         self.show()
 
-    def sync_tree_with_data(self, tree: QTreeView, data: List[DataNode]) -> None:
+    def sync_tree_with_data(self, tree: QTreeView, data: List[DataNode], controller: DataNodeController) -> None:
         """
-        Executes synchronization between DataNode and StandardItemModel.
-        Updates tree view.
+        Executes synchronization between DataNode and tree view.
+        Model wraps nodes without copying, so only root rows are expanded,
+        other rows are fetched when user expands them.
+        Further changes made through controller are applied to the model by rows,
+        so full synchronization required only when nodes list replaced.
         :param tree: TreeView for updating
         :param data: list of DataNodes for update
+        :param controller: controller of the nodes
         :return:
         """
-        tree.setModel(self.create_model_from_nodes(data))
-        tree.expandAll()
+        old_model = tree.model()
+        if isinstance(old_model, DataNodeModel):
+            old_model.detach()
+        tree.setModel(DataNodeModel(data, controller, tree))
+        tree.expandToDepth(0)
 
     def sync_tree_db(self) -> None:
         """
         Shortcut for sync Database Tree
         :return: None
         """
-        self.sync_tree_with_data(self.tree_db, self.data_db)
+        self.sync_tree_with_data(self.tree_db, self.data_db, self._db_controller)
 
     def sync_tree_cache(self) -> None:
         """
         Shortcut for sync Cache Tree
         :return: None
         """
-        self.sync_tree_with_data(self.tree_cache, self.data_cache)
+        self.sync_tree_with_data(self.tree_cache, self.data_cache, self._cache_controller)
 
-    def get_selected_item(self, tree: QTreeView) -> QStandardItem:
+    def get_selected_node(self, tree: QTreeView) -> DataNode:
         """
         Shortcut for receiving current selected element in tree
         :param tree: QTreeView for requesting selected element
-        :return: QStandardItem reference, None if no selection available
+        :return: DataNode reference, None if no selection available
         """
-        index = tree.currentIndex()
-        return tree.model().itemFromIndex(index)
+        return tree.model().node_from_index(tree.currentIndex())
 
     def add_item_to_cache(self) -> None:
         """
-        Appends selected element it database tree to cache tree.
-        Converts selected database item data to json and sends it to the cache
+        Appends selected element of database tree with it subtree to cache tree.
+        Subtree is limited with checkout budget and sent to the cache as single encoded batch
         :return: None
         """
-        item = self.get_selected_item(self.tree_db)
-        if item is None:
+        data_node = self.get_selected_node(self.tree_db)
+        if data_node is None:
             return
 
-        data_node = item.data()
-        json_cache = self._data_encoder.encode(data_node.get_instance())
-        self.send_data_to_cache(json_cache)
+        if not data_node.is_enabled():
+            data_node.materialize_enabled()
+        data_list = list(self._db_controller.iter_subtree_data(data_node, self.CHECKOUT_MAX_DEPTH,
+                                                                self.CHECKOUT_MAX_COUNT))
+        self.send_data_to_cache(self.encode_for_cache(data_list))
 
-    def send_data_to_cache(self, json_data: str) -> None:
+    def load_cache_children(self, parent_ids: List[int]) -> None:
         """
-        Decodes data from json into Data,
-        then appends it to the cache.
-        If cache already has that element, nothing will be appended.
-        :param json_data: received json format data
+        Loader of the cache controller, sends children of the database nodes
+        to the cache as single encoded batch.
+        :param parent_ids: ids of the parent nodes
         :return: None
         """
-        data = self._data_decoder.decode(json_data)
-        if not self._data_controller.node_list_has_data(self.data_cache, data):
-            self.data_cache.append(DataNode(instance=data))
-            self._data_controller.update_node_hierarchy(self.data_cache, remove_from_list=True)
-            self.sync_tree_cache()
+        data_list = []
+        for parent_id in parent_ids:
+            parent = self._db_controller.get_node(parent_id)
+            if parent is None:
+                continue
+            if not parent.is_enabled():
+                parent.materialize_enabled()
+            data_list.extend(child.get_instance() for child in parent.get_children())
+        self.send_data_to_cache(self.encode_for_cache(data_list))
+
+    def encode_for_cache(self, data_list: List[Data]) -> bytes:
+        """
+        Encodes database Data with count of the children of each Data,
+        so cache loads not sent children on first access.
+        :param data_list: list of database Data
+        :return: encoded list with counts
+        """
+        counts = [len(self._db_controller.get_node(data.get_id()).get_children()) for data in data_list]
+        return self._data_encoder.encode_with_counts(data_list, counts)
+
+    def send_data_to_cache(self, encoded_data: bytes) -> None:
+        """
+        Decodes data into Data list with children counts,
+        then appends it to the cache in one pass.
+        Elements which cache already has are not appended.
+        :param encoded_data: received encoded data
+        :return: None
+        """
+        data_list, counts = self._data_decoder.decode_with_counts(encoded_data)
+        self._cache_controller.set_children_counts(data_list, counts)
+        self._cache_controller.append_data_list(self.data_cache, data_list)
 
     def delete_item(self) -> None:
         """
@@ -159,12 +214,11 @@ class MainWindow(QMainWindow):
         If no item was selected, nothing will happens.
         :return: None
         """
-        item = self.get_selected_item(self.tree_cache)
-        if item is None:
+        node = self.get_selected_node(self.tree_cache)
+        if node is None:
             return
 
-        item.data().set_enabled(False)
-        self.sync_tree_cache()
+        self._cache_controller.disable_node(node)
 
     def edit_item(self) -> None:
         """
@@ -172,14 +226,13 @@ class MainWindow(QMainWindow):
         IF no item was selected, nothing will happens
         :return: None
         """
-        item = self.get_selected_item(self.tree_cache)
-        if item is None:
+        node = self.get_selected_node(self.tree_cache)
+        if node is None:
             return
 
-        text, ok = QInputDialog.getText(self, "Edit data", "Data:", text=item.data().get_value())
+        text, ok = QInputDialog.getText(self, "Edit data", "Data:", text=node.get_value())
         if ok:
-            item.setText(text)
-            item.data().set_value(text)
+            self._cache_controller.set_node_value(node, text)
 
     def add_item(self) -> None:
         """
@@ -187,79 +240,60 @@ class MainWindow(QMainWindow):
         IF no item was selected, nothing will happens
         :return: None
         """
-        item = self.get_selected_item(self.tree_cache)
-        if item is None:
+        node = self.get_selected_node(self.tree_cache)
+        if node is None:
             return
 
         text, ok = QInputDialog.getText(self, "Appending new data", "Data:")
         if ok:
-            parent_id = item.data().get_id()
+            parent_id = node.get_id()
             data = Data(text, parent_id)
             data_node = DataNode(instance=data)
             self.data_cache.append(data_node)
-            self._data_controller.update_node_hierarchy(self.data_cache, remove_from_list=True)
-            self.sync_tree_cache()
+            self._cache_controller.update_node_hierarchy(self.data_cache, remove_from_list=True)
 
     def apply_cache_changes(self) -> None:
         """
-        Converts cache data then sends it to the database.
+        Converts changed cache data then sends it to the database.
         :return: None
         """
-        json_data_cache = self._data_controller.node_list_to_json(self._data_encoder, self.data_cache)
-        self.send_cache_changes(json_data_cache)
+        changes = self._cache_controller.collect_changes(self.data_cache)
+        if not changes:
+            return
 
-    def send_cache_changes(self, json_data: str) -> None:
+        self.send_cache_changes(self._data_encoder.encode(changes))
+        self._cache_controller.clear_changes(changes)
+
+    def send_cache_changes(self, encoded_data: bytes) -> None:
         """
-        Converts received json data to Data list,
+        Converts received encoded data to Data list,
         then updates Database with that list. Tree updated.
+        Update is written to the commit log before it is applied.
         Also cache sync provided.
-        :param json_data: update for database in json format
+        :param encoded_data: encoded update for database
         :return: None
         """
-        data_list = self._data_decoder.decode(json_data)
-        self._data_controller.update_node_list_with_data_list(self.data_db, data_list)
-        self.sync_tree_db()
+        data_list = self._data_decoder.decode(encoded_data)
+        if self._commit_log is not None:
+            self._commit_log.commit(data_list)
+        self._db_controller.commit_data_list(self.data_db, data_list)
 
-        # There are possible updates which touch any cache data, so updating cache data
-        json_data_db = self._data_controller.node_list_to_json(self._data_encoder, self.data_db)
-        self.update_cache(json_data_db)
+        # There are possible updates which touch any cache data, so sending changes since last cache sync
+        changes = self._db_controller.get_changes_since(self._cache_version)
+        self.update_cache(self._data_encoder.encode(changes), self._db_controller.get_version())
 
-    def update_cache(self, json_data: str) -> None:
+    def update_cache(self, encoded_data: bytes, version: int) -> None:
         """
-        Updates cache data with json from Database data.
-        :param json_data: jsonned Data from Database
+        Updates cache data with encoded Database data.
+        :param encoded_data: encoded changed Data from Database
+        :param version: database version of the changes
         :return: None
         """
-        data_list = self._data_decoder.decode(json_data)
-        self._data_controller.update_node_list_with_data_list(nodes_list=self.data_cache,
-                                                              data_list=data_list,
-                                                              append_new=False)
-        self.sync_tree_cache()
-
-    def create_model_from_nodes(self, nodes: List[DataNode]) -> QStandardItemModel:
-        """
-        Shortcut for create model with data from DataNode
-        :param nodes: data source
-        :return: result QStandardItemModel
-        """
-        model = QStandardItemModel()
-        for node in nodes:
-            model.appendRow(self.node_to_item(node))
-        return model
-
-    def node_to_item(self, node: DataNode) -> QStandardItem:
-        """
-        Create QStandardItem based on DataNode.
-        :param node: data source node
-        :return: QStandardItem with node data
-        """
-        item = QStandardItem(node.get_value())
-        item.setData(node)
-        item.setEnabled(node.is_enabled())
-        item.setEditable(False)
-        for child in node.get_children():
-            item.appendRow(self.node_to_item(child))
-        return item
+        data_list = self._data_decoder.decode(encoded_data)
+        self._cache_controller.update_node_list_with_data_list(nodes_list=self.data_cache,
+                                                               data_list=data_list,
+                                                               append_new=False)
+        self._cache_version = version
 
     def reset(self) -> None:
         """
@@ -267,10 +301,24 @@ class MainWindow(QMainWindow):
         :return: None
         """
         self.data_cache = []
-        self.data_db = [self.create_data_sample()]
+        self._cache_version = 0
+        self._cache_controller.rebuild_index(self.data_cache)
+        self.reset_db()
         self.sync_tree_db()
         self.sync_tree_cache()
 
+    def reset_db(self) -> None:
+        """
+        Replaces database with start sample.
+        New database is written as snapshot of the commit log.
+        :return: None
+        """
+        self.data_db = [self.create_data_sample()]
+        self._db_controller.rebuild_index(self.data_db)
+        if self._commit_log is not None:
+            self._commit_log.write_snapshot(self._db_controller.iter_data(self.data_db),
+                                            self._db_controller.get_version())
+
     def create_data_sample(self) -> DataNode:
         """
         Create start sample structure
@@ -320,5 +368,7 @@ class MainWindow(QMainWindow):
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     app.setApplicationName("Cached Database")
-    window = MainWindow()
+    # optional argument: path to the database commit log
+    commit_log = DataCommitLog(sys.argv[1]) if len(sys.argv) > 1 else None
+    window = MainWindow(commit_log=commit_log)
     sys.exit(app.exec_())
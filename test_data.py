@@ -1,7 +1,32 @@
 import unittest
 from data_node import DataNode
 from data_node import DataNodeException, DataNodeInstanceException
+from data_node import PRE_ORDER, POST_ORDER, BREADTH_FIRST
+from data import Data
+from data_controller import DataNodeController
+from data_controller import NODE_VALUE_CHANGED, NODE_ENABLED_CHANGED, NODE_INSERTED
+from data_controller import NODE_ABOUT_TO_BE_REMOVED, NODE_REMOVED
+from data_serializer import DataBinaryEncoder, DataBinaryDecoder
+from data_storage import DataStorage, DataStorageException
 from copy import deepcopy
+from io import BytesIO
+import os
+import tempfile
+import threading
+import time
+import asyncio
+from data_log import DataCommitLog
+from data_snapshot import DataSnapshot, DataSnapshotException
+from data_session import DataSessionManager, DataStorageSessionManager, DataCacheSession
+from data_versions import DataVersionStore
+from data_cache import DataCacheController
+from data_intervals import DataIntervalIndex
+from benchmark import generate_tree, generate_changes, run_benchmarks, compare_results
+from benchmark import SHAPES, DEEP, WIDE
+from data_service import DataService, DataServiceClient, DataServiceConnection, DataServiceException
+from id_generator import UuidIdGenerator, SequenceIdGenerator, SnowflakeIdGenerator, RangeIdGenerator
+from id_generator import IdGeneratorException
+import data
 
 
 class TestDataNodeInit(unittest.TestCase):
@@ -181,5 +206,1715 @@ class TestDataNodeChildAppending(unittest.TestCase):
             pass
 
 
+class TestDataNodeControllerIndex(unittest.TestCase):
+    """
+    Test cases for controller nodes index
+    """
+    def test_create_hierarchy_indexed(self):
+        controller = DataNodeController()
+        root = Data("Root")
+        child = Data("Child", root.get_id())
+        grandchild = Data("Grandchild", child.get_id())
+        nodes = controller.create_node_hierarchy([grandchild, child, root])
+
+        self.assertEqual(len(nodes), 3,
+                         "TestIndex: test create hierarchy: "
+                         "all nodes must be returned")
+        for data in (root, child, grandchild):
+            self.assertTrue(controller.get_node(data.get_id()) == data,
+                            "TestIndex: test create hierarchy: "
+                            "node must be found by id")
+        self.assertTrue(controller.get_node(grandchild.get_id()).get_parent_node() == child,
+                        "TestIndex: test create hierarchy: "
+                        "parent must be linked")
+
+    def test_has_with_index(self):
+        controller = DataNodeController()
+        root = DataNode("Root")
+        child = DataNode("Child", parent=root)
+        other = DataNode("Other")
+        controller.rebuild_index([root, other])
+
+        self.assertTrue(root.has(child, controller.get_index()),
+                        "TestIndex: test has: "
+                        "root must contain child")
+        self.assertFalse(child.has(root, controller.get_index()),
+                         "TestIndex: test has: "
+                         "child must not contain root")
+        self.assertFalse(root.has(other, controller.get_index()),
+                         "TestIndex: test has: "
+                         "root must not contain other tree")
+
+    def test_list_has_data(self):
+        controller = DataNodeController()
+        nodes = []
+        root = Data("Root")
+        child = Data("Child", root.get_id())
+        self.assertFalse(controller.node_list_has_data(nodes, child),
+                         "TestIndex: test list has data: "
+                         "empty list must not contain data")
+
+        nodes.append(DataNode(instance=child))
+        nodes.append(DataNode(instance=root))
+        controller.update_node_hierarchy(nodes, remove_from_list=True)
+        self.assertTrue(controller.node_list_has_data(nodes, child),
+                        "TestIndex: test list has data: "
+                        "appended data must be found")
+        self.assertEqual(nodes, [root],
+                         "TestIndex: test list has data: "
+                         "adopted child must be removed from list")
+
+    def test_update_by_id(self):
+        controller = DataNodeController()
+        root = DataNode("Root")
+        child = DataNode("Child", parent=root)
+        grandchild = DataNode("Grandchild", parent=child)
+        nodes = [root]
+        controller.rebuild_index(nodes)
+
+        update = Data("Updated", child.get_parent_id(), child.get_id(), enabled=False)
+        controller.update_node_list_with_data_list(nodes, [update])
+
+        self.assertEqual(child.get_value(), "Updated",
+                         "TestIndex: test update by id: "
+                         "value must be updated")
+        self.assertFalse(grandchild.is_enabled(),
+                         "TestIndex: test update by id: "
+                         "disable must be applied to children")
+        self.assertEqual(nodes, [root],
+                         "TestIndex: test update by id: "
+                         "no new nodes must be appended")
+
+
+class TestDataNodeControllerHierarchy(unittest.TestCase):
+    """
+    Test cases for building hierarchy from flat Data list
+    """
+    def test_disabled_parent(self):
+        controller = DataNodeController()
+        root = Data("Root")
+        node = Data("Node", root.get_id(), enabled=False)
+        child = Data("Child", node.get_id())
+        grandchild = Data("Grandchild", child.get_id())
+        nodes = controller.create_node_hierarchy([grandchild, root, child, node])
+
+        self.assertEqual(len(nodes), 4,
+                         "TestHierarchy: test disabled parent: "
+                         "nodes must not be removed from list")
+        self.assertTrue(root.is_enabled(),
+                        "TestHierarchy: test disabled parent: "
+                        "root must stay enabled")
+        self.assertFalse(child.is_enabled(),
+                         "TestHierarchy: test disabled parent: "
+                         "child of disabled node must be disabled")
+        self.assertFalse(grandchild.is_enabled(),
+                         "TestHierarchy: test disabled parent: "
+                         "grandchild of disabled node must be disabled")
+
+    def test_remove_from_list(self):
+        controller = DataNodeController()
+        root = Data("Root")
+        data_list = [root]
+        for i in range(500):
+            data_list.append(Data("Node{}".format(i), data_list[-1].get_id()))
+        nodes = [DataNode(instance=data) for data in reversed(data_list)]
+        controller.update_node_hierarchy(nodes, remove_from_list=True)
+
+        self.assertEqual(nodes, [root],
+                         "TestHierarchy: test remove from list: "
+                         "only root must stay in list")
+        self.assertEqual(len(controller.node_to_data_list(nodes[0])), len(data_list),
+                         "TestHierarchy: test remove from list: "
+                         "all nodes must be linked")
+
+
+class TestDataNodeControllerUpdate(unittest.TestCase):
+    """
+    Test cases for applying Data list to nodes
+    """
+    def test_append_new(self):
+        controller = DataNodeController()
+        root = DataNode("Root")
+        nodes = [root]
+        controller.rebuild_index(nodes)
+
+        new_child = Data("New", root.get_id())
+        new_grandchild = Data("NewChild", new_child.get_id())
+        new_root = Data("NewRoot")
+        update = Data("Updated", None, root.get_id())
+        controller.update_node_list_with_data_list(nodes, iter([new_grandchild, update, new_child, new_root]))
+
+        self.assertEqual(root.get_value(), "Updated",
+                         "TestUpdate: test append new: "
+                         "existed node must be updated")
+        self.assertEqual(nodes, [root, new_root],
+                         "TestUpdate: test append new: "
+                         "only new root must be appended to list")
+        self.assertTrue(root.has(new_grandchild, controller.get_index()),
+                        "TestUpdate: test append new: "
+                        "new nodes must be linked to the tree")
+
+    def test_without_append(self):
+        controller = DataNodeController()
+        root = DataNode("Root")
+        nodes = [root]
+        controller.rebuild_index(nodes)
+
+        controller.update_node_list_with_data_list(nodes, [Data("New", root.get_id())], append_new=False)
+        self.assertEqual(len(root.get_children()), 0,
+                         "TestUpdate: test without append: "
+                         "new data must be skipped")
+        self.assertEqual(nodes, [root],
+                         "TestUpdate: test without append: "
+                         "list must not be changed")
+
+
+class TestDataNodeControllerChanges(unittest.TestCase):
+    """
+    Test cases for collecting changes of the nodes
+    """
+    def test_collect_changes(self):
+        controller = DataNodeController()
+        root = DataNode(instance=Data("Root", id_=1))
+        child = DataNode(instance=Data("Child", 1, 2))
+        other = DataNode(instance=Data("Other", 1, 3))
+        nodes = [root, child, other]
+        controller.update_node_hierarchy(nodes, remove_from_list=True)
+        self.assertEqual(controller.collect_changes(nodes), [],
+                         "TestChanges: test collect changes: "
+                         "received data must not be changed")
+
+        child.set_value("Updated")
+        other.set_value("Other")
+        new_node = DataNode("New", parent=root)
+        changes = controller.collect_changes(nodes)
+        self.assertEqual(changes, [child, new_node],
+                         "TestChanges: test collect changes: "
+                         "only changed and new data must be collected")
+
+        controller.clear_changes(changes)
+        self.assertFalse(child.is_changed() or new_node.is_changed(),
+                         "TestChanges: test collect changes: "
+                         "changes must be dropped")
+
+    def test_update_drops_changes(self):
+        controller = DataNodeController()
+        root = DataNode(instance=Data("Root", id_=1))
+        nodes = [root]
+        controller.rebuild_index(nodes)
+
+        root.set_enabled(False)
+        controller.update_node_list_with_data_list(nodes, [Data("Root", None, 1, enabled=False)])
+        self.assertFalse(root.is_changed(),
+                         "TestChanges: test update drops changes: "
+                         "synchronized node must not be changed")
+
+
+class TestDataNodeControllerVersions(unittest.TestCase):
+    """
+    Test cases for committing changes with versions
+    """
+    def test_changes_since(self):
+        controller = DataNodeController()
+        root = DataNode("Root")
+        child = DataNode("Child", parent=root)
+        grandchild = DataNode("Grandchild", parent=child)
+        other = DataNode("Other", parent=root)
+        nodes = [root]
+        controller.rebuild_index(nodes)
+
+        version1 = controller.commit_data_list(nodes, [Data("Updated", root.get_id(), other.get_id())])
+        new_data = Data("New", root.get_id())
+        version2 = controller.commit_data_list(nodes, [Data("Child", root.get_id(), child.get_id(), enabled=False),
+                                                       new_data])
+
+        self.assertEqual((version1, version2), (1, 2),
+                         "TestVersions: test changes since: "
+                         "versions must be incremented")
+        self.assertEqual(controller.get_changes_since(0), [other, child, grandchild, new_data],
+                         "TestVersions: test changes since: "
+                         "all committed changes must be returned")
+        self.assertEqual(controller.get_changes_since(version1), [child, grandchild, new_data],
+                         "TestVersions: test changes since: "
+                         "only changes of the last commit must be returned")
+        self.assertEqual(controller.get_changes_since(version2), [],
+                         "TestVersions: test changes since: "
+                         "no changes must be returned for last version")
+        self.assertEqual((child.get_version(), grandchild.get_version()), (version2, 0),
+                         "TestVersions: test changes since: "
+                         "only disabled node must get commit version")
+
+
+class TestDataNodeSlots(unittest.TestCase):
+    """
+    Test cases for compact storage of the nodes
+    """
+    def test_without_dict(self):
+        node = DataNode("TestNode")
+        self.assertFalse(hasattr(node, "__dict__") or hasattr(node.get_instance(), "__dict__"),
+                         "TestSlots: test without dict: "
+                         "node and data must not have instance dict")
+
+    def test_copy(self):
+        node = DataNode("TestNode")
+        child = DataNode("ChildNode", parent=node)
+        node_copy = deepcopy(node)
+        self.assertTrue(node_copy.get_children()[0] == child,
+                        "TestSlots: test copy: "
+                        "children must be copied")
+        self.assertTrue(node_copy.get_children()[0].get_parent_node() is node_copy,
+                        "TestSlots: test copy: "
+                        "parent reference must point to the copy")
+
+
+class TestDataNodeWalk(unittest.TestCase):
+    """
+    Test cases for iterative traversal of the nodes tree
+    """
+    def setUp(self):
+        self.root = DataNode("Root")
+        self.node1 = DataNode("Node1", parent=self.root)
+        self.child1 = DataNode("Child1", parent=self.node1)
+        self.node2 = DataNode("Node2", parent=self.root)
+
+    def values(self, nodes):
+        return [node.get_value() for node in nodes]
+
+    def test_orders(self):
+        self.assertEqual(self.values(self.root.walk(PRE_ORDER)), ["Root", "Node1", "Child1", "Node2"],
+                         "TestWalk: test orders: "
+                         "incorrect pre-order")
+        self.assertEqual(self.values(self.root.walk(POST_ORDER)), ["Child1", "Node1", "Node2", "Root"],
+                         "TestWalk: test orders: "
+                         "incorrect post-order")
+        self.assertEqual(self.values(self.root.walk(BREADTH_FIRST)), ["Root", "Node1", "Node2", "Child1"],
+                         "TestWalk: test orders: "
+                         "incorrect breadth-first order")
+
+    def test_depth_and_filter(self):
+        self.assertEqual(self.values(self.root.walk(max_depth=1)), ["Root", "Node1", "Node2"],
+                         "TestWalk: test depth and filter: "
+                         "nodes deeper than limit must be skipped")
+        self.assertEqual(self.values(self.root.walk(filter_=lambda n: n is not self.node1)), ["Root", "Node2"],
+                         "TestWalk: test depth and filter: "
+                         "filtered node must be skipped with children")
+
+    def test_deep_tree(self):
+        controller = DataNodeController()
+        nodes = [DataNode("Node0")]
+        for i in range(2000):
+            nodes.append(DataNode("Node{}".format(i + 1), parent=nodes[-1]))
+        controller.rebuild_index(nodes[:1])
+
+        nodes[0].set_enabled(False)
+        self.assertFalse(nodes[-1].is_enabled(),
+                         "TestWalk: test deep tree: "
+                         "deepest node must be disabled")
+        self.assertTrue(nodes[0].has(nodes[-1]),
+                        "TestWalk: test deep tree: "
+                        "deepest node must be found")
+        self.assertEqual(len(controller.node_to_data_list(nodes[0])), len(nodes),
+                         "TestWalk: test deep tree: "
+                         "all data must be extracted")
+        self.assertTrue(repr(nodes[0]).startswith("{"),
+                        "TestWalk: test deep tree: "
+                        "representation must be built")
+
+
+class TestDataNodeLazyDisable(unittest.TestCase):
+    """
+    Test cases for disabling subtree by marking only it root
+    """
+    def test_inherited(self):
+        root = DataNode("Root")
+        child = DataNode("Child", parent=root)
+        grandchild = DataNode("Grandchild", parent=child)
+        grandchild.get_instance().clear_changes()
+
+        child.set_enabled(False, lazy=True)
+        self.assertFalse(grandchild.is_enabled(),
+                         "TestLazyDisable: test inherited: "
+                         "grandchild must inherit disabled state")
+        self.assertTrue(grandchild.get_instance().is_enabled() and root.is_enabled(),
+                        "TestLazyDisable: test inherited: "
+                        "only subtree root must be marked")
+        self.assertFalse(grandchild.is_changed(),
+                         "TestLazyDisable: test inherited: "
+                         "grandchild must not be changed")
+
+    def test_materialize(self):
+        root = DataNode("Root")
+        child = DataNode("Child", parent=root)
+        grandchild = DataNode("Grandchild", parent=child)
+        other = DataNode("Other", parent=root)
+
+        root.set_enabled(False, lazy=True)
+        child.materialize_enabled()
+        self.assertFalse(child.get_instance().is_enabled() or grandchild.get_instance().is_enabled(),
+                         "TestLazyDisable: test materialize: "
+                         "inherited state must be written to the subtree")
+        self.assertTrue(other.get_instance().is_enabled(),
+                        "TestLazyDisable: test materialize: "
+                        "node outside subtree must not be marked")
+
+    def test_cached_state(self):
+        root = DataNode("Root")
+        child = DataNode("Child", parent=root)
+        grandchild = DataNode("Grandchild", parent=child)
+        other = DataNode("Other")
+        self.assertTrue(grandchild.is_enabled(),
+                        "TestLazyDisable: test cached state: "
+                        "enabled state must be calculated")
+
+        root.set_enabled(False, lazy=True)
+        self.assertFalse(grandchild.is_enabled(),
+                         "TestLazyDisable: test cached state: "
+                         "cached state must be dropped when ancestor disabled")
+        other.append_child(child)
+        self.assertTrue(grandchild.is_enabled(),
+                        "TestLazyDisable: test cached state: "
+                        "cached state must be dropped when parent changed")
+        other.set_enabled(False, lazy=True)
+        other.set_enabled(True, lazy=True)
+        self.assertTrue(grandchild.is_enabled() and child.is_enabled(),
+                        "TestLazyDisable: test cached state: "
+                        "cached state must be dropped when ancestor enabled")
+
+
+class TestDataBinarySerializer(unittest.TestCase):
+    """
+    Test cases for binary Data format
+    """
+    def assertDataEqual(self, data, decoded):
+        self.assertEqual((decoded.get_id(), decoded.get_parent_id(), decoded.get_value(),
+                          decoded.is_enabled(), decoded.get_version()),
+                         (data.get_id(), data.get_parent_id(), data.get_value(),
+                          data.is_enabled(), data.get_version()),
+                         "TestBinary: decoded data differs from encoded")
+
+    def test_single(self):
+        data = Data("Значение", 42, enabled=False, version=7)
+        decoded = DataBinaryDecoder().decode(DataBinaryEncoder().encode(data))
+        self.assertDataEqual(data, decoded)
+
+    def test_list(self):
+        data_list = [Data("Root"), Data(None, 1), Data("", 2)]
+        decoded = DataBinaryDecoder().decode(DataBinaryEncoder().encode(data_list))
+        self.assertEqual(len(decoded), len(data_list),
+                         "TestBinary: test list: "
+                         "all records must be decoded")
+        for data, decoded_data in zip(data_list, decoded):
+            self.assertDataEqual(data, decoded_data)
+
+    def test_wide_ids(self):
+        generator = UuidIdGenerator()
+        data_list = [Data("Root", id_=generator.next_id()), Data("Child", 1, generator.next_id())]
+        decoded = DataBinaryDecoder().decode(DataBinaryEncoder().encode(data_list))
+        for data, decoded_data in zip(data_list, decoded):
+            self.assertDataEqual(data, decoded_data)
+
+    def test_mixed_values(self):
+        generator = UuidIdGenerator()
+        data_list = [Data("Root", id_=1), Data("Узел", 1, 2), Data(None, 1, 3), Data("Wide", 2, generator.next_id())]
+        for encoded_list in (data_list[:3], data_list):
+            decoded = DataBinaryDecoder().decode(DataBinaryEncoder().encode(encoded_list))
+            self.assertEqual(len(decoded), len(encoded_list),
+                             "TestBinary: test mixed values: "
+                             "all records must be decoded")
+            for data, decoded_data in zip(encoded_list, decoded):
+                self.assertDataEqual(data, decoded_data)
+
+    def test_empty_list(self):
+        self.assertEqual(DataBinaryDecoder().decode(DataBinaryEncoder().encode([])), [],
+                         "TestBinary: test empty list: "
+                         "empty list must be decoded")
+
+
+class TestDataBinaryStream(unittest.TestCase):
+    """
+    Test cases for chunked binary Data stream
+    """
+    def test_chunks(self):
+        data_list = [Data("Node{}".format(i)) for i in range(10)]
+        chunks = list(DataBinaryEncoder().iter_encode(data_list, chunk_size=4))
+        self.assertEqual(len(chunks), 3,
+                         "TestStream: test chunks: "
+                         "records must be split by chunk size")
+        decoded = list(DataBinaryDecoder().iter_decode(BytesIO(b"".join(chunks))))
+        self.assertEqual(decoded, data_list,
+                         "TestStream: test chunks: "
+                         "all records must be decoded")
+
+    def test_controller_sync(self):
+        db_controller = DataNodeController()
+        root = DataNode("Root")
+        child = DataNode("Child", parent=root)
+        db_controller.rebuild_index([root])
+
+        stream = BytesIO()
+        db_controller.node_list_to_stream(DataBinaryEncoder(), [root], stream)
+        stream.seek(0)
+
+        controller = DataNodeController()
+        nodes = []
+        controller.commit_data_list(nodes, DataBinaryDecoder().iter_decode(stream))
+        self.assertEqual(nodes, [root],
+                         "TestStream: test controller sync: "
+                         "tree must be rebuilt from the stream")
+        self.assertEqual(controller.get_changes_since(0), [root, child],
+                         "TestStream: test controller sync: "
+                         "streamed data must be committed")
+
+    def test_truncated(self):
+        stream = BytesIO()
+        DataBinaryEncoder().encode_to([Data("Node")], stream)
+        binary = stream.getvalue()
+        with self.assertRaises(ValueError):
+            list(DataBinaryDecoder().iter_decode(BytesIO(binary[:-1])))
+
+
+class TestIdGenerator(unittest.TestCase):
+    """
+    Test cases for Data id generators
+    """
+    def test_sequence_reserve(self):
+        generator = SequenceIdGenerator()
+        range_generator = RangeIdGenerator(generator.reserve, batch_size=2)
+        ids = [generator.next_id(), range_generator.next_id(), range_generator.next_id(),
+               range_generator.next_id(), generator.next_id()]
+        self.assertEqual(ids, [1, 2, 3, 4, 6],
+                         "TestIdGenerator: test sequence reserve: "
+                         "reserved ranges must not be reused")
+
+    def test_sequence_concurrent_reserve(self):
+        generator = SequenceIdGenerator()
+        ids = []
+        reserved = []
+
+        def take():
+            ids.extend(generator.next_id() for _ in range(20000))
+
+        def reserve():
+            for _ in range(2000):
+                start = generator.reserve(10)
+                reserved.extend(range(start, start + 10))
+
+        threads = [threading.Thread(target=take), threading.Thread(target=reserve)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(ids) | set(reserved)), len(ids) + len(reserved),
+                         "TestIdGenerator: test sequence concurrent reserve: "
+                         "ids must not be taken from reserved ranges")
+
+    def test_snowflake(self):
+        generator1 = SnowflakeIdGenerator(1)
+        generator2 = SnowflakeIdGenerator(2)
+        ids = [generator1.next_id() for _ in range(10000)] + [generator2.next_id() for _ in range(10000)]
+        self.assertEqual(len(set(ids)), len(ids),
+                         "TestIdGenerator: test snowflake: "
+                         "ids must be unique")
+        self.assertTrue(all(0 < id_ < (1 << 63) for id_ in ids),
+                        "TestIdGenerator: test snowflake: "
+                        "ids must fit signed 64-bit integer")
+        with self.assertRaises(IdGeneratorException):
+            SnowflakeIdGenerator(1 << SnowflakeIdGenerator.NODE_BITS)
+
+    def test_data_generator(self):
+        previous = data.get_id_generator()
+        data.set_id_generator(SequenceIdGenerator(100))
+        try:
+            self.assertEqual(Data("Node").get_id(), 100,
+                             "TestIdGenerator: test data generator: "
+                             "id must be taken from set generator")
+        finally:
+            data.set_id_generator(previous)
+
+
+class TestDataNodeControllerNotifications(unittest.TestCase):
+    """
+    Test cases for notifications about nodes changes
+    """
+    def setUp(self):
+        self.controller = DataNodeController()
+        self.root = DataNode("Root")
+        self.nodes = [self.root]
+        self.controller.rebuild_index(self.nodes)
+        self.events = []
+        self.listener = lambda kind, node: self.events.append((kind, node.get_value()))
+        self.controller.add_listener(self.listener)
+
+    def test_node_changes(self):
+        self.controller.set_node_value(self.root, "Updated")
+        self.controller.disable_node(self.root)
+        self.assertEqual(self.events, [(NODE_VALUE_CHANGED, "Updated"), (NODE_ENABLED_CHANGED, "Updated")],
+                         "TestNotifications: test node changes: "
+                         "value and enabled changes must be notified")
+
+    def test_inserted(self):
+        child = Data("Child", self.root.get_id())
+        orphan = Data("Orphan", child.get_id())
+        self.nodes.append(DataNode(instance=orphan))
+        self.controller.update_node_hierarchy(self.nodes, remove_from_list=True)
+        self.nodes.append(DataNode(instance=child))
+        self.controller.update_node_hierarchy(self.nodes, remove_from_list=True)
+
+        self.assertEqual(self.events, [(NODE_INSERTED, "Orphan"), (NODE_INSERTED, "Orphan"),
+                                       (NODE_INSERTED, "Child")],
+                         "TestNotifications: test inserted: "
+                         "new root and adopted nodes must be notified")
+        self.assertEqual(self.nodes, [self.root],
+                         "TestNotifications: test inserted: "
+                         "adopted nodes must be removed from list")
+
+    def test_update_only_changed(self):
+        self.controller.update_node_list_with_data_list(self.nodes, [Data("Root", None, self.root.get_id())])
+        self.assertEqual(self.events, [],
+                         "TestNotifications: test update only changed: "
+                         "not changed node must not be notified")
+
+        self.controller.remove_listener(self.listener)
+        self.controller.set_node_value(self.root, "Updated")
+        self.assertEqual(self.events, [],
+                         "TestNotifications: test update only changed: "
+                         "removed listener must not be notified")
+
+
+class TestDataStorage(unittest.TestCase):
+    """
+    Test cases for sqlite database tier
+    """
+    def setUp(self):
+        self.storage = DataStorage()
+        self.root = Data("Root")
+        self.child = Data("Child", self.root.get_id())
+        self.grandchild = Data("Grandchild", self.child.get_id())
+
+    def tearDown(self):
+        self.storage.close()
+
+    def values(self, data_list):
+        return [data.get_value() for data in data_list]
+
+    def test_subtree(self):
+        self.storage.commit_data_list([self.grandchild, self.child, self.root])
+        self.assertEqual(self.values(self.storage.get_subtree(self.root.get_id())),
+                         ["Root", "Child", "Grandchild"],
+                         "TestStorage: test subtree: "
+                         "subtree must be ordered by depth")
+        self.assertEqual(self.values(self.storage.get_subtree(self.root.get_id(), max_depth=1)),
+                         ["Root", "Child"],
+                         "TestStorage: test subtree: "
+                         "depth limit must be applied")
+        self.assertTrue(self.storage.is_ancestor(self.root.get_id(), self.grandchild.get_id()),
+                        "TestStorage: test subtree: "
+                        "root must be ancestor of grandchild")
+
+    def test_link_orphan(self):
+        self.storage.commit_data_list([self.root, self.grandchild])
+        self.assertEqual(self.values(self.storage.get_roots()), ["Root", "Grandchild"],
+                         "TestStorage: test link orphan: "
+                         "orphan must be root")
+
+        self.storage.commit_data_list([self.child])
+        self.assertEqual(self.values(self.storage.get_roots()), ["Root"],
+                         "TestStorage: test link orphan: "
+                         "orphan must be linked with received parent")
+        self.assertTrue(self.storage.is_ancestor(self.root.get_id(), self.grandchild.get_id()),
+                        "TestStorage: test link orphan: "
+                        "orphan must be linked with all ancestors")
+
+    def test_update(self):
+        version1 = self.storage.commit_data_list([self.root, self.child, self.grandchild])
+        update = Data("Updated", self.root.get_id(), self.child.get_id(), enabled=False)
+        version2 = self.storage.commit_data_list([update])
+        new_data = Data("New", self.grandchild.get_id())
+        self.storage.commit_data_list([new_data])
+
+        self.assertEqual(self.storage.get_data(self.child.get_id()).get_value(), "Updated",
+                         "TestStorage: test update: "
+                         "value must be updated")
+        self.assertFalse(self.storage.get_data(self.grandchild.get_id()).is_enabled(),
+                         "TestStorage: test update: "
+                         "disable must be applied to subtree")
+        self.assertFalse(self.storage.get_data(new_data.get_id()).is_enabled(),
+                         "TestStorage: test update: "
+                         "data appended to disabled parent must be disabled")
+        self.assertEqual(self.values(self.storage.get_changes_since(version1)), ["Updated", "Grandchild", "New"],
+                         "TestStorage: test update: "
+                         "changed data must be returned")
+        self.assertEqual(self.storage.get_changes_since(version2 + 1), [],
+                         "TestStorage: test update: "
+                         "no changes after last version")
+
+    def test_without_append(self):
+        self.storage.commit_data_list([self.root])
+        self.storage.commit_data_list([self.child], append_new=False)
+        self.assertIsNone(self.storage.get_data(self.child.get_id()),
+                          "TestStorage: test without append: "
+                          "new data must be skipped")
+
+    def test_wide_id(self):
+        with self.assertRaises(DataStorageException):
+            self.storage.commit_data_list([self.root, Data("Wide", id_=UuidIdGenerator().next_id() | (1 << 127))])
+        self.assertIsNone(self.storage.get_data(self.root.get_id()),
+                          "TestStorage: test wide id: "
+                          "transaction must be rolled back")
+
+    def test_session_manager(self):
+        directory = tempfile.TemporaryDirectory()
+        path = os.path.join(directory.name, "data.db")
+        storage = DataStorage(path)
+        storage.commit_data_list([self.root, self.child, self.grandchild])
+        manager = DataStorageSessionManager(storage)
+        previous = data.get_id_generator()
+        try:
+            session1 = manager.open_session()
+            session2 = DataCacheSession(manager, DataCacheController())
+            self.assertEqual(session1.checkout_subtree(self.root.get_id()), 3,
+                             "TestStorage: test session manager: "
+                             "stored subtree must be checked out")
+            session2.checkout_subtree(self.root.get_id(), max_depth=0)
+            cache_root = session2.get_controller().get_node(self.root.get_id())
+            self.assertEqual(session2.get_controller().get_children_count(cache_root), 1,
+                             "TestStorage: test session manager: "
+                             "count of the stored children must be checked out")
+            session2.get_controller().load_children([cache_root])
+            self.assertEqual(self.values(child.get_instance() for child in cache_root.get_children()), ["Child"],
+                             "TestStorage: test session manager: "
+                             "stored children must be loaded")
+
+            node = session1.get_controller().get_node(self.child.get_id())
+            session1.get_controller().set_node_value(node, "First")
+            new_node = DataNode(instance=Data("New", self.grandchild.get_id()))
+            session1.get_nodes().append(new_node)
+            session1.get_controller().update_node_hierarchy(session1.get_nodes(), remove_from_list=True)
+            self.assertEqual(session1.commit(), [],
+                             "TestStorage: test session manager: "
+                             "first commit must be accepted")
+            self.assertTrue(new_node.get_id() > self.grandchild.get_id(),
+                            "TestStorage: test session manager: "
+                            "new data must take id reserved after stored ids")
+
+            node = session2.get_controller().get_node(self.child.get_id())
+            session2.get_controller().set_node_value(node, "Second")
+            self.assertEqual(self.values(session2.commit()), ["Second"],
+                             "TestStorage: test session manager: "
+                             "stale data must conflict")
+            self.assertEqual(session2.get_controller().get_node(self.child.get_id()).get_value(), "First",
+                             "TestStorage: test session manager: "
+                             "cache must be refreshed from storage")
+        finally:
+            data.set_id_generator(previous)
+            storage.close()
+
+        storage = DataStorage(path)
+        try:
+            self.assertEqual(self.values(storage.get_subtree(self.root.get_id())),
+                             ["Root", "First", "Grandchild", "New"],
+                             "TestStorage: test session manager: "
+                             "commits must be stored in the file")
+        finally:
+            storage.close()
+            directory.cleanup()
+
+
+
+class TestDataCommitLog(unittest.TestCase):
+    """
+    Test cases for write-ahead log of the commits
+    """
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "db.log")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_recover(self):
+        controller = DataNodeController()
+        root = DataNode("Root")
+        child = DataNode("Child", parent=root)
+        log = DataCommitLog(self.path)
+        log.write_snapshot(controller.iter_data([root]), controller.get_version())
+        log.commit([Data("Updated", root.get_id(), child.get_id())])
+        log.commit([Data("New", child.get_id())])
+        log.close()
+
+        log = DataCommitLog(self.path)
+        nodes = log.recover(DataNodeController())
+        log.close()
+        self.assertEqual(nodes, [root],
+                         "TestCommitLog: test recover: "
+                         "tree must be restored from snapshot")
+        self.assertEqual([node.get_value() for node in nodes[0].walk()], ["Root", "Updated", "New"],
+                         "TestCommitLog: test recover: "
+                         "logged commits must be replayed")
+
+    def test_recover_versions(self):
+        controller = DataNodeController()
+        root = DataNode("Root")
+        child = DataNode("Child", parent=root)
+        other = DataNode("Other", parent=root)
+        controller.rebuild_index([root])
+        log = DataCommitLog(self.path)
+        for i in range(3):
+            update = [Data("Updated{}".format(i), root.get_id(), child.get_id())]
+            log.commit(update)
+            controller.commit_data_list([root], update)
+        log.write_snapshot(controller.iter_data([root]), controller.get_version())
+        log.close()
+
+        controller = DataNodeController()
+        log = DataCommitLog(self.path)
+        nodes = log.recover(controller)
+        log.close()
+        self.assertEqual((controller.get_version(), controller.get_node(child.get_id()).get_version()), (3, 3),
+                         "TestCommitLog: test recover versions: "
+                         "commit version must be restored from snapshot")
+        self.assertEqual(controller.get_changes_since(1), [child],
+                         "TestCommitLog: test recover versions: "
+                         "changes before snapshot must be found by versions")
+        self.assertEqual(controller.commit_data_list(nodes, [Data("Other", root.get_id(), other.get_id())]), 4,
+                         "TestCommitLog: test recover versions: "
+                         "versions must continue after recovery")
+        stale = Data("Stale", root.get_id(), other.get_id(), version=3)
+        self.assertEqual(controller.check_versions([stale])[1], [stale],
+                         "TestCommitLog: test recover versions: "
+                         "copy taken before recovered commit must conflict")
+        self.assertEqual(DataVersionStore(nodes, controller).open_snapshot().get_changes_since(3), [other],
+                         "TestCommitLog: test recover versions: "
+                         "version store must find changes made before it log")
+
+    def test_torn_record(self):
+        log = DataCommitLog(self.path)
+        log.commit([Data("First")])
+        log.commit([Data("Second")])
+        log.close()
+        with open(self.path, "r+b") as file:
+            file.truncate(os.path.getsize(self.path) - 1)
+
+        log = DataCommitLog(self.path)
+        self.assertEqual(log.get_sequence(), 1,
+                         "TestCommitLog: test torn record: "
+                         "torn record must be dropped")
+        self.assertEqual(log.commit([Data("Third")]), 2,
+                         "TestCommitLog: test torn record: "
+                         "sequence must continue after last valid record")
+        self.assertEqual([data_list[0].get_value() for _, data_list in log.records()], ["First", "Third"],
+                         "TestCommitLog: test torn record: "
+                         "new record must replace torn one")
+        log.close()
+
+    def test_group_commit(self):
+        log = DataCommitLog(self.path)
+        threads = [threading.Thread(target=lambda: [log.commit([Data("Node")]) for _ in range(20)])
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([sequence for sequence, _ in log.records()], list(range(1, 81)),
+                         "TestCommitLog: test group commit: "
+                         "all concurrent commits must be logged in sequence")
+        log.close()
+
+
+class TestDataSnapshot(unittest.TestCase):
+    """
+    Test cases for memory-mapped snapshot of the trees
+    """
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "db.snapshot")
+        self.root = DataNode("Root")
+        self.child1 = DataNode("Child1", parent=self.root)
+        self.child2 = DataNode("Child2", parent=self.root)
+        self.grandchild = DataNode(None, parent=self.child2)
+        self.orphan = Data("Orphan", 42, enabled=False, version=3)
+        data_list = DataNodeController().node_to_data_list(self.root) + [self.orphan]
+        DataSnapshot.write(self.path, data_list, sequence=5)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_records(self):
+        snapshot = DataSnapshot(self.path)
+        self.assertEqual((len(snapshot), snapshot.get_sequence()), (5, 5),
+                         "TestSnapshot: test records: "
+                         "header must be written")
+        index = snapshot.find(self.grandchild.get_id())
+        data = snapshot.get_data(index)
+        self.assertEqual((data.get_value(), data.get_parent_id()), (None, self.child2.get_id()),
+                         "TestSnapshot: test records: "
+                         "record must be read by id")
+        self.assertEqual(snapshot.get_data(snapshot.get_parent_index(index)), self.child2.get_instance(),
+                         "TestSnapshot: test records: "
+                         "parent index must point to parent record")
+        orphan = snapshot.get_data(snapshot.find(self.orphan.get_id()))
+        self.assertEqual((orphan.get_parent_id(), orphan.is_enabled(), orphan.get_version()), (42, False, 3),
+                         "TestSnapshot: test records: "
+                         "orphan must keep parent id and state")
+        self.assertIsNone(snapshot.find(1),
+                          "TestSnapshot: test records: "
+                          "unknown id must not be found")
+        snapshot.close()
+
+    def test_lazy_nodes(self):
+        controller = DataNodeController()
+        snapshot = DataSnapshot(self.path, controller)
+        node = snapshot.get_node(self.child1.get_id())
+        self.assertEqual(node.get_parent_node(), self.root,
+                         "TestSnapshot: test lazy nodes: "
+                         "node must be built with ancestors")
+        self.assertEqual(sorted(controller.get_index()), sorted([self.root.get_id(), self.child1.get_id(),
+                                                                 self.child2.get_id(), self.orphan.get_id()]),
+                         "TestSnapshot: test lazy nodes: "
+                         "only path and siblings must be built")
+        self.assertFalse(snapshot.is_loaded(self.child2),
+                         "TestSnapshot: test lazy nodes: "
+                         "children of sibling must not be built")
+        self.assertEqual(snapshot.load_children(controller.get_node(self.child2.get_id())), [self.grandchild],
+                         "TestSnapshot: test lazy nodes: "
+                         "children must be built on request")
+        snapshot.close()
+
+    def test_load(self):
+        controller = DataNodeController()
+        snapshot = DataSnapshot(self.path, controller)
+        nodes = snapshot.load()
+        snapshot.close()
+        self.assertEqual(nodes, [self.root, self.orphan],
+                         "TestSnapshot: test load: "
+                         "roots must be restored")
+        self.assertEqual([node.get_value() for node in nodes[0].walk()], ["Root", "Child1", "Child2", None],
+                         "TestSnapshot: test load: "
+                         "children order must be kept")
+        self.assertEqual(len(controller.get_index()), 5,
+                         "TestSnapshot: test load: "
+                         "all nodes must be indexed")
+
+    def test_not_snapshot(self):
+        with open(self.path, "wb") as file:
+            file.write(b"not a snapshot file, just some text")
+        with self.assertRaises(DataSnapshotException):
+            DataSnapshot(self.path)
+
+
+class TestDataSessions(unittest.TestCase):
+    """
+    Test cases for concurrent cache sessions with optimistic commit validation
+    """
+    def setUp(self):
+        self.root = DataNode("Root")
+        self.children = [DataNode("Child{}".format(i), parent=self.root) for i in range(24)]
+        self.controller = DataNodeController()
+        self.controller.rebuild_index([self.root])
+        self.manager = DataSessionManager([self.root], self.controller)
+
+    def test_check_versions(self):
+        self.controller.commit_data_list([self.root], [Data("Updated", self.root.get_id(), self.children[0].get_id())])
+        stale = Data("Stale", self.root.get_id(), self.children[0].get_id(), version=0)
+        actual = Data("Actual", self.root.get_id(), self.children[0].get_id(), version=1)
+        new_data = Data("New", self.root.get_id())
+        accepted, conflicts = self.controller.check_versions([stale, actual, new_data])
+        self.assertEqual((accepted, conflicts), ([actual, new_data], [stale]),
+                         "TestSessions: test check versions: "
+                         "only data changed after it version must conflict")
+
+    def test_conflict(self):
+        session1 = self.manager.open_session()
+        session2 = self.manager.open_session()
+        for session in (session1, session2):
+            session.checkout(self.root.get_id())
+            session.checkout(self.children[0].get_id())
+            session.checkout(self.children[1].get_id())
+
+        node = session1.get_controller().get_node(self.children[0].get_id())
+        session1.get_controller().set_node_value(node, "First")
+        self.assertEqual(session1.commit(), [],
+                         "TestSessions: test conflict: "
+                         "first commit must be accepted")
+
+        node = session2.get_controller().get_node(self.children[0].get_id())
+        session2.get_controller().set_node_value(node, "Second")
+        other = session2.get_controller().get_node(self.children[1].get_id())
+        session2.get_controller().set_node_value(other, "Other")
+        conflicts = session2.commit()
+        self.assertEqual([data.get_value() for data in conflicts], ["Second"],
+                         "TestSessions: test conflict: "
+                         "concurrent change must be reported")
+        self.assertEqual((self.children[0].get_value(), self.children[1].get_value()), ("First", "Other"),
+                         "TestSessions: test conflict: "
+                         "only not conflicting change must be applied")
+        self.assertEqual(node.get_value(), "First",
+                         "TestSessions: test conflict: "
+                         "conflicting node must be synchronized with database")
+
+        session1.get_controller().set_node_value(session1.get_controller().get_node(self.children[0].get_id()),
+                                                 "Again")
+        self.assertEqual(session1.commit(), [],
+                         "TestSessions: test conflict: "
+                         "committed node must not conflict with own commit")
+
+    def test_rejected_delete(self):
+        session1 = self.manager.open_session()
+        session2 = self.manager.open_session()
+        for session in (session1, session2):
+            session.checkout_subtree(self.root.get_id())
+
+        node = session1.get_controller().get_node(self.children[0].get_id())
+        session1.get_controller().set_node_value(node, "First")
+        session1.commit()
+
+        node = session2.get_controller().get_node(self.children[0].get_id())
+        session2.get_controller().disable_node(node)
+        conflicts = session2.commit()
+        self.assertEqual([data.get_id() for data in conflicts], [self.children[0].get_id()],
+                         "TestSessions: test rejected delete: "
+                         "delete of the changed node must be reported")
+        self.assertTrue(self.children[0].is_enabled(),
+                        "TestSessions: test rejected delete: "
+                        "database node must stay enabled")
+        self.assertEqual((node.get_value(), node.is_enabled(), node.get_instance().is_changed()),
+                         ("First", True, False),
+                         "TestSessions: test rejected delete: "
+                         "cache node must be synchronized with database state")
+
+    def test_concurrent_sessions(self):
+        def edit(child):
+            session = self.manager.open_session()
+            session.checkout(child.get_id())
+            for i in range(10):
+                node = session.get_controller().get_node(child.get_id())
+                session.get_controller().set_node_value(node, "Edit{}".format(i))
+                conflicts.extend(session.commit())
+
+        conflicts = []
+        threads = [threading.Thread(target=edit, args=(child,)) for child in self.children]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(conflicts, [],
+                         "TestSessions: test concurrent sessions: "
+                         "changes of different nodes must not conflict")
+        self.assertEqual((self.manager.get_version(), {child.get_value() for child in self.children}),
+                         (240, {"Edit9"}),
+                         "TestSessions: test concurrent sessions: "
+                         "all commits must be applied")
+
+    def test_logged_sessions(self):
+        directory = tempfile.TemporaryDirectory()
+        commit_log = DataCommitLog(os.path.join(directory.name, "db.log"))
+        manager = DataSessionManager([self.root], self.controller, commit_log)
+        fsync = os.fsync
+        syncs = []
+
+        def slow_fsync(descriptor):
+            syncs.append(descriptor)
+            time.sleep(0.002)
+            fsync(descriptor)
+
+        def edit(child):
+            for i in range(10):
+                manager.commit(encoder.encode([Data("Edit{}".format(i), self.root.get_id(), child.get_id(),
+                                                    version=manager.get_version())]))
+
+        encoder = DataBinaryEncoder()
+        threads = [threading.Thread(target=edit, args=(child,)) for child in self.children[:8]]
+        os.fsync = slow_fsync
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            os.fsync = fsync
+            commit_log.close()
+            directory.cleanup()
+        self.assertEqual(manager.get_version(), 80,
+                         "TestSessions: test logged sessions: "
+                         "all commits must be applied")
+        self.assertTrue(len(syncs) < 80,
+                        "TestSessions: test logged sessions: "
+                        "concurrent commits must share fsync of the log")
+
+
+class TestDataVersionStore(unittest.TestCase):
+    """
+    Test cases for multi-version snapshot reads of the database tree
+    """
+    def setUp(self):
+        self.root = DataNode("Root")
+        self.child = DataNode("Child", parent=self.root)
+        self.grandchild = DataNode("Grandchild", parent=self.child)
+        self.nodes = [self.root]
+        self.controller = DataNodeController()
+        self.controller.rebuild_index(self.nodes)
+        self.store = DataVersionStore(self.nodes, self.controller)
+
+    def commit(self, data_list):
+        version = self.controller.commit_data_list(self.nodes, data_list)
+        self.store.publish(version, data_list)
+        return version
+
+    def test_isolation(self):
+        snapshot = self.store.open_snapshot()
+        new_data = Data("New", self.child.get_id())
+        self.commit([Data("Updated", self.root.get_id(), self.child.get_id()), new_data])
+        self.assertEqual(snapshot.get_data(self.child.get_id()).get_value(), "Child",
+                         "TestVersions: test isolation: "
+                         "snapshot must not see later commit")
+        self.assertIsNone(snapshot.get_data(new_data.get_id()),
+                          "TestVersions: test isolation: "
+                          "data created later must not be visible")
+        snapshot.release()
+
+        with self.store.open_snapshot() as snapshot:
+            self.assertEqual(snapshot.get_data(self.child.get_id()).get_value(), "Updated",
+                             "TestVersions: test isolation: "
+                             "new snapshot must see commit")
+            self.assertEqual(snapshot.get_children_ids(self.child.get_id()),
+                             [self.grandchild.get_id(), new_data.get_id()],
+                             "TestVersions: test isolation: "
+                             "appended data must be linked")
+
+    def test_changes_since(self):
+        self.commit([Data("Updated", None, self.root.get_id())])
+        self.commit([Data("Child", self.root.get_id(), self.child.get_id(), enabled=False)])
+        with self.store.open_snapshot() as snapshot:
+            changes = snapshot.get_changes_since(1)
+        self.assertEqual(changes, [self.child, self.grandchild],
+                         "TestVersions: test changes since: "
+                         "disabled data must be returned with children")
+        self.assertFalse(any(data.is_enabled() for data in changes),
+                         "TestVersions: test changes since: "
+                         "inherited disabled state must be written")
+        self.assertTrue(self.grandchild.get_instance().is_enabled(),
+                        "TestVersions: test changes since: "
+                        "database data must not be changed by reader")
+
+    def test_reclaim(self):
+        snapshot = self.store.open_snapshot()
+        for i in range(5):
+            self.commit([Data("Value{}".format(i), self.root.get_id(), self.child.get_id())])
+        self.assertEqual(len(self.store._states[self.child.get_id()]), 6,
+                         "TestVersions: test reclaim: "
+                         "states visible to snapshot must be kept")
+        snapshot.release()
+        self.commit([Data("Last", self.root.get_id(), self.child.get_id())])
+        self.assertEqual(len(self.store._states[self.child.get_id()]), 1,
+                         "TestVersions: test reclaim: "
+                         "not visible states must be dropped")
+
+    def test_concurrent_readers(self):
+        children = [DataNode("Node", parent=self.root) for _ in range(50)]
+        self.controller.rebuild_index(self.nodes)
+        self.store = DataVersionStore(self.nodes, self.controller)
+        torn = []
+
+        def read():
+            for _ in range(200):
+                with self.store.open_snapshot() as snapshot:
+                    values = {snapshot.get_data(child.get_id()).get_value() for child in children}
+                if len(values) != 1:
+                    torn.append(values)
+
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        for i in range(100):
+            self.commit([Data("Value{}".format(i), self.root.get_id(), child.get_id()) for child in children])
+        for reader in readers:
+            reader.join()
+        self.assertEqual(torn, [],
+                         "TestVersions: test concurrent readers: "
+                         "snapshot must not see partial commit")
+
+
+class TestDataService(unittest.TestCase):
+    """
+    Test cases for database service over unix domain socket
+    """
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "db.sock")
+        self.root = DataNode("Root")
+        self.children = [DataNode("Child{}".format(i), parent=self.root) for i in range(20)]
+        self.controller = DataNodeController()
+        self.controller.rebuild_index([self.root])
+        self.manager = DataSessionManager([self.root], self.controller)
+        self.encoder = DataBinaryEncoder()
+        self.decoder = DataBinaryDecoder()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_pipelined_commits(self):
+        async def run():
+            service = DataService(self.manager)
+            await service.start(self.path)
+            client = DataServiceClient()
+            await client.connect(self.path)
+            checked_out = await asyncio.gather(*[client.checkout(child.get_id()) for child in self.children])
+            changes = []
+            for encoded_data in checked_out:
+                data = self.decoder.decode_with_counts(encoded_data)[0][0]
+                data.set_value("Updated")
+                changes.append(self.encoder.encode([data]))
+            results = await asyncio.gather(*[client.commit(encoded_data) for encoded_data in changes])
+            stale = await client.commit(changes[0])
+            missing = await client.checkout(1)
+            subtree = await client.checkout_subtree(self.root.get_id(), max_count=5)
+            encoded_data, version = await client.get_changes_since(0)
+            await client.close()
+            await service.close()
+            return results, stale, missing, subtree, encoded_data, version
+
+        results, stale, missing, subtree, encoded_data, version = asyncio.run(run())
+        self.assertTrue(all(self.decoder.decode(conflicts) == [] for _, conflicts in results),
+                        "TestService: test pipelined commits: "
+                        "commits of different nodes must be accepted")
+        self.assertLess(self.controller.get_version(), len(self.children),
+                        "TestService: test pipelined commits: "
+                        "concurrent commits must be applied by batches")
+        self.assertEqual(self.decoder.decode(stale[1]), [self.children[0]],
+                         "TestService: test pipelined commits: "
+                         "stale commit must conflict")
+        self.assertIsNone(missing,
+                          "TestService: test pipelined commits: "
+                          "unknown node must not be checked out")
+        self.assertEqual(self.decoder.decode_with_counts(subtree)[0], [self.root] + self.children[:4],
+                         "TestService: test pipelined commits: "
+                         "subtree must be checked out with budget")
+        self.assertEqual((len(self.decoder.decode(encoded_data)), version),
+                         (len(self.children), self.controller.get_version()),
+                         "TestService: test pipelined commits: "
+                         "changes must be received")
+
+    def test_batch_conflict(self):
+        data = self.children[0].get_instance()
+        first = self.encoder.encode([Data("First", data.get_parent_id(), data.get_id())])
+        second = self.encoder.encode([Data("Second", data.get_parent_id(), data.get_id())])
+        results = self.manager.commit_batch([first, second])
+        self.assertEqual(results[0][0], results[1][0],
+                         "TestService: test batch conflict: "
+                         "batch must be applied as single commit")
+        self.assertEqual([self.decoder.decode(conflicts) for _, conflicts in results], [[], [data]],
+                         "TestService: test batch conflict: "
+                         "same data in one batch must conflict")
+        self.assertEqual(self.children[0].get_value(), "First",
+                         "TestService: test batch conflict: "
+                         "first change must be applied")
+
+    def test_session_connection(self):
+        loop = asyncio.new_event_loop()
+        service = DataService(self.manager)
+        loop.run_until_complete(service.start(self.path))
+        thread = threading.Thread(target=loop.run_forever)
+        thread.start()
+        try:
+            connection = DataServiceConnection(self.path)
+            session = DataCacheSession(connection)
+            session.checkout(self.children[0].get_id())
+            node = session.get_nodes()[0]
+            session.get_controller().set_node_value(node, "Remote")
+            self.assertEqual(session.commit(), [],
+                             "TestService: test session connection: "
+                             "remote commit must be accepted")
+            self.assertEqual((self.children[0].get_value(), session.get_version()), ("Remote", 1),
+                             "TestService: test session connection: "
+                             "database must be updated")
+            connection.close()
+            with self.assertRaises(DataServiceException):
+                asyncio.run(DataServiceClient().checkout(1))
+        finally:
+            asyncio.run_coroutine_threadsafe(service.close(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+    def test_storage_connection(self):
+        storage = DataStorage()
+        storage.commit_data_list(self.controller.iter_data([self.root]))
+        manager = DataStorageSessionManager(storage)
+        loop = asyncio.new_event_loop()
+        service = DataService(manager)
+        loop.run_until_complete(service.start(self.path))
+        thread = threading.Thread(target=loop.run_forever)
+        thread.start()
+        previous = data.get_id_generator()
+        try:
+            connection = DataServiceConnection(self.path)
+            session = DataCacheSession(connection)
+            self.assertEqual(session.checkout_subtree(self.root.get_id()), 21,
+                             "TestService: test storage connection: "
+                             "stored subtree must be checked out")
+            node = session.get_controller().get_node(self.children[0].get_id())
+            session.get_controller().set_node_value(node, "Remote")
+            self.assertEqual(session.commit(), [],
+                             "TestService: test storage connection: "
+                             "remote commit must be accepted")
+            self.assertEqual((storage.get_data(self.children[0].get_id()).get_value(), connection.get_version()),
+                             ("Remote", 2),
+                             "TestService: test storage connection: "
+                             "storage must be updated")
+            connection.close()
+        finally:
+            data.set_id_generator(previous)
+            asyncio.run_coroutine_threadsafe(service.close(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+            storage.close()
+
+
+    def test_reserved_ids(self):
+        loop = asyncio.new_event_loop()
+        service = DataService(self.manager)
+        loop.run_until_complete(service.start(self.path))
+        thread = threading.Thread(target=loop.run_forever)
+        thread.start()
+        previous = data.get_id_generator()
+        try:
+            connections = [DataServiceConnection(self.path) for _ in range(2)]
+            ids = [[connection.get_id_generator().next_id() for _ in range(3000)] for connection in connections]
+            self.assertFalse(set(ids[0]) & set(ids[1]),
+                             "TestService: test reserved ids: "
+                             "ids of different connections must not intersect")
+            self.assertTrue(min(ids[0] + ids[1]) > max(self.controller.get_index()),
+                            "TestService: test reserved ids: "
+                            "reserved ids must follow database ids")
+
+            sessions = [DataCacheSession(connection) for connection in connections]
+            for session in sessions:
+                session.checkout(self.root.get_id())
+                cache_root = session.get_nodes()[0]
+                session.get_nodes().append(DataNode(instance=Data("New", cache_root.get_id())))
+                session.get_controller().update_node_hierarchy(session.get_nodes(), remove_from_list=True)
+            self.assertEqual([session.commit() for session in sessions], [[], []],
+                             "TestService: test reserved ids: "
+                             "nodes created by different caches must not conflict")
+            for connection in reversed(connections):
+                connection.close()
+            self.assertIs(data.get_id_generator(), previous,
+                          "TestService: test reserved ids: "
+                          "generator must be restored when connection closed")
+        finally:
+            data.set_id_generator(previous)
+            asyncio.run_coroutine_threadsafe(service.close(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+
+class TestDataSubtreeCheckout(unittest.TestCase):
+    """
+    Test cases for bulk checkout of the subtrees
+    """
+    def setUp(self):
+        self.root = DataNode("Root")
+        self.child1 = DataNode("Child1", parent=self.root)
+        self.child2 = DataNode("Child2", parent=self.root)
+        self.grandchild = DataNode("Grandchild", parent=self.child1)
+        self.controller = DataNodeController()
+        self.controller.rebuild_index([self.root])
+
+    def values(self, data_list):
+        return [data.get_value() for data in data_list]
+
+    def test_budget(self):
+        self.assertEqual(self.values(self.controller.iter_subtree_data(self.root)),
+                         ["Root", "Child1", "Child2", "Grandchild"],
+                         "TestSubtree: test budget: "
+                         "parents must be placed before children")
+        self.assertEqual(self.values(self.controller.iter_subtree_data(self.root, max_depth=1)),
+                         ["Root", "Child1", "Child2"],
+                         "TestSubtree: test budget: "
+                         "depth must be limited")
+        self.assertEqual(self.values(self.controller.iter_subtree_data(self.root, max_count=2)),
+                         ["Root", "Child1"],
+                         "TestSubtree: test budget: "
+                         "count must be limited")
+
+    def test_append(self):
+        cache_controller = DataNodeController()
+        cache = []
+        cache_controller.append_data_list(cache, [deepcopy(self.root.get_instance())])
+        cache_controller.set_node_value(cache[0], "Edited")
+        data_list = [deepcopy(data) for data in self.controller.iter_subtree_data(self.root)]
+        self.assertEqual(cache_controller.append_data_list(cache, data_list), 3,
+                         "TestSubtree: test append: "
+                         "only new data must be appended")
+        self.assertEqual(self.values(cache_controller.iter_data(cache)),
+                         ["Edited", "Child1", "Grandchild", "Child2"],
+                         "TestSubtree: test append: "
+                         "subtree must be linked and cached changes kept")
+
+    def test_session(self):
+        self.child1.set_enabled(False, lazy=True)
+        manager = DataSessionManager([self.root], self.controller)
+        session = manager.open_session()
+        self.assertEqual(session.checkout_subtree(self.child1.get_id()), 2,
+                         "TestSubtree: test session: "
+                         "subtree must be appended")
+        self.assertEqual(session.checkout_subtree(self.root.get_id(), max_depth=1), 2,
+                         "TestSubtree: test session: "
+                         "root must adopt checked out subtree")
+        self.assertEqual(session.get_nodes(), [self.root],
+                         "TestSubtree: test session: "
+                         "subtrees must be joined")
+        node = session.get_controller().get_node(self.grandchild.get_id())
+        self.assertFalse(node.is_enabled(),
+                         "TestSubtree: test session: "
+                         "disabled state must be inherited")
+        self.assertEqual(session.checkout_subtree(1), 0,
+                         "TestSubtree: test session: "
+                         "unknown subtree must not be appended")
+
+
+class TestDataCacheController(unittest.TestCase):
+    """
+    Test cases for cache with limited capacity
+    """
+    def setUp(self):
+        self.controller = DataCacheController(capacity=6)
+        self.cache = []
+        self.subtrees = []
+        for i in range(3):
+            root = DataNode("Root{}".format(i))
+            DataNode("Child", parent=DataNode("Child", parent=root))
+            self.subtrees.append(root)
+
+    def checkout(self, root):
+        data_list = [deepcopy(data) for data in self.controller.iter_subtree_data(root)]
+        # received Data is synchronized with database
+        self.controller.clear_changes(data_list)
+        self.controller.append_data_list(self.cache, data_list)
+
+    def test_remove_node(self):
+        events = []
+        controller = DataNodeController()
+        controller.add_listener(lambda kind, node: events.append(kind))
+        root = self.subtrees[0]
+        controller.rebuild_index([root])
+        child = root.get_children()[0]
+        controller.remove_node([root], child)
+        self.assertEqual((root.get_children(), len(controller.get_index())), ([], 1),
+                         "TestCache: test remove node: "
+                         "subtree must be removed from tree and index")
+        self.assertEqual(events, [NODE_ABOUT_TO_BE_REMOVED, NODE_REMOVED],
+                         "TestCache: test remove node: "
+                         "removal must be notified")
+
+    def test_eviction(self):
+        self.checkout(self.subtrees[0])
+        self.checkout(self.subtrees[1])
+        # touching node touches it ancestors
+        self.controller.get_node(self.subtrees[0].get_children()[0].get_children()[0].get_id())
+        self.checkout(self.subtrees[2])
+        self.assertEqual(self.cache, [self.subtrees[0], self.subtrees[2]],
+                         "TestCache: test eviction: "
+                         "least recently used subtree must be evicted")
+        self.assertEqual((self.controller.get_size(), self.controller.get_evictions()), (6, 3),
+                         "TestCache: test eviction: "
+                         "size and evictions must be counted")
+        self.assertIsNone(self.controller.get_node(self.subtrees[1].get_id()),
+                          "TestCache: test eviction: "
+                          "evicted node must be removed from index")
+        self.assertEqual((self.controller.get_hits(), self.controller.get_misses()), (1, 10),
+                         "TestCache: test eviction: "
+                         "lookups must be counted")
+
+    def test_pinned(self):
+        self.checkout(self.subtrees[0])
+        self.checkout(self.subtrees[1])
+        deep = self.cache[0].get_children()[0].get_children()[0]
+        self.controller.set_node_value(deep, "Edited")
+        self.controller.pin(self.cache[1])
+        self.controller.get_node(self.subtrees[1].get_id())
+        self.checkout(self.subtrees[2])
+        self.assertEqual(self.cache, self.subtrees,
+                         "TestCache: test pinned: "
+                         "changed and pinned nodes must be kept with ancestors")
+        self.assertEqual((deep.get_value(), self.cache[1].get_children()), ("Edited", []),
+                         "TestCache: test pinned: "
+                         "clean children of the pinned node must be evicted")
+        self.assertEqual(self.controller.get_size(), 6,
+                         "clean nodes must be evicted instead")
+
+
+class TestDataLazyChildren(unittest.TestCase):
+    """
+    Test cases for loading of the cache children on first access
+    """
+    def setUp(self):
+        self.root = DataNode("Root")
+        self.children = [DataNode("Child{}".format(i), parent=self.root) for i in range(3)]
+        self.grandchildren = [DataNode("Grandchild", parent=child) for child in self.children for _ in range(2)]
+        self.controller = DataNodeController()
+        self.controller.rebuild_index([self.root])
+        self.manager = DataSessionManager([self.root], self.controller)
+
+    def test_counts_codec(self):
+        data_list = [self.root.get_instance(), self.children[0].get_instance()]
+        encoded = DataBinaryEncoder().encode_with_counts(data_list, [3, 2])
+        self.assertEqual(DataBinaryDecoder().decode_with_counts(encoded), (data_list, [3, 2]),
+                         "TestLazyChildren: test counts codec: "
+                         "Data and counts must be decoded")
+
+    def test_checkout_counts(self):
+        storage = DataStorage()
+        storage.commit_data_list(self.controller.iter_data([self.root]))
+        previous = data.get_id_generator()
+        try:
+            for manager in (self.manager, DataStorageSessionManager(storage)):
+                session = DataCacheSession(manager, DataCacheController())
+                session.checkout(self.root.get_id())
+                cache_root = session.get_nodes()[0]
+                self.assertEqual(session.get_controller().get_children_count(cache_root), 3,
+                                 "TestLazyChildren: test checkout counts: "
+                                 "count of the children must be sent with checked out node")
+                session.get_controller().load_children([cache_root])
+                self.assertEqual(len(cache_root.get_children()), 3,
+                                 "TestLazyChildren: test checkout counts: "
+                                 "children of checked out node must be loaded")
+        finally:
+            data.set_id_generator(previous)
+            storage.close()
+
+    def test_walk_loads_children(self):
+        session = DataCacheSession(self.manager, DataCacheController())
+        cache_controller = session.get_controller()
+        loads = []
+        checkout_children = self.manager.checkout_children
+        self.manager.checkout_children = lambda parent_ids: loads.append(parent_ids) or checkout_children(parent_ids)
+
+        session.checkout_subtree(self.root.get_id(), max_depth=0)
+        cache_root = session.get_nodes()[0]
+        self.assertEqual((len(cache_root.get_children()), cache_controller.get_children_count(cache_root)), (0, 3),
+                         "TestLazyChildren: test walk loads children: "
+                         "count of the children must be known before load")
+        self.assertFalse(cache_controller.is_loaded(cache_root),
+                         "TestLazyChildren: test walk loads children: "
+                         "root must not be loaded")
+
+        walked = list(cache_root.walk(BREADTH_FIRST, expand=lambda node: cache_controller.load_children([node])))
+        self.assertEqual(walked, list(self.root.walk(BREADTH_FIRST)),
+                         "TestLazyChildren: test walk loads children: "
+                         "traversal must descend into loaded children")
+        self.assertEqual(len(loads), 4,
+                         "TestLazyChildren: test walk loads children: "
+                         "children must be loaded once per parent")
+        self.assertEqual(loads[-1], [self.children[2].get_id()],
+                         "TestLazyChildren: test walk loads children: "
+                         "loader must receive parent ids")
+
+        list(cache_root.walk(expand=lambda node: cache_controller.load_children([node])))
+        self.assertEqual(len(loads), 4,
+                         "TestLazyChildren: test walk loads children: "
+                         "loaded children must not be requested again")
+
+    def test_batched_load(self):
+        session = DataCacheSession(self.manager, DataCacheController())
+        cache_controller = session.get_controller()
+        session.checkout_subtree(self.root.get_id(), max_depth=1)
+        cache_children = session.get_nodes()[0].get_children()
+        self.assertEqual([cache_controller.get_children_count(child) for child in cache_children], [2, 2, 2],
+                         "TestLazyChildren: test batched load: "
+                         "counts of the children must be received with subtree")
+
+        cache_controller.load_children(cache_children)
+        self.assertTrue(all(cache_controller.is_loaded(child) for child in cache_children),
+                        "TestLazyChildren: test batched load: "
+                        "children of all parents must be loaded")
+        self.assertEqual(len(cache_controller.get_index()), 10,
+                         "TestLazyChildren: test batched load: "
+                         "whole tree must be cached")
+
+    def test_created_children(self):
+        cache_controller = DataCacheController()
+        session = DataCacheSession(self.manager, cache_controller)
+        session.checkout_subtree(self.root.get_id(), max_depth=0)
+        cache_root = session.get_nodes()[0]
+        for i in range(3):
+            session.get_nodes().append(DataNode(instance=Data("Created{}".format(i), cache_root.get_id())))
+        cache_controller.update_node_hierarchy(session.get_nodes(), remove_from_list=True)
+        self.assertEqual((cache_controller.is_loaded(cache_root), cache_controller.get_children_count(cache_root)),
+                         (False, 6),
+                         "TestLazyChildren: test created children: "
+                         "children created in cache must not replace database children")
+        cache_controller.load_children([cache_root])
+        self.assertEqual(len(cache_root.get_children()), 6,
+                         "TestLazyChildren: test created children: "
+                         "database children must be loaded")
+
+    def test_evicted_children_reloaded(self):
+        cache_controller = DataCacheController()
+        session = DataCacheSession(self.manager, cache_controller)
+        session.checkout_subtree(self.root.get_id(), max_depth=1)
+        cache_root = session.get_nodes()[0]
+        cache_controller.remove_node(session.get_nodes(), cache_root.get_children()[0])
+        self.assertFalse(cache_controller.is_loaded(cache_root),
+                         "TestLazyChildren: test evicted children reloaded: "
+                         "root with removed child must not be loaded")
+        cache_controller.load_children([cache_root])
+        self.assertEqual(len(cache_root.get_children()), 3,
+                         "TestLazyChildren: test evicted children reloaded: "
+                         "removed child must be loaded again")
+
+
+class TestDataIntervalIndex(unittest.TestCase):
+    """
+    Test cases for nested-interval labeling of the nodes
+    """
+    def setUp(self):
+        self.root = DataNode("Root")
+        self.children = [DataNode("Child{}".format(i), parent=self.root) for i in range(3)]
+        self.grandchild = DataNode("Grandchild", parent=self.children[0])
+        self.controller = DataNodeController()
+        self.controller.rebuild_index([self.root])
+        self.nodes = [self.root]
+
+    def check_labels(self, intervals, message):
+        nodes = list(self.controller.get_index().values())
+        for ancestor in nodes:
+            for node in nodes:
+                expected = node is not ancestor and any(a is ancestor for a in self.ancestors(node))
+                self.assertEqual(intervals.is_ancestor(ancestor, node), expected, message)
+
+    @staticmethod
+    def ancestors(node):
+        node = node.get_parent_node()
+        while node is not None:
+            yield node
+            node = node.get_parent_node()
+
+    def test_ancestry(self):
+        intervals = DataIntervalIndex(self.nodes, self.controller)
+        self.assertTrue(self.root.has(self.grandchild, intervals=intervals),
+                        "TestIntervals: test ancestry: "
+                        "subtree must contain descendant")
+        self.assertFalse(self.children[1].has(self.grandchild, intervals=intervals),
+                         "TestIntervals: test ancestry: "
+                         "subtree must not contain node of other subtree")
+        enter, exit_ = intervals.get_range(self.children[0])
+        self.assertTrue(enter < intervals.get_range(self.grandchild)[0] < exit_,
+                        "TestIntervals: test ancestry: "
+                        "labels of the subtree must lie in range of it root")
+        self.check_labels(intervals, "TestIntervals: test ancestry: labels must match tree")
+
+    def test_inserts_relabel(self):
+        intervals = DataIntervalIndex(self.nodes, self.controller, gap=2)
+        parent = self.grandchild
+        for i in range(20):
+            data = Data("Deep{}".format(i), parent.get_id())
+            self.controller.update_node_list_with_data_list(self.nodes, [data])
+            self.controller.update_node_list_with_data_list(
+                self.nodes, [Data("Leaf", self.children[1].get_id())])
+            parent = self.controller.get_node(data.get_id())
+        self.assertGreater(intervals.get_relabels(), 0,
+                           "TestIntervals: test inserts relabel: "
+                           "exhausted gaps must cause relabeling")
+        self.check_labels(intervals, "TestIntervals: test inserts relabel: labels must match tree")
+
+    def test_adopted_subtree(self):
+        intervals = DataIntervalIndex(self.nodes, self.controller)
+        orphan = Data("Orphan", self.children[2].get_id())
+        orphan_child = Data("OrphanChild", orphan.get_id())
+        # child arrives before parent, so it is adopted by not labeled node
+        self.controller.update_node_list_with_data_list(self.nodes, [orphan_child, orphan])
+        self.assertTrue(self.root.has(orphan_child, intervals=intervals),
+                        "TestIntervals: test adopted subtree: "
+                        "subtree adopted with it parent must be labeled")
+        self.controller.remove_node(self.nodes, self.children[2])
+        self.assertIsNone(intervals.get_range(orphan),
+                          "TestIntervals: test adopted subtree: "
+                          "labels of the removed subtree must be dropped")
+        self.check_labels(intervals, "TestIntervals: test adopted subtree: labels must match tree")
+
+    def test_created_hierarchy(self):
+        controller = DataNodeController()
+        intervals = DataIntervalIndex([], controller)
+        root = Data("Root")
+        child = Data("Child", root.get_id())
+        grandchild = Data("Grandchild", child.get_id())
+        nodes = controller.create_node_hierarchy([grandchild, root, child])
+        self.assertIsNotNone(intervals.get_range(grandchild),
+                             "TestIntervals: test created hierarchy: "
+                             "created nodes must be labeled")
+        self.assertTrue(nodes[1].has(grandchild, intervals=intervals),
+                        "TestIntervals: test created hierarchy: "
+                        "labels must match created tree")
+
+        path = os.path.join(tempfile.mkdtemp(), "snapshot")
+        DataSnapshot.write(path, [root, child, grandchild])
+        controller = DataNodeController()
+        intervals = DataIntervalIndex([], controller)
+        snapshot = DataSnapshot(path, controller)
+        roots = snapshot.load()
+        snapshot.close()
+        os.remove(path)
+        self.assertTrue(roots[0].has(grandchild, intervals=intervals),
+                        "TestIntervals: test created hierarchy: "
+                        "nodes loaded from snapshot must be labeled")
+
+    def test_cycle_rejected(self):
+        DataIntervalIndex(self.nodes, self.controller)
+        self.root.get_instance().set_parent_id(self.grandchild.get_id())
+        self.controller.update_node_hierarchy(self.nodes)
+        self.assertIsNone(self.root.get_parent_node(),
+                          "TestIntervals: test cycle rejected: "
+                          "node must not be adopted by it descendant")
+
+
+class TestBenchmark(unittest.TestCase):
+    """
+    Test cases for benchmark tree generators and results comparison
+    """
+    def test_generators(self):
+        for shape in SHAPES:
+            controller = DataNodeController()
+            nodes = controller.create_node_hierarchy(generate_tree(shape, 100))
+            roots = [node for node in nodes if node.is_orphan_node()]
+            self.assertEqual((len(roots), len(list(roots[0].walk()))), (1, 100),
+                             "TestBenchmark: test generators: "
+                             "{} tree must have single root with all nodes".format(shape))
+        deep = DataNodeController().create_node_hierarchy(generate_tree(DEEP, 10))
+        self.assertEqual(len(deep[-2].get_children()), 1,
+                         "TestBenchmark: test generators: "
+                         "deep tree must be chain")
+        wide = DataNodeController().create_node_hierarchy(generate_tree(WIDE, 10))
+        self.assertEqual(len(wide[0].get_children()), 9,
+                         "TestBenchmark: test generators: "
+                         "wide tree nodes must be children of the root")
+
+    def test_changes(self):
+        data_list = generate_tree(WIDE, 100)
+        changes = generate_changes(data_list, 0.5)
+        self.assertEqual(len(changes), 55,
+                         "TestBenchmark: test changes: "
+                         "density must select part of the nodes with new nodes")
+        self.assertEqual(changes, generate_changes(data_list, 0.5),
+                         "TestBenchmark: test changes: "
+                         "change sets must be reproducible")
+
+    def test_compare(self):
+        results = run_benchmarks([WIDE], [50], [0.1], repeat=1)
+        self.assertIn("update_node_list_with_data_list/wide/50/0.1", results,
+                      "TestBenchmark: test compare: "
+                      "measure name must include density")
+        baseline = {name: seconds * 2 for name, seconds in results.items()}
+        self.assertEqual(compare_results(results, baseline), {},
+                         "TestBenchmark: test compare: "
+                         "faster results must not be regressions")
+        baseline = {name: seconds / 2 for name, seconds in results.items() if seconds > 0}
+        self.assertEqual(set(compare_results(results, baseline)), set(baseline),
+                         "TestBenchmark: test compare: "
+                         "slower results must be regressions")
+
+
 if __name__ == '__main__':
     unittest.main()